@@ -0,0 +1,106 @@
+'''
+Benchmark for the literal prefilter of text tests.
+
+Scans a synthetic configuration with a group of text tests, once with the
+literal prefilter and once with every test run against every line.  Most
+of the tests fail, so each one has to look at the whole configuration.
+
+  python benchmarks/bench_prefilter.py [interfaces] [repeat]
+'''
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from netaudit.audit import TestFile
+from netaudit.config import ConfigFile
+
+SAMPLE_DIR = os.path.join(os.path.dirname(__file__), '..', 'sample')
+
+TESTS = '''---
+TestItems:
+  Default:
+    version:
+      match: "version (12\\\\.2)"
+      expected: "12.2"
+    sshVersion3:
+      match: "ip ssh version ([0-9])"
+      expected: "3"
+    vlanInternalAllocationPolicyDescending:
+      match: "vlan internal allocation policy (descending|ascending)"
+      expected: "descending"
+    noHttpServer:
+      match: "no ip (http) server"
+      expected: "http"
+    loggingHost:
+      match: "logging host ([0-9.]+)"
+      expected: "10.0.0.1"
+    ntpServer:
+      match: "ntp server ([0-9.]+)"
+      expected: "10.0.0.2"
+    bpduGuard:
+      match: "spanning-tree portfast (bpduguard) default"
+      expected: "bpduguard"
+    passwordEncryption:
+      match: "^(service) password-encryption"
+      expected: "service"
+TestGroups:
+  Basic:
+    - version
+    - sshVersion3
+    - vlanInternalAllocationPolicyDescending
+    - noHttpServer
+    - loggingHost
+    - ntpServer
+    - bpduGuard
+    - passwordEncryption
+'''
+
+
+def build_config(interfaces):
+  '''
+  Returns configuration text with the sample header and many interfaces.
+
+  :interfaces: number of interface sections to generate
+  '''
+  with open(os.path.join(SAMPLE_DIR, 'config.txt')) as file_stream:
+    lines = [file_stream.read()]
+  for i in range(interfaces):
+    lines.append('interface GigabitEthernet%d/0/%d\n'
+                 ' description access port %d\n'
+                 ' switchport mode access\n'
+                 ' switchport access vlan %d\n'
+                 ' spanning-tree portfast\n'
+                 '!\n' % (i // 48 + 1, i % 48 + 1, i, i % 4000 + 1))
+  return ''.join(lines)
+
+
+def time_plan(tests, config, literal_prefilter, repeat):
+  '''
+  Returns best time in seconds of scanning config with the Basic plan.
+  '''
+  tests.literal_prefilter = literal_prefilter
+  scanner = tests.compile_plan('Basic').text_scanner
+  timer = timeit.Timer(lambda: scanner.scan(config.contents))
+  return min(timer.repeat(repeat, 1))
+
+
+def main(argv):
+  interfaces = int(argv[1]) if len(argv) > 1 else 20000
+  repeat = int(argv[2]) if len(argv) > 2 else 5
+  tests = TestFile()
+  tests.from_string(TESTS)
+  config = ConfigFile().from_string(build_config(interfaces))
+  lines = config.contents.count('\n') + 1
+  without = time_plan(tests, config, False, repeat)
+  with_prefilter = time_plan(tests, config, True, repeat)
+  print('lines: %d' % lines)
+  print('without prefilter: %.4fs' % without)
+  print('with prefilter:    %.4fs' % with_prefilter)
+  print('speedup:           %.1fx' % (without / with_prefilter))
+
+
+if __name__ == '__main__':
+  main(sys.argv)
@@ -0,0 +1,192 @@
+'''
+Benchmark suite for the hot paths of netaudit.
+
+Generates a configuration and a test catalog (see generators.py) and times
+loading the catalog, resolving tests by name, evaluating text and
+hierarchical tests, parsing and a full AuditTests.run.  Results can be
+written as JSON and compared with an earlier run to spot regressions.
+
+  python benchmarks/bench_suite.py --interfaces 5000 --json out.json
+  python benchmarks/bench_suite.py --baseline out.json
+'''
+
+import os
+import sys
+import json
+import shutil
+import timeit
+import argparse
+import platform
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from netaudit.audit import AuditTests, TestFile
+from netaudit.config import ConfigFile, ENGINES, DEFAULT_ENGINE
+
+from generators import generate_config, generate_catalog, BENCH_GROUP
+
+
+def measure(func, repeat, number=1, setup=None):
+  '''
+  Returns dict of timings in seconds per call of func: best and mean of
+  repeat rounds of number calls.
+
+  :func: callable to time
+  :repeat: number of rounds
+  :number: calls per round
+  :setup: optional callable run before each round, not timed
+  '''
+  times = []
+  for _ in range(repeat):
+    if setup is not None:
+      setup()
+    times.append(timeit.Timer(func).timeit(number) / number)
+  return {'best': min(times), 'mean': sum(times) / len(times),
+          'repeat': repeat, 'number': number}
+
+
+def revision():
+  '''Returns git revision of the tree being measured, or None'''
+  try:
+    output = subprocess.check_output(
+      ['git', 'rev-parse', '--short', 'HEAD'],
+      cwd=os.path.dirname(os.path.abspath(__file__)))
+  except (OSError, subprocess.CalledProcessError):
+    return None
+  return output.decode('ascii').strip()
+
+
+def run_suite(args):
+  '''
+  Returns dict with run metadata and a timing entry per benchmark.
+
+  :args: parsed command line arguments
+  '''
+  contents = generate_config(args.interfaces, args.vlans, args.acl_lines)
+  catalog = generate_catalog(args.text_tests, args.config_tests,
+                             args.versions, args.interfaces)
+  directory = tempfile.mkdtemp()
+  try:
+    catalog_file = os.path.join(directory, 'tests.yaml')
+    with open(catalog_file, 'w') as file_stream:
+      file_stream.write(catalog)
+    tests = TestFile(catalog_file)
+    tests.config_version = args.versions
+    tests.config_engine = args.engine
+    names = tests.test_groups[BENCH_GROUP]
+    text_test = tests.find_test_by_name('text1')
+    config_test = tests.find_test_by_name('config1')
+    config = ConfigFile().from_string(contents)
+    state = {}
+
+    def fresh_config():
+      state['config'] = ConfigFile().from_string(contents)
+
+    def resolve_all():
+      for name in names:
+        tests.find_test_by_name(name)
+
+    def fresh_tests():
+      state['tests'] = TestFile(catalog_file)
+      state['tests'].config_version = args.versions
+      state['tests'].config_engine = args.engine
+
+    def audit():
+      AuditTests(state['config'], state['tests'], BENCH_GROUP).run()
+
+    def audit_warm():
+      AuditTests(config, tests, BENCH_GROUP).run()
+
+    repeat = args.repeat
+    benchmarks = [
+      ('testfile_load', measure(lambda: TestFile(catalog_file), repeat)),
+      ('find_test_by_name', measure(resolve_all, repeat)),
+      ('get_result_text', measure(lambda: text_test.get_result(config),
+                                  repeat)),
+      ('parse_tree', measure(lambda: state['config'].tree(args.engine),
+                             repeat, setup=fresh_config)),
+      ('get_result_config', measure(
+        lambda: config_test.get_result(config, config.tree(args.engine)),
+        repeat)),
+      ('audit_run', measure(audit, repeat, setup=lambda: (fresh_config(),
+                                                          fresh_tests()))),
+      ('audit_run_warm', measure(audit_warm, repeat)),
+      ]
+  finally:
+    shutil.rmtree(directory)
+  return {
+    'revision': revision(),
+    'python': platform.python_version(),
+    'parameters': {
+      'interfaces': args.interfaces, 'vlans': args.vlans,
+      'acl_lines': args.acl_lines, 'text_tests': args.text_tests,
+      'config_tests': args.config_tests, 'versions': list(args.versions),
+      'engine': args.engine, 'config_lines': contents.count('\n'),
+      },
+    'benchmarks': dict(benchmarks),
+    'order': [name for name, _ in benchmarks],
+    }
+
+
+def report(results, baseline=None):
+  '''
+  Returns printable table of results, with the ratio to baseline timings
+  when given.
+
+  :results: dict returned by run_suite
+  :baseline: optional dict returned by run_suite for an earlier version
+  '''
+  lines = ['revision: %s  python: %s  config lines: %d' % (
+    results['revision'], results['python'],
+    results['parameters']['config_lines'])]
+  for name in results['order']:
+    timing = results['benchmarks'][name]
+    line = '%-20s best %10.6fs  mean %10.6fs' % (name, timing['best'],
+                                                 timing['mean'])
+    if baseline is not None and name in baseline['benchmarks']:
+      before = baseline['benchmarks'][name]['best']
+      line += '  %5.2fx of %s' % (timing['best'] / before,
+                                  baseline['revision'])
+    lines.append(line)
+  return '\n'.join(lines)
+
+
+def parse_args(argv):
+  parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+  parser.add_argument('--interfaces', type=int, default=1000)
+  parser.add_argument('--vlans', type=int, default=100)
+  parser.add_argument('--acl-lines', type=int, default=1000)
+  parser.add_argument('--text-tests', type=int, default=200)
+  parser.add_argument('--config-tests', type=int, default=100)
+  parser.add_argument('--versions', nargs='*', default=['12.2', '15.0'],
+                      help='config_version layers of the catalog')
+  parser.add_argument('--engine', choices=sorted(ENGINES),
+                      default=DEFAULT_ENGINE)
+  parser.add_argument('--repeat', type=int, default=5)
+  parser.add_argument('--json', metavar='PATH',
+                      help='write results as JSON ("-" for stdout)')
+  parser.add_argument('--baseline', metavar='PATH',
+                      help='JSON results of an earlier run to compare with')
+  return parser.parse_args(argv)
+
+
+def main(argv):
+  args = parse_args(argv[1:])
+  results = run_suite(args)
+  baseline = None
+  if args.baseline:
+    with open(args.baseline) as file_stream:
+      baseline = json.load(file_stream)
+  if args.json == '-':
+    print(json.dumps(results, indent=2, sort_keys=True))
+    return
+  if args.json:
+    with open(args.json, 'w') as file_stream:
+      json.dump(results, file_stream, indent=2, sort_keys=True)
+  print(report(results, baseline))
+
+
+if __name__ == '__main__':
+  main(sys.argv)
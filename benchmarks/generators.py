@@ -0,0 +1,178 @@
+'''
+Generators of synthetic IOS configurations and test catalogs for the
+benchmarks.  Output is deterministic for the same arguments so timings can
+be compared between versions.
+'''
+
+import yaml
+
+HEADER = '''!
+version 15.0
+no service pad
+service timestamps debug datetime msec
+service timestamps log datetime msec
+service password-encryption
+!
+hostname BenchSwitch
+!
+boot-start-marker
+boot-end-marker
+!
+enable secret 5 $1$bench$0123456789abcdefghij.
+!
+username admin privilege 15 secret 5 $1$bench$0123456789abcdefghij.
+aaa new-model
+aaa authentication login default group tacacs+ local
+!
+ip domain-name bench.example
+ip name-server 10.0.0.53
+!
+spanning-tree mode rapid-pvst
+spanning-tree portfast bpduguard default
+spanning-tree extend system-id
+!
+vlan internal allocation policy ascending
+!
+ip ssh version 2
+!
+'''
+
+FOOTER = '''!
+ip classless
+no ip http server
+no ip http secure-server
+!
+logging host 10.0.0.1
+snmp-server community bench RO
+ntp server 10.0.0.2
+!
+banner motd ^C
+Authorized access only
+^C
+!
+line con 0
+ logging synchronous
+line vty 0 4
+ login local
+ transport input ssh
+line vty 5 15
+ login local
+ transport input ssh
+!
+end
+'''
+
+ACL_ENTRIES_PER_LIST = 250
+
+BENCH_GROUP = 'Benchmark'
+
+
+def interface_name(index):
+  '''
+  Returns name of the generated interface with index.
+
+  :index: integer interface index from 0
+  '''
+  return 'GigabitEthernet%d/0/%d' % (index // 48 + 1, index % 48 + 1)
+
+
+def generate_config(interfaces=1000, vlans=100, acl_lines=1000):
+  '''
+  Returns configuration text for a switch with the given number of
+  interfaces, VLANs and access list entries.  Every seventh interface is
+  shut down and every fifth is a trunk, so tests see both outcomes.
+
+  :interfaces: number of interface sections
+  :vlans: number of VLAN definitions
+  :acl_lines: number of access list entries, split over extended lists of
+    ACL_ENTRIES_PER_LIST entries
+  '''
+  parts = [HEADER]
+  for vlan in range(1, vlans + 1):
+    parts.append('vlan %d\n name VLAN%04d\n!\n' % (vlan, vlan))
+  for index in range(interfaces):
+    lines = ['interface %s' % interface_name(index),
+             ' description access port %d' % index]
+    if index % 5 == 0:
+      lines.extend([' switchport trunk encapsulation dot1q',
+                    ' switchport mode trunk'])
+    else:
+      lines.extend([' switchport mode access',
+                    ' switchport access vlan %d' % (index % max(vlans, 1) + 1),
+                    ' spanning-tree portfast'])
+    if index % 7 == 0:
+      lines.append(' shutdown')
+    lines.append('!')
+    parts.append('\n'.join(lines) + '\n')
+  for entry in range(acl_lines):
+    if entry % ACL_ENTRIES_PER_LIST == 0:
+      parts.append('ip access-list extended BENCH-%d\n' %
+                   (entry // ACL_ENTRIES_PER_LIST))
+    parts.append(' %s tcp 10.%d.%d.0 0.0.0.255 any eq %d\n' % (
+      'deny' if entry % 11 == 0 else 'permit', entry // 65536 % 256,
+      entry // 256 % 256, entry % 256 + 1024))
+  parts.append(FOOTER)
+  return ''.join(parts)
+
+
+def _text_test(index, interfaces):
+  '''Returns definition of a generated text test'''
+  kind = index % 4
+  if kind == 0:
+    # Passing test with a literal fragment
+    port = index % max(interfaces, 1)
+    return {'match': '^ description access port (%d)$' % port,
+            'expected': str(port)}
+  if kind == 1:
+    # Failing test, scans the whole configuration
+    return {'match': 'logging host ([0-9.]+)',
+            'expected': '10.9.%d.%d' % (index // 256 % 256, index % 256)}
+  if kind == 2:
+    return {'match': r'^ (permit|deny) tcp 10\.0\.%d\.0 ' % (index % 256),
+            'expected': 'permit'}
+  return {'match': r'ip ssh version ([0-9])', 'expected': '2'}
+
+
+def _config_test(index, interfaces):
+  '''Returns definition of a generated hierarchical test'''
+  name = interface_name(index % max(interfaces, 1))
+  if index % 2:
+    return {'type': 'config',
+            'match': ['^interface %s$' % name, '(shutdown)'],
+            'expected': 'shutdown'}
+  return {'type': 'config',
+          'match': ['^interface GigabitEthernet%d/' % (index % 4 + 1),
+                    'switchport mode (access|trunk)'],
+          'expected': 'access'}
+
+
+def generate_catalog(text_tests=200, config_tests=100,
+                     versions=('12.2', '15.0'), interfaces=1000):
+  '''
+  Returns test definition YAML with text and hierarchical tests in the
+  Default item, a layer per version overriding a share of them, and one
+  group (BENCH_GROUP) running every test.
+
+  :text_tests: number of text tests
+  :config_tests: number of hierarchical tests
+  :versions: list of config_version names, each overriding every
+    (position + 2)th test of the previous layer
+  :interfaces: number of interfaces in the configuration being tested
+  '''
+  default = {}
+  for index in range(text_tests):
+    default['text%d' % index] = _text_test(index, interfaces)
+  for index in range(config_tests):
+    default['config%d' % index] = _config_test(index, interfaces)
+  names = sorted(default)
+  items = {'Default': default}
+  for position, version in enumerate(versions):
+    step = position + 2
+    layer = {}
+    for name in names[::step]:
+      test = dict(default[name])
+      test['cmd'] = 'show running-config'
+      layer[name] = test
+    items[version] = layer
+  catalog = {'TestItems': items, 'TestGroups': {BENCH_GROUP: names}}
+  return '---\n' + yaml.safe_dump(catalog, default_flow_style=False)
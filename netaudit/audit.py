@@ -2,54 +2,156 @@
 
 import re
 import collections
-
-import yaml
-from ciscoconfparse import CiscoConfParse
+from timeit import default_timer
+try:
+  from collections.abc import Iterable
+except ImportError:
+  from collections import Iterable
 
 from . import exceptions as E
+from .catalog import parse_catalog, load_catalog, CatalogIndex, INCLUDE_RE
+from .catalog import STRING_TYPES
+from .config import parse_contents, ConfigDiff, iter_lines
+from .config import is_binary, to_bytes, to_text
+from .config import DEFAULT_ENGINE, ENGINES, evaluates_by_section
+from .regex import compile_regex, is_linear, risky_pattern, time_budget
+from .regex import DEFAULT_BACKEND
+from .scanner import TextScanner, config_text, counted_search, counted_lines
+from .quantifier import Quantifier, parse_quantifier
+from .hooks import TestTiming
 
 DEFAULT_CONF = 'Default'
 
+# Test group name selecting every group, unless a group has this name
+ALL_GROUPS = 'all'
+
+# Seconds a test with a pattern prone to catastrophic backtracking may run
+# on one configuration before it is reported as errored
+DEFAULT_REGEX_BUDGET = 10.0
+
+BUDGET_MESSAGE = 'Regex budget of %gs exceeded, test not evaluated.\n'
+
+LINE_NUMBER_RE = re.compile(r'line (\d+)')
+
+# Outcomes of the parents a hierarchical test looks at
+MATCHED = 'matched'
+MISMATCHED = 'mismatched'
+NO_CHILD = 'no child'
+
+OUTCOME_MESSAGES = {
+  MATCHED: 'Unexpected match for configuration, line %r.\n',
+  MISMATCHED: 'Match failed for configuration, line %r.\n',
+  NO_CHILD: 'Could not find child, line %r.\n',
+}
+
 class AuditTests(object):
   '''
   Auditor that can accept a set of tests and configuration file and then
   returns results.
   '''
-  def __init__(self, config, tests=None, test_group=None):
+  def __init__(self, config, tests=None, test_group=None, cache=None,
+               hooks=None, shards=None, memo=None):
     '''
     :config: netaudit.ConfigFile object
     :tests: tests.TestFile object
     :test_group: String, test group name
+    :cache: optional netaudit.cache.ResultCache consulted by run
+    :hooks: optional netaudit.hooks.AuditHooks object notified of the
+      phases of run
+    :shards: optional number of worker processes to split the evaluation of
+      a large configuration across (see netaudit.shard); ignored when hooks
+      are set
+    :memo: optional netaudit.memo.SectionMemo shared between audits, so
+      sections seen in earlier configurations are not evaluated again
     '''
     self.config = config
     self.tests = tests
     self.test_group = test_group
+    self.cache = cache
+    self.hooks = hooks
+    self.shards = shards
+    self.memo = memo
     self.last_results = None
+    self.last_evaluated = None
 
   def run(self, test_group=None):
     '''
     Runs tests in a given test_group and sets self.last_results to a list of
-    the results
+    the results.  When test_group is a list of groups or ALL_GROUPS, every
+    distinct test is evaluated once and self.last_results is an OrderedDict
+    of group name to the list of results of its tests.
 
-    :test_group: string name of group to run
+    :test_group: string name of group to run, list of names or ALL_GROUPS
+    '''
+    results = list(self.iter_run(test_group))
+    if isinstance(self.test_group, STRING_TYPES) and \
+       self.test_group in self.tests.test_groups:
+      self.last_results = results
+      return
+    by_name = dict((res.name, res) for res in results)
+    self.last_results = collections.OrderedDict(
+      (group, [by_name[name] for name in self.tests.test_groups[group]])
+      for group in self.tests.group_names(self.test_group))
+
+  def iter_run(self, test_group=None):
+    '''
+    Returns iterator yielding a TestResult for each test in test_group as
+    soon as it is evaluated.  For several groups each distinct test is
+    yielded once, in the order the groups first reference it.  Results are
+    not kept in self.last_results.  The test group is checked when this is
+    called, not on first iteration.
+
+    :test_group: string name of group to run, list of names or ALL_GROUPS
     '''
-    results = []
     self.test_group = self.test_group if test_group is None else test_group
     test_group = self.test_group
     if test_group is None:
       msg = 'test_group must be set before running audit.'
       raise E.TestGroupNotSetError(msg)
-    if test_group not in self.tests.test_groups:
+    if test_group == ALL_GROUPS or not isinstance(test_group, STRING_TYPES):
+      # Checks every group
+      self.tests.group_names(test_group)
+    elif test_group not in self.tests.test_groups:
       msg = ('The specified test group (%s) does not exist in the '
              'configuration file.' % test_group)
       raise E.TestGroupDoesNotExistError(msg)
-    for test_name in self.tests.test_groups[test_group]:
-      test = self.tests.find_test_by_name(test_name)
-      result = test.get_result(self.config)
-      message = None if test.last_message is None else test.last_message
-      #result = self._getTestResult(self.config, test)
-      results.append(TestResult(test_name, result, message))
-    self.last_results = results
+    if self.hooks is None:
+      plan = self.tests.compile_plan(test_group)
+      if self.shards is not None and self.shards > 1:
+        # Imported here as netaudit.shard builds on this module
+        from .shard import sharded_results
+        return sharded_results(plan, self.config, self.shards, self.cache,
+                               memo=self.memo)
+      if self.memo is not None:
+        return plan.results(self.config, self.cache, memo=self.memo)
+      return plan.results(self.config, self.cache)
+    plan = self.tests.compile_plan(test_group, self.hooks)
+    return plan.results(self.config, self.cache, self.hooks)
+
+  def run_incremental(self, previous_config, previous_results,
+                      test_group=None):
+    '''
+    Runs tests like run, but only re-evaluates tests whose result can be
+    changed by the differences between previous_config and self.config.
+    Results of the other tests are taken from previous_results.  Sets
+    self.last_results and self.last_evaluated (names of the tests that were
+    re-evaluated).
+
+    :previous_config: configuration object that previous_results came from
+    :previous_results: list of TestResult from auditing previous_config with
+      the same tests
+    :test_group: string name of group to run
+    '''
+    self.test_group = self.test_group if test_group is None else test_group
+    if self.test_group is None:
+      msg = 'test_group must be set before running audit.'
+      raise E.TestGroupNotSetError(msg)
+    plan = self.tests.compile_plan(self.test_group)
+    diff = ConfigDiff(previous_config.contents, self.config.contents)
+    evaluated = []
+    self.last_results = list(plan.incremental_results(
+      self.config, diff, previous_results, evaluated))
+    self.last_evaluated = evaluated
 
 
 
@@ -60,26 +162,57 @@ class TestFile(object):
   '''
   test_definitions = []
   test_groups = {}
-
-  def __init__(self, file_name=None):
+  # Preselect candidate lines for text tests by their literal fragments
+  literal_prefilter = True
+  # Engine building the hierarchy for config tests, see
+  # netaudit.config.ENGINES
+  config_engine = DEFAULT_ENGINE
+  # Directory of parsed test definition files, None to parse on every load
+  catalog_cache_dir = None
+  # Backend compiling text test patterns, see netaudit.regex.BACKENDS
+  regex_backend = DEFAULT_BACKEND
+  # Seconds tests with risky patterns may run per configuration, None for
+  # no limit
+  regex_budget = DEFAULT_REGEX_BUDGET
+
+  def __init__(self, file_name=None, catalog_cache_dir=None):
     '''
     :file_name: string name of file to load
+    :catalog_cache_dir: optional string directory where parsed test
+      definition files are cached between runs
     '''
+    if catalog_cache_dir is not None:
+      self.catalog_cache_dir = catalog_cache_dir
     self.test_definitions = list(self.test_definitions)
     self.test_groups = dict(self.test_groups)
     self._config_version = []
+    self._definition_index = None
+    self._plans = {}
+    self._catalogs = []
     if file_name is not None:
       self.load(file_name)
 
   def load(self, file_name):
     '''
-    Loads test definitions from file.
+    Loads test definitions from file.  A file with an Include key is the
+    top of a catalog split over several files (see
+    netaudit.catalog.CatalogIndex): its test groups are loaded now, and
+    test items only when tests from them are resolved.
 
     :file_name: string name of file
     '''
     with open(file_name) as file_stream:
-      yaml_conf = yaml.safe_load(file_stream)
-    self._parse_conf(yaml_conf)
+      text = file_stream.read()
+    if INCLUDE_RE.search(text) is not None:
+      index = CatalogIndex(file_name, self.catalog_cache_dir, text)
+      self._catalogs.append(index)
+      self.test_groups.update(index.groups)
+      self._definition_index = None
+      self._plans = {}
+    elif self.catalog_cache_dir is not None:
+      self._parse_conf(load_catalog(file_name, self.catalog_cache_dir))
+    else:
+      self._parse_conf(parse_catalog(text))
 
   def from_string(self, test_definition_string):
     '''
@@ -87,7 +220,7 @@ class TestFile(object):
 
     :test_definition_string: string with test definitions
     '''
-    self._parse_conf(yaml.safe_load(test_definition_string))
+    self._parse_conf(parse_catalog(test_definition_string))
 
   def _parse_conf(self, yaml_conf):
     '''
@@ -96,16 +229,43 @@ class TestFile(object):
 
     :yaml_conf: yaml object
     '''
-    for item in yaml_conf['TestItems']:
-      add_item = [item, yaml_conf['TestItems'][item]]
+    test_items = yaml_conf.get('TestItems', {})
+    self._add_items((item, test_items[item]) for item in test_items)
+    if 'TestGroups' in yaml_conf:
+      for group in yaml_conf['TestGroups']:
+        self.test_groups[group] = yaml_conf['TestGroups'][group]
+    # Definitions changed, so resolved lookups and plans are stale
+    self._definition_index = None
+    self._plans = {}
+
+  def _add_items(self, items):
+    '''
+    Adds test items to self.test_definitions.
+
+    :items: iterable of (item name, dict of tests)
+    '''
+    for item, tests in items:
+      add_item = [item, tests]
       # Default should be the first in the list
-      if item == 'Default':
+      if item == DEFAULT_CONF:
         self.test_definitions = [add_item] + self.test_definitions
       else:
         self.test_definitions.append(add_item)
-    if 'TestGroups' in yaml_conf:
-      for group in yaml_conf['TestGroups']:
-        self.test_groups[group] = yaml_conf['TestGroups'][group]
+
+  def _load_tests(self, test_names):
+    '''
+    Parses the files of split catalogs that define test_names for Default
+    and the current config_version chain.
+
+    :test_names: list of test names
+    '''
+    items = [DEFAULT_CONF] + list(self.config_version)
+    for index in self._catalogs:
+      # Known items are updated in place, only new ones need indexing
+      new_items = index.load(items, test_names)
+      if new_items:
+        self._add_items(new_items)
+        self._definition_index = None
 
   @property
   def config_version(self):
@@ -120,13 +280,25 @@ class TestFile(object):
     :version: string version text'''
     if isinstance(version, str):
       self._config_version = [version]
-    elif isinstance(version, collections.Iterable):
+    elif isinstance(version, Iterable):
       self._config_version = tuple(version)
     else:
       msg = ('"%s" is not a valid string or list.  Set config_version to a '
              'string or list of strings.' % str(version))
       raise ValueError(msg)
 
+  def _get_definition_index(self):
+    '''
+    Returns dict of test item name to its test definitions.  When an item is
+    defined more than once, the last definition loaded wins.
+    '''
+    if self._definition_index is None:
+      index = {}
+      for item_name, definitions in self.test_definitions:
+        index[item_name] = definitions
+      self._definition_index = index
+    return self._definition_index
+
   def find_test_by_name(self, test_name):
     '''
     Returns TestCase object  based config_version and test_name.  If test is
@@ -135,45 +307,310 @@ class TestFile(object):
 
     :test_name: string test name as defined in test definition file
     '''
-    test = None
-    test_definitions = self.test_definitions
-
-    
+    if self._catalogs:
+      self._load_tests([test_name])
+    index = self._get_definition_index()
     for config_version in reversed([DEFAULT_CONF] + list(self.config_version)):
-      test_definition_match = None
-      for test_definition in test_definitions:
-        if test_definition[0] == config_version:
-          test_definition_match = test_definition
-      if test_definition_match is None:
+      if config_version not in index:
         msg = ('Make sure the test item exists and has the specified '
            'test (%s).' % (config_version))
         raise E.TestItemNotFoundError(msg)
-      if test_name in test_definition_match[1]:
-        test = test_definition_match[1][test_name]
-        return TestCase(
+      if test_name in index[config_version]:
+        test = index[config_version][test_name]
+        case = TestCase(
           test_name=test_name,
           command=test['cmd'] if 'cmd' in test else None,
           pattern=test['match'],
           expected=test['expected'],
           test_type=test['type'] if 'type' in test else None,
+          quantifier=test.get('quantifier'),
+          regex_backend=self.regex_backend,
         )
+        if case.risky:
+          case.budget = self.regex_budget
+        return case
     msg = ('Make sure the test configuration exists and has the specified '
            'test (%s).' % (test_name))
     raise E.TestNotFoundError(msg)
 
+  def group_names(self, test_group):
+    '''
+    Returns list of the names of the groups selected by test_group.
 
+    :test_group: string name of group, list of names, or ALL_GROUPS for
+      every group (sorted by name) unless a group is named ALL_GROUPS
+    '''
+    if isinstance(test_group, STRING_TYPES):
+      if test_group == ALL_GROUPS and test_group not in self.test_groups:
+        return sorted(self.test_groups)
+      names = [test_group]
+    else:
+      names = list(test_group)
+    for name in names:
+      if name not in self.test_groups:
+        msg = ('The specified test group (%s) does not exist in the '
+               'configuration file.' % name)
+        raise E.TestGroupDoesNotExistError(msg)
+    return names
+
+  def group_tests(self, test_group):
+    '''
+    Returns list of the test names of test_group.  For several groups each
+    test shared between them is only listed once, where it first appears.
 
+    :test_group: string name of group, list of names or ALL_GROUPS
+    '''
+    if isinstance(test_group, STRING_TYPES) and test_group in self.test_groups:
+      return list(self.test_groups[test_group])
+    seen = set()
+    names = []
+    for group in self.group_names(test_group):
+      for name in self.test_groups[group]:
+        if name not in seen:
+          seen.add(name)
+          names.append(name)
+    return names
+
+  def compile_plan(self, test_group, hooks=None):
+    '''
+    Returns TestPlan for test_group resolved against the current
+    config_version.  Plans are built once and reused until test definitions
+    are reloaded.  A plan for several groups holds each distinct test once.
+    Tests with risky patterns (see TestCase.risky) get regex_budget and are
+    evaluated on their own instead of in the shared text scan.
+
+    :test_group: string name of group, list of names or ALL_GROUPS
+    :hooks: optional netaudit.hooks.AuditHooks object, told when a plan is
+      built
+    '''
+    if not isinstance(test_group, STRING_TYPES):
+      test_group = tuple(test_group)
+    key = (test_group, tuple(self.config_version), self.literal_prefilter,
+           self.config_engine, self.regex_backend, self.regex_budget)
+    plan = self._plans.get(key)
+    if plan is None:
+      if self.config_engine not in ENGINES:
+        msg = ('"%s" is not a valid config_engine.  Use one of: %s.' %
+               (self.config_engine, ', '.join(sorted(ENGINES))))
+        raise ValueError(msg)
+      test_names = self.group_tests(test_group)
+      start = default_timer()
+      if self._catalogs:
+        self._load_tests(test_names)
+      tests = tuple(self.find_test_by_name(test_name)
+                    for test_name in test_names)
+      text_scanner = TextScanner((test for test in tests if test.scannable),
+                                 literal_prefilter=self.literal_prefilter)
+      plan = TestPlan(test_group, key[1], tests, text_scanner,
+                      self.config_engine)
+      self._plans[key] = plan
+      if hooks is not None:
+        hooks.plan_built(plan, default_timer() - start)
+    return plan
+
+
+
+# Result is None when the test errored, e.g. ran out of its regex budget
 TestResult = collections.namedtuple('TestResult', ('name', 'result',
                                                    'message'))
 
+class TestPlan(collections.namedtuple('TestPlan', ('test_group',
+                                                   'config_version',
+                                                   'tests',
+                                                   'text_scanner',
+                                                   'engine'))):
+  '''
+  Immutable, compiled set of tests for one test group and config_version.
+  Built by TestFile.compile_plan and reused for every configuration audited.
+  '''
+  __slots__ = ()
+
+  def results(self, config, cache=None, hooks=None, memo=None):
+    '''
+    Yields a TestResult for each test in the plan, in group order.  All text
+    tests are evaluated together in one pass over the configuration.
+
+    :config: a configuration object as defined in netaudit.config
+    :cache: optional netaudit.cache.ResultCache; tests with a cached result
+      for the same configuration contents are not evaluated, and new results
+      are stored once every test has been yielded
+    :hooks: optional netaudit.hooks.AuditHooks object; each test is then
+      evaluated on its own so its time, lines scanned and regex evaluations
+      can be reported
+    :memo: optional netaudit.memo.SectionMemo; hierarchical tests then reuse
+      the outcomes of sections seen in earlier configurations.  Not used
+      with hooks.
+    '''
+    cached = cache.lookup(self, config) if cache is not None else {}
+    if hooks is None:
+      evaluate = self._evaluator(config, memo)
+    else:
+      evaluate = self._profiled_evaluator(config, hooks)
+    evaluated = []
+    for test in self.tests:
+      if test in cached:
+        result, message = cached[test]
+        yield TestResult(test.name, result, message)
+        continue
+      test_result = evaluate(test)
+      evaluated.append((test, test_result))
+      yield test_result
+    if cache is not None and evaluated:
+      cache.store(self, config, evaluated)
+
+  def _evaluator(self, config, memo=None):
+    '''
+    Returns function giving the TestResult of one test of the plan for
+    config.  Text tests share one scan and hierarchical tests one parse, or
+    one lookup of their section outcomes in memo.  Tests with a regex budget
+    are evaluated on their own.  The memo is not used on engines that do not
+    build the same hierarchy section by section (see
+    netaudit.config.evaluates_by_section).
+
+    :config: a configuration object as defined in netaudit.config
+    :memo: optional netaudit.memo.SectionMemo
+    '''
+    if memo is not None and not evaluates_by_section(self.engine):
+      memo = None
+    state = {}
+    def evaluate(test):
+      if test.scannable and self.text_scanner is not None:
+        if 'text' not in state:
+          scanner = self.text_scanner
+          if is_binary(config):
+            scanner = scanner.for_bytes()
+          state['text'] = scanner.scan(config_text(config))
+        return TestResult(test.name, state['text'][test], None)
+      if test.is_hierarchical and memo is not None and test.budget is None:
+        if 'outcomes' not in state:
+          state['outcomes'] = memo.outcomes(
+            config, [item for item in self.tests
+                     if item.is_hierarchical and item.budget is None],
+            self.engine)
+        result, message = test.fold_outcomes(state['outcomes'][test])
+        return TestResult(test.name, result, message)
+      if test.is_hierarchical and 'parse' not in state:
+        state['parse'] = get_parse(config, self.engine)
+      result, message = test.evaluate(config, state.get('parse'))
+      return TestResult(test.name, result, message)
+    return evaluate
+
+  def _profiled_evaluator(self, config, hooks):
+    '''
+    Returns function like _evaluator that reports each test to hooks.  Text
+    tests are scanned one at a time, so their timings do not include the
+    other tests of the shared pass.
+
+    :config: a configuration object as defined in netaudit.config
+    :hooks: netaudit.hooks.AuditHooks object
+    '''
+    state = {}
+    def evaluate(test):
+      if test.is_hierarchical and 'parse' not in state:
+        start = default_timer()
+        state['parse'] = get_parse(config, self.engine)
+        hooks.parse_built(config, self.engine, default_timer() - start)
+      hooks.test_started(test)
+      counts = [0, 0]
+      start = default_timer()
+      if test.scannable and self.text_scanner is not None:
+        scanner = self.text_scanner.single(test)
+        if is_binary(config):
+          scanner = scanner.for_bytes()
+        result = scanner.scan(config_text(config), counts)[test]
+        message = None
+      else:
+        result, message = test.evaluate(config, state.get('parse'), counts)
+      timing = TestTiming(test.name, default_timer() - start, counts[0],
+                          counts[1])
+      test_result = TestResult(test.name, result, message)
+      hooks.test_finished(test, test_result, timing)
+      return test_result
+    return evaluate
+
+  def incremental_results(self, config, diff, previous_results,
+                          evaluated=None):
+    '''
+    Yields a TestResult for each test in the plan, reusing previous results
+    for tests that the configuration changes cannot affect.
+
+    :config: current configuration object
+    :diff: netaudit.config.ConfigDiff from the previous configuration
+    :previous_results: list of TestResult for the previous configuration
+    :evaluated: optional list, names of re-evaluated tests are appended
+    '''
+    previous = dict((res.name, res) for res in previous_results)
+    parse = None
+    for test in self.tests:
+      prior = previous.get(test.name)
+      if prior is not None and diff.identical:
+        yield prior
+        continue
+      if prior is not None and test.is_text and test.budget is None:
+        result = test.incremental_result(config, diff, prior.result)
+        if result is None:
+          yield prior
+          continue
+        if evaluated is not None:
+          evaluated.append(test.name)
+        yield TestResult(test.name, result, None)
+        continue
+      if (prior is not None and test.budget is None and
+          not test.affected_by(diff, prior.message)):
+        yield prior
+        continue
+      if test.is_hierarchical and parse is None:
+        parse = get_parse(config, self.engine)
+      if evaluated is not None:
+        evaluated.append(test.name)
+      result, message = test.evaluate(config, parse)
+      yield TestResult(test.name, result, message)
+
+
+
+def get_parse(config, engine=DEFAULT_ENGINE):
+  '''
+  Returns the parsed hierarchy for config, using the tree cached on
+  ConfigFile objects when available.
+
+  :config: a configuration object as defined in netaudit.config
+  :engine: string name of an engine in netaudit.config.ENGINES
+  '''
+  tree = getattr(config, 'tree', None)
+  if tree is not None:
+    return tree(engine)
+  return parse_contents(config.contents, engine)
+
+
+
+def compile_pattern(pattern, backend=DEFAULT_BACKEND):
+  '''
+  Returns compiled regex for a test pattern; list patterns (hierarchical
+  tests) compile to a tuple of regexes.  Hierarchy engines compile patterns
+  with the re module, so only text patterns use backend.
+
+  :pattern: string or list of strings
+  :backend: string name of a backend in netaudit.regex.BACKENDS
+  '''
+  if pattern is None:
+    return None
+  if isinstance(pattern, (list, tuple)):
+    return tuple(re.compile(item) for item in pattern)
+  return compile_regex(pattern, backend)
+
 
 
 class TestCase(object):
   '''
   Represents a single test that can be run and returns a TestResult object.
   '''
+  __slots__ = ('name', 'command', '_pattern', '_regex', '_bytes_regex',
+               '_risky', 'expected', 'type', '_quantifier', '_last_message',
+               'regex_backend', 'budget')
+
   def __init__(self, test_name, command=None, pattern=None, expected=None,
-               test_type='text'):
+               test_type='text', quantifier=None,
+               regex_backend=DEFAULT_BACKEND, budget=None):
     '''
     :test_name: The name of the test to be run.
     :command: The command that must be run to get the raw data
@@ -182,59 +619,353 @@ class TestCase(object):
     :test_type: Type of test defines how test is completed; 'text' does
       simple text search through the entire configuration; 'config' first
       parses the text as a hierarchy (tree structure)
+    :quantifier: optional string, how many matches are needed to pass (see
+      parse_quantifier); evaluation stops as soon as the result is known
+    :regex_backend: string name of the backend compiling a text pattern,
+      see netaudit.regex.BACKENDS
+    :budget: optional number of seconds an evaluation may run before the
+      test is reported as errored
     '''
     self.name = test_name
     self.command = command
+    self.regex_backend = regex_backend
+    self.budget = budget
     self.pattern = pattern
     self.expected = expected
     self.type = test_type
+    self.quantifier = quantifier
     self._last_message = None
 
-  def get_result(self, config):
+  @property
+  def pattern(self):
+    '''Returns pattern as defined in the test definition'''
+    return self._pattern
+
+  @pattern.setter
+  def pattern(self, pattern):
+    '''
+    Sets pattern and compiles it.
+
+    :pattern: string or list of strings with regex patterns
+    '''
+    self._pattern = pattern
+    self._regex = compile_pattern(pattern, self.regex_backend)
+    self._bytes_regex = None
+    self._risky = self._find_risky()
+
+  @property
+  def regex(self):
+    '''Returns compiled pattern'''
+    return self._regex
+
+  @property
+  def bytes_regex(self):
+    '''Returns pattern compiled for bytes, compiled on first use'''
+    if self._bytes_regex is None and self._pattern is not None:
+      self._bytes_regex = compile_pattern(to_bytes(self._pattern),
+                                          self.regex_backend)
+    return self._bytes_regex
+
+  @property
+  def risky(self):
+    '''
+    Returns True if a pattern of the test is compiled by the re module and
+    can backtrack catastrophically (see netaudit.regex.risky_pattern)
+    '''
+    return self._risky
+
+  def _find_risky(self):
+    '''Returns True if a compiled pattern of the test is risky'''
+    if self._pattern is None:
+      return False
+    if isinstance(self._regex, tuple):
+      compiled = zip(self._pattern, self._regex)
+    else:
+      compiled = [(self._pattern, self._regex)]
+    return any(not is_linear(regex) and risky_pattern(pattern)
+               for pattern, regex in compiled)
+
+  def matcher(self, binary=False):
+    '''
+    Returns tuple of the search function of a text test and the value group
+    1 must equal.
+
+    :binary: boolean, match bytes lines of a bytes mode configuration
+    '''
+    if binary:
+      return self.bytes_regex.search, to_bytes(self.expected)
+    return self._regex.search, self.expected
+
+  @property
+  def quantifier(self):
+    '''Returns Quantifier object, or None for the default of the test type'''
+    return self._quantifier
+
+  @quantifier.setter
+  def quantifier(self, quantifier):
+    '''
+    Sets quantifier.
+
+    :quantifier: string as accepted by parse_quantifier, Quantifier object
+      or None
+    '''
+    if not isinstance(quantifier, Quantifier):
+      quantifier = parse_quantifier(quantifier)
+    self._quantifier = quantifier
+
+  @property
+  def is_hierarchical(self):
+    '''Returns True if test is evaluated against the parsed hierarchy'''
+    return self.type == 'config' or isinstance(self.pattern, list)
+
+  @property
+  def is_text(self):
+    '''Returns True if test is a line by line text search'''
+    return (not self.is_hierarchical and
+            (self.type == 'text' or self.type is None))
+
+  @property
+  def scannable(self):
+    '''
+    Returns True if test is a text test that passes on the first matching
+    line and has no regex budget, so it can be evaluated by TextScanner
+    '''
+    return (self.is_text and self.budget is None and
+            (self._quantifier is None or self._quantifier.kind == 'any'))
+
+  def get_result(self, config, parse=None):
     '''
     Returns a boolean result after running the defined test on the passed
     configuration
 
     :configuration: a configuration object as defined in netaudit.config
+    :parse: optional hierarchy already built from config (CiscoConfParse or
+      netaudit.tree.ConfigTree); if not given, hierarchical tests parse the
+      configuration contents
     '''
-    contents = config.contents
+    result, self._last_message = self.evaluate(config, parse)
+    return result
+
+  def evaluate(self, config, parse=None, counts=None):
+    '''
+    Returns tuple of boolean result and message (None if there is nothing to
+    report) without storing state on the test, so compiled tests can be
+    shared between audits.
+
+    :configuration: a configuration object as defined in netaudit.config
+    :parse: optional hierarchy already built from config (CiscoConfParse or
+      netaudit.tree.ConfigTree)
+    :counts: optional list of two integers, incremented by the number of
+      lines read and regex evaluations made; for hierarchical tests every
+      line and every child of a matched parent counts once
+
+    Without a quantifier a config test passes when every parent matches and
+    reports every parent that does not; with one, evaluation stops as soon
+    as the result is known and only the parents seen so far are reported.
+
+    A test with a budget that runs longer returns None and BUDGET_MESSAGE;
+    the configuration is parsed before the budget starts.
+    '''
+    if self.is_hierarchical and parse is None:
+      parse = parse_contents(to_text(config.contents))
+    if self.budget is None:
+      return self._evaluate(config, parse, counts)
+    try:
+      with time_budget(self.budget):
+        return self._evaluate(config, parse, counts)
+    except E.RegexBudgetExceededError:
+      return None, BUDGET_MESSAGE % self.budget
+
+  def _evaluate(self, config, parse, counts):
+    '''
+    Returns tuple of result and message like evaluate, without a budget.
+
+    :config: a configuration object as defined in netaudit.config
+    :parse: hierarchy built from config for hierarchical tests
+    :counts: optional list of lines read and regex evaluations
+    '''
+    quantifier = self._quantifier
+    if self.is_hierarchical:
+      return self.fold_outcomes(self.parent_outcomes(parse, counts))
     result = False
-    message = ''
-    if self.type == 'config' or isinstance(self.pattern, list):
-      has_failure = False# Track if there is an explicit failure
-      parse = CiscoConfParse(re.split('(?:\r\n|\n|\r)',contents))
-      patterns = self.pattern
-
-      parents = parse.find_objects(patterns[0])
-      for i in range(1, len(patterns)):
-        children = []
-        for parent in parents:
-          if i >= len(patterns) - 1:
-            match = parent.re_match_iter_typed(patterns[i], default=None)
-            if match and match == self.expected:
-              result = True
-            else:
-              has_failure = True
-              message += ("Match failed for configuration, line %r.\n" %
-                               (parent.linenum))
+    if self.type == 'text' or self.type is None:
+      binary = is_binary(config)
+      search, expected = self.matcher(binary)
+      lines = iter_lines(config)
+      if counts is not None:
+        search = counted_search(search, counts)
+        lines = counted_lines(lines, counts)
+      if quantifier is None or quantifier.kind == 'any':
+        for line in lines:
+          match = search(line)
+          if match is not None and match.group(1) == expected:
+            result = True
+            break
+      else:
+        result = quantifier.result(*self.count_matches(lines, binary,
+                                                       search))
+    return result, None
+
+  def parent_outcomes(self, parse, counts=None):
+    '''
+    Yields tuple of level, outcome (MATCHED, MISMATCHED or NO_CHILD) and
+    line number for each parent a hierarchical test looks at, level by
+    level in line order.  Children are only searched as the outcomes are
+    read, so a caller can stop early.
+
+    :parse: hierarchy built from the configuration
+    :counts: optional list of lines read and regex evaluations, updated in
+      place
+    '''
+    patterns = self.regex
+    parents = parse.find_objects(patterns[0])
+    if counts is not None:
+      size = len(getattr(parse, 'ConfigObjs', parse))
+      counts[0] += size
+      counts[1] += size
+    last = len(patterns) - 1
+    for i in range(1, len(patterns)):
+      children = []
+      for parent in parents:
+        if counts is not None:
+          counts[1] += len(parent.children)
+        if i >= last:
+          match = parent.re_match_iter_typed(patterns[i], default=None)
+          if match and match == self.expected:
+            yield i, MATCHED, parent.linenum
           else:
-            match = parent.re_search_children(patterns[i])
-            if match:
-              children.extend(match)
-            else:
-              has_failure = True
-              message += ("Could not find child, line %r.\n" %
-                               (parent.linenum))
-        parents = children
-      result = (not has_failure) & result
-    elif self.type == 'text' or self.type is None:
-      for line in contents.split('\n'):
-        #print ('%s, %s, %s' % (test.pattern, test.expected, line))
-        match = re.search(self.pattern, line)
-        if match is not None and match.group(1) == self.expected:
-          result = True
-    self._last_message = message if message != '' else None
-    return result
+            yield i, MISMATCHED, parent.linenum
+        else:
+          match = parent.re_search_children(patterns[i])
+          if match:
+            children.extend(match)
+          else:
+            yield i, NO_CHILD, parent.linenum
+      parents = children
+
+  def fold_outcomes(self, outcomes):
+    '''
+    Returns tuple of boolean result and message (None if there is nothing
+    to report) of a hierarchical test from its parent outcomes.
+
+    :outcomes: iterable of outcomes as yielded by parent_outcomes, in the
+      same order
+    '''
+    quantifier = self._quantifier
+    report_matches = quantifier is not None and quantifier.kind == 'none'
+    matches = 0
+    mismatches = 0
+    messages = []
+    decided = None
+    for _, outcome, linenum in outcomes:
+      if outcome == MATCHED:
+        matches += 1
+        if report_matches:
+          messages.append(OUTCOME_MESSAGES[outcome] % linenum)
+      else:
+        mismatches += 1
+        if not report_matches:
+          messages.append(OUTCOME_MESSAGES[outcome] % linenum)
+      if quantifier is not None:
+        decided = quantifier.decided(matches, mismatches)
+        if decided is not None:
+          break
+    if decided is not None:
+      result = decided
+    elif quantifier is not None:
+      result = quantifier.result(matches, mismatches)
+    else:
+      result = matches > 0 and not mismatches
+    if result or not messages:
+      return result, None
+    return result, ''.join(messages)
+
+  def count_matches(self, lines, binary=False, search=None):
+    '''
+    Returns tuple of matches and mismatches of a text test with a
+    quantifier, reading lines only until the result is known.
+
+    :lines: iterable of configuration lines
+    :binary: boolean, lines are bytes from a bytes mode configuration
+    :search: optional search function to use instead of the test regex
+    '''
+    default_search, expected = self.matcher(binary)
+    if search is None:
+      search = default_search
+    quantifier = self._quantifier
+    matches = 0
+    mismatches = 0
+    for line in lines:
+      match = search(line)
+      if match is None:
+        continue
+      if match.group(1) == expected:
+        matches += 1
+      else:
+        mismatches += 1
+      if quantifier.decided(matches, mismatches) is not None:
+        break
+    return matches, mismatches
+
+  def _matches_line(self, line):
+    '''
+    Returns True if line satisfies a text test.
+
+    :line: string configuration line
+    '''
+    match = self.regex.search(line)
+    return match is not None and match.group(1) == self.expected
+
+  def incremental_result(self, config, diff, previous_result):
+    '''
+    Returns result of a text test after a configuration change, or None if
+    previous_result still holds.  A passing test only needs a full
+    re-evaluation when a removed line satisfied it; a failing test can only
+    start passing through an added line (confirmed by a re-evaluation when
+    the diff lines are not exactly the lines text tests read, see
+    ConfigDiff.exact_lines).  Tests with other quantifiers are re-evaluated
+    when a line their pattern finds was added or removed.
+
+    :config: current configuration object
+    :diff: netaudit.config.ConfigDiff from the previous configuration
+    :previous_result: boolean result for the previous configuration
+    '''
+    if not self.scannable:
+      search = self.regex.search
+      for lines in (diff.removed_lines, diff.added_lines):
+        if any(search(line) is not None for line in lines):
+          return self.evaluate(config)[0]
+      return None
+    if previous_result:
+      if any(self._matches_line(line) for line in diff.removed_lines):
+        return self.evaluate(config)[0]
+      return None
+    if any(self._matches_line(line) for line in diff.added_lines):
+      if diff.exact_lines:
+        return True
+      return self.evaluate(config)[0]
+    return None
+
+  def affected_by(self, diff, previous_message=None):
+    '''
+    Returns True if a hierarchical test may change result after a
+    configuration change.  Parents and children always belong to the same
+    top level section, so only changed sections containing a line that
+    matches the first pattern matter.  A previous message is stale when
+    lines it refers to have moved.
+
+    :diff: netaudit.config.ConfigDiff from the previous configuration
+    :previous_message: message of the previous result
+    '''
+    if diff.identical or not self.is_hierarchical:
+      return False
+    if previous_message is not None:
+      line_numbers = [int(num) for num in LINE_NUMBER_RE.findall(
+        previous_message)]
+      if not line_numbers or max(line_numbers) >= diff.first_changed_line:
+        return True
+    search = self.regex[0].search
+    return any(search(line) for line in diff.section_lines())
 
   @property
   def last_message(self):
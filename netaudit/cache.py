@@ -0,0 +1,193 @@
+'''Module for caching test results between audits'''
+
+import json
+import time
+import sqlite3
+import hashlib
+
+from .config import content_hash
+
+# Bump when a change to evaluation can give a different result for the same
+# configuration and test definition, so earlier cached results are ignored
+ENGINE_VERSION = 1
+
+# Number of results kept before the least recently used are evicted
+DEFAULT_MAX_ENTRIES = 1000000
+# Fraction of max_entries left after an eviction, so results are evicted in
+# batches rather than a few on every store
+EVICT_TO = 0.9
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+  config_hash TEXT NOT NULL,
+  test_hash TEXT NOT NULL,
+  result INTEGER NOT NULL,
+  message TEXT,
+  used REAL NOT NULL,
+  PRIMARY KEY (config_hash, test_hash)
+)
+'''
+
+INDEX = 'CREATE INDEX IF NOT EXISTS results_used ON results (used)'
+
+
+def config_hash(config):
+  '''
+  Returns content hash of config, using the hash cached on ConfigFile
+  objects when available.
+
+  :config: a configuration object as defined in netaudit.config
+  '''
+  cached = getattr(config, 'hash', None)
+  if cached is not None:
+    return cached
+  return content_hash(config.contents)
+
+
+def test_hash(test, engine):
+  '''
+  Returns hex digest identifying a resolved test definition, the engine
+  that evaluates it (for hierarchical tests) and ENGINE_VERSION.
+
+  :test: netaudit.audit.TestCase object
+  :engine: string name of the engine building the hierarchy
+  '''
+  definition = [test.name, test.command, test.pattern, test.expected,
+                test.type, test.quantifier,
+                engine if test.is_hierarchical else None, ENGINE_VERSION]
+  encoded = json.dumps(definition, sort_keys=True).encode('utf-8')
+  return hashlib.sha1(encoded).hexdigest()
+
+
+
+class ResultCache(object):
+  '''
+  Test results stored in a SQLite database, keyed by configuration content
+  hash and test definition hash.  A configuration that has not changed
+  since its last audit is answered from the cache without being evaluated.
+  The least recently used results are evicted once max_entries is exceeded,
+  down to EVICT_TO of it.  Rows are counted when the cache is opened and
+  then tracked as results are stored, so results stored by other processes
+  on the same database are only seen at the next count and max_entries may
+  be exceeded until then.
+  '''
+  def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+    '''
+    :path: string name of the database file, ':memory:' for a cache that
+      only lives as long as this object
+    :max_entries: maximum number of results kept
+    '''
+    self.path = path
+    self.max_entries = max_entries
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self._test_hashes = {}
+    self._connection = sqlite3.connect(path, timeout=60)
+    self._connection.execute(SCHEMA)
+    self._connection.execute(INDEX)
+    self._connection.commit()
+    self._count = self._count_rows()
+
+  def _count_rows(self):
+    '''Returns number of results in the database'''
+    return self._connection.execute(
+      'SELECT COUNT(*) FROM results').fetchone()[0]
+
+  def close(self):
+    '''Closes the database'''
+    self._connection.close()
+
+  def _plan_hashes(self, plan):
+    '''
+    Returns tuple of test hashes for the tests of plan, in order.  Plans are
+    immutable, so the hashes are computed once per plan.
+
+    :plan: netaudit.audit.TestPlan object
+    '''
+    hashes = self._test_hashes.get(plan)
+    if hashes is None:
+      hashes = tuple(test_hash(test, plan.engine) for test in plan.tests)
+      self._test_hashes[plan] = hashes
+    return hashes
+
+  def lookup(self, plan, config):
+    '''
+    Returns dict of TestCase to cached (result, message) for the tests of
+    plan that have a result for config, and counts hits and misses.
+
+    :plan: netaudit.audit.TestPlan object
+    :config: a configuration object as defined in netaudit.config
+    '''
+    digest = config_hash(config)
+    rows = self._connection.execute(
+      'SELECT test_hash, result, message FROM results WHERE config_hash = ?',
+      (digest,))
+    stored = dict((row[0], (bool(row[1]), row[2])) for row in rows)
+    found = {}
+    for test, key in zip(plan.tests, self._plan_hashes(plan)):
+      if key in stored:
+        found[test] = stored[key]
+    if found:
+      self._connection.execute(
+        'UPDATE results SET used = ? WHERE config_hash = ?',
+        (time.time(), digest))
+      self._connection.commit()
+    self.hits += len(found)
+    self.misses += len(plan.tests) - len(found)
+    return found
+
+  def store(self, plan, config, results):
+    '''
+    Saves results for config and evicts the least recently used results
+    beyond max_entries.  Errored results are not saved.
+
+    :plan: netaudit.audit.TestPlan object the results come from
+    :config: a configuration object as defined in netaudit.config
+    :results: iterable of (TestCase, TestResult) tuples
+    '''
+    digest = config_hash(config)
+    hashes = dict(zip(plan.tests, self._plan_hashes(plan)))
+    used = time.time()
+    rows = [(digest, hashes[test], int(bool(res.result)), res.message, used)
+            for test, res in results if res.result is not None]
+    self._connection.executemany(
+      'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)', rows)
+    # Replaced rows are counted too, which only makes the count recheck
+    # sooner
+    self._count += len(rows)
+    if self._count > self.max_entries:
+      self._count = self._count_rows()
+    if self._count > self.max_entries:
+      excess = self._count - int(self.max_entries * EVICT_TO)
+      self._connection.execute(
+        'DELETE FROM results WHERE rowid IN '
+        '(SELECT rowid FROM results ORDER BY used LIMIT ?)', (excess,))
+      self._count -= excess
+      self.evictions += excess
+    self._connection.commit()
+
+  def record(self, hits=0, misses=0, evictions=0):
+    '''
+    Adds counts from another cache object on the same database, such as one
+    opened by a worker process.
+
+    :hits: number of cache hits
+    :misses: number of cache misses
+    :evictions: number of evicted results
+    '''
+    self.hits += hits
+    self.misses += misses
+    self.evictions += evictions
+
+  @property
+  def counts(self):
+    '''Returns tuple of hits, misses and evictions'''
+    return (self.hits, self.misses, self.evictions)
+
+  def report(self):
+    '''Returns string summary of cache hits and misses'''
+    total = self.hits + self.misses
+    rate = 100.0 * self.hits / total if total else 0.0
+    return ('Result cache: %d hits, %d misses (%.1f%% hit rate), %d evicted' %
+            (self.hits, self.misses, rate, self.evictions))
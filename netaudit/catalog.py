@@ -0,0 +1,441 @@
+'''Module for reading test definition files (test catalogs)'''
+
+import os
+import re
+import glob
+import errno
+import pickle
+import hashlib
+import tempfile
+
+import yaml
+try:
+  from yaml import CSafeLoader as SafeLoader
+except ImportError:
+  from yaml import SafeLoader
+
+try:
+  STRING_TYPES = (str, unicode)
+except NameError:
+  STRING_TYPES = (str,)
+
+from . import exceptions as E
+from .quantifier import parse_quantifier
+
+# Bump when the cached form of a catalog changes, so old cache files are
+# ignored
+CATALOG_CACHE_VERSION = 1
+
+REQUIRED_KEYS = ('match', 'expected')
+
+# Top level keys of a test definition file
+TEST_ITEMS = 'TestItems'
+TEST_GROUPS = 'TestGroups'
+INCLUDE = 'Include'
+
+INCLUDE_RE = re.compile(r'^%s\s*:' % INCLUDE, re.MULTILINE)
+
+# Block mapping key, plain or quoted, followed by an optional inline value
+KEY_RE = re.compile(
+  r'^(?P<key>[A-Za-z_][\w.\-/ ]*?|\'(?:[^\']|\'\')*\'|"[^"\\]*")'
+  r'\s*:(?:\s+(?P<value>.*?))?\s*$')
+LIST_ITEM_RE = re.compile(r'^-\s+(?P<value>.*?)\s*$')
+COMMENT_RE = re.compile(r'(?:^|\s+)#.*$')
+
+# Plain scalars that YAML does not load as strings
+NON_STRING_WORDS = frozenset(('y', 'n', 'yes', 'no', 'true', 'false', 'on',
+                              'off', 'null'))
+
+CATALOG_EXTENSIONS = ('.yaml', '.yml')
+
+
+def parse_catalog(stream):
+  '''
+  Returns validated test definitions parsed from YAML, using the libyaml
+  loader when PyYAML was built with it.
+
+  :stream: string, bytes or file object with YAML text
+  '''
+  catalog = yaml.load(stream, Loader=SafeLoader)
+  validate_catalog(catalog)
+  return catalog
+
+
+def validate_catalog(catalog):
+  '''
+  Raises InvalidTestDefinitionError if catalog does not have the structure
+  TestFile expects: TestItems mapping item names to tests, each test with
+  match and expected, and TestGroups mapping group names to lists.
+
+  :catalog: object parsed from a test definition file
+  '''
+  if not isinstance(catalog, dict) or not any(
+      key in catalog for key in (TEST_ITEMS, TEST_GROUPS, INCLUDE)):
+    raise E.InvalidTestDefinitionError(
+      'Test definitions must have TestItems, TestGroups or Include.')
+  if not isinstance(catalog.get(TEST_ITEMS, {}), dict):
+    raise E.InvalidTestDefinitionError('TestItems must be a mapping.')
+  includes = catalog.get(INCLUDE, [])
+  if not isinstance(includes, list):
+    includes = [includes]
+  if not all(isinstance(include, STRING_TYPES) for include in includes):
+    raise E.InvalidTestDefinitionError(
+      'Include must be a file name, pattern or list of them.')
+  for item, tests in catalog.get(TEST_ITEMS, {}).items():
+    if not isinstance(tests, dict):
+      raise E.InvalidTestDefinitionError(
+        'Test item %s must map test names to tests.' % item)
+    for name, test in tests.items():
+      if not isinstance(test, dict):
+        raise E.InvalidTestDefinitionError(
+          'Test %s in %s must be a mapping.' % (name, item))
+      missing = [key for key in REQUIRED_KEYS if key not in test]
+      if missing:
+        raise E.InvalidTestDefinitionError(
+          'Test %s in %s is missing %s.' % (name, item, ', '.join(missing)))
+      try:
+        parse_quantifier(test.get('quantifier'))
+      except ValueError as error:
+        raise E.InvalidTestDefinitionError(
+          'Test %s in %s: %s' % (name, item, error))
+  groups = catalog.get(TEST_GROUPS, {})
+  if not isinstance(groups, dict) or not all(
+      isinstance(tests, list) for tests in groups.values()):
+    raise E.InvalidTestDefinitionError(
+      'TestGroups must map group names to lists of test names.')
+
+
+def cache_file_name(cache_dir, file_name):
+  '''
+  Returns name of the cache file for a test definition file.
+
+  :cache_dir: string directory holding cache files
+  :file_name: string name of the test definition file
+  '''
+  key = os.path.abspath(file_name).encode('utf-8')
+  return os.path.join(cache_dir, hashlib.sha1(key).hexdigest() + '.pickle')
+
+
+def _read_cache(cache_name):
+  '''
+  Returns dict stored in a cache file, or None if it is missing, unreadable
+  or from another CATALOG_CACHE_VERSION.
+
+  :cache_name: string name of the cache file
+  '''
+  try:
+    with open(cache_name, 'rb') as file_stream:
+      entry = pickle.load(file_stream)
+  except Exception: # pylint: disable=broad-except
+    return None
+  if not isinstance(entry, dict) or entry.get(
+      'version') != CATALOG_CACHE_VERSION:
+    return None
+  return entry
+
+
+def _write_cache(cache_name, entry):
+  '''
+  Writes a cache file atomically, so concurrent readers never see a partial
+  file.  Failures are ignored; the catalog is then parsed again next time.
+
+  :cache_name: string name of the cache file
+  :entry: dict to store
+  '''
+  cache_dir = os.path.dirname(cache_name)
+  try:
+    os.makedirs(cache_dir)
+  except OSError as error:
+    if error.errno != errno.EEXIST:
+      return
+  try:
+    handle, temp_name = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    with os.fdopen(handle, 'wb') as file_stream:
+      pickle.dump(entry, file_stream, pickle.HIGHEST_PROTOCOL)
+    os.rename(temp_name, cache_name)
+  except (IOError, OSError):
+    pass
+
+
+def load_catalog(file_name, cache_dir):
+  '''
+  Returns validated test definitions from file_name, reusing the parsed
+  catalog stored in cache_dir while the file is unchanged.  Modification
+  time and size are checked first; if they differ the file is hashed, and
+  the YAML is only parsed again when its contents changed.
+
+  :file_name: string name of the test definition file
+  :cache_dir: string directory holding cache files
+  '''
+  cache_name = cache_file_name(cache_dir, file_name)
+  entry = _read_cache(cache_name)
+  stat = os.stat(file_name)
+  stamp = (stat.st_mtime, stat.st_size)
+  if entry is not None and entry['stamp'] == stamp:
+    return entry['catalog']
+  with open(file_name, 'rb') as file_stream:
+    data = file_stream.read()
+  digest = hashlib.sha1(data).hexdigest()
+  if entry is not None and entry['hash'] == digest:
+    catalog = entry['catalog']
+  else:
+    catalog = parse_catalog(data)
+  _write_cache(cache_name, {'version': CATALOG_CACHE_VERSION,
+                            'stamp': stamp, 'hash': digest,
+                            'catalog': catalog})
+  return catalog
+
+
+def _unquote(key):
+  '''Returns a key matched by KEY_RE as YAML loads it'''
+  if key[:1] == "'":
+    return key[1:-1].replace("''", "'")
+  if key[:1] == '"':
+    return key[1:-1]
+  return key
+
+
+def _include_value(value):
+  '''Returns an inline include value without quotes, or None if it is not
+  a single plain or quoted scalar'''
+  value = COMMENT_RE.sub('', value)
+  if value[:1] in ('[', '{', '&', '*', '!', '|', '>'):
+    return None
+  match = KEY_RE.match(value + ':')
+  if match is not None and match.group('key') == value:
+    return _unquote(value)
+  if value and value[:1] not in ('"', "'") and ': ' not in value:
+    return value
+  return None
+
+
+def scan_catalog(text):
+  '''
+  Returns dict with the item names and test names of each item, the
+  TestGroups text and the includes of a test definition file, read from
+  its layout without building the test definitions.  Returns None if the
+  file uses YAML this scan does not follow (flow collections, anchors,
+  tabs, keys YAML would not load as strings); it must then be parsed.
+
+  :text: string with YAML text
+  '''
+  items = {}
+  group_lines = []
+  includes = []
+  section = None
+  item = None
+  indents = [None, None]
+  for number, line in enumerate(text.split('\n')):
+    stripped = line.strip()
+    if not stripped or stripped[:1] == '#':
+      continue
+    if line[:1] == '\t' or (number and stripped in ('---', '...')):
+      return None
+    if stripped == '---':
+      continue
+    indent = len(line) - len(line.lstrip(' '))
+    if indent == 0 and not (section == INCLUDE and line[:1] == '-'):
+      match = KEY_RE.match(line)
+      if match is None:
+        return None
+      section = _unquote(match.group('key'))
+      value = COMMENT_RE.sub('', match.group('value') or '')
+      indents = [None, None]
+      if section == TEST_GROUPS:
+        group_lines.append(line)
+      if not value:
+        continue
+      if section == INCLUDE:
+        include = _include_value(value)
+        if include is None:
+          return None
+        includes.append(include)
+      elif section in (TEST_ITEMS, TEST_GROUPS):
+        return None
+      continue
+    if section == TEST_GROUPS:
+      group_lines.append(line)
+      continue
+    if section == INCLUDE:
+      match = LIST_ITEM_RE.match(stripped)
+      include = _include_value(match.group('value')) if match else None
+      if include is None:
+        return None
+      includes.append(include)
+      continue
+    if section != TEST_ITEMS:
+      continue
+    if indents[0] is None:
+      indents[0] = indent
+    if indent < indents[0]:
+      return None
+    depth = 0 if indent == indents[0] else 1
+    if depth == 1:
+      if indents[1] is None:
+        indents[1] = indent
+      if indent > indents[1]:
+        continue
+      if indent < indents[1]:
+        return None
+    match = KEY_RE.match(stripped)
+    if match is None:
+      return None
+    key = match.group('key')
+    if key[:1] not in ('"', "'") and key.lower() in NON_STRING_WORDS:
+      return None
+    key = _unquote(key)
+    if depth == 0:
+      if match.group('value'):
+        return None
+      item = key
+      items[item] = []
+      indents[1] = None
+    else:
+      items[item].append(key)
+  return {TEST_ITEMS: items, TEST_GROUPS: '\n'.join(group_lines),
+          INCLUDE: includes}
+
+
+def expand_include(base_file, include):
+  '''
+  Returns sorted list of files named by an include: a file name, a glob
+  pattern or a directory (every .yaml and .yml file in it), relative to the
+  directory of the including file.
+
+  :base_file: string name of the including file
+  :include: string include from the file
+  '''
+  path = os.path.join(os.path.dirname(base_file), include)
+  if os.path.isdir(path):
+    return sorted(os.path.join(path, name) for name in os.listdir(path)
+                  if os.path.splitext(name)[1] in CATALOG_EXTENSIONS)
+  if glob.has_magic(path):
+    return sorted(glob.glob(path))
+  if not os.path.isfile(path):
+    raise E.InvalidTestDefinitionError(
+      'Included file %s (from %s) does not exist.' % (include, base_file))
+  return [path]
+
+
+
+class CatalogIndex(object):
+  '''
+  Index of a test catalog split over several files with Include.  Building
+  the index reads every file but only loads the TestGroups; test items are
+  parsed when tests from them are needed, one file at a time.
+
+  Included files come before the file including them and are included
+  once.  A test defined in several files is taken from the last one, so a
+  file can override the tests it includes.
+  '''
+  def __init__(self, file_name, cache_dir=None, text=None):
+    '''
+    :file_name: string name of the top test definition file
+    :cache_dir: optional string directory of parsed catalog cache files
+    :text: optional string contents of file_name, if already read
+    '''
+    self.cache_dir = cache_dir
+    self.files = []
+    self.groups = {}
+    # Item name to test name to position of the defining files in
+    # self.files
+    self.tests = {}
+    self._parsed = {}
+    self._merged = set()
+    self._items = {}
+    self._origin = {}
+    self._add(os.path.abspath(file_name), text, set())
+
+  def _add(self, file_name, text, seen):
+    '''
+    Indexes file_name after the files it includes.
+
+    :file_name: string absolute file name
+    :text: string contents, or None to read the file
+    :seen: set of file names already indexed
+    '''
+    if file_name in seen:
+      return
+    seen.add(file_name)
+    if text is None:
+      with open(file_name) as file_stream:
+        text = file_stream.read()
+    layout = scan_catalog(text)
+    if layout is None:
+      catalog = self._parse(file_name, text)
+      groups = catalog.get(TEST_GROUPS, {})
+      items = dict((item, list(tests))
+                   for item, tests in catalog.get(TEST_ITEMS, {}).items())
+      includes = catalog.get(INCLUDE, [])
+      if not isinstance(includes, list):
+        includes = [includes]
+    else:
+      catalog = None
+      groups = {}
+      if layout[TEST_GROUPS]:
+        groups = parse_catalog(layout[TEST_GROUPS])[TEST_GROUPS] or {}
+      items = layout[TEST_ITEMS]
+      includes = layout[INCLUDE]
+    for include in includes:
+      for included in expand_include(file_name, include):
+        self._add(os.path.abspath(included), None, seen)
+    position = len(self.files)
+    self.files.append(file_name)
+    if catalog is not None:
+      self._parsed[position] = catalog
+    self.groups.update(groups)
+    for item, tests in items.items():
+      item_tests = self.tests.setdefault(item, {})
+      for test in tests:
+        item_tests.setdefault(test, []).append(position)
+
+  def _parse(self, file_name, text=None):
+    '''
+    Returns parsed and validated catalog of one file.
+
+    :file_name: string file name
+    :text: optional string contents of the file
+    '''
+    if self.cache_dir is not None:
+      return load_catalog(file_name, self.cache_dir)
+    if text is None:
+      with open(file_name) as file_stream:
+        text = file_stream.read()
+    return parse_catalog(text)
+
+  def load(self, items, test_names=None):
+    '''
+    Parses the files defining test_names in items and returns list of
+    (item name, dict of tests) for items seen for the first time.  The
+    dicts are updated in place when later calls parse more files.
+
+    :items: list of item names, e.g. Default and the config_version chain
+    :test_names: list of test names, None for every test of the items
+    '''
+    positions = set()
+    new_items = []
+    for item in items:
+      if item not in self.tests:
+        continue
+      if item not in self._items:
+        self._items[item] = {}
+        new_items.append((item, self._items[item]))
+      item_tests = self.tests[item]
+      names = item_tests if test_names is None else test_names
+      for name in names:
+        positions.update(item_tests.get(name, ()))
+    for position in sorted(positions - self._merged):
+      catalog = self._parsed.pop(position, None)
+      if catalog is None:
+        catalog = self._parse(self.files[position])
+      self._merged.add(position)
+      for item, tests in catalog.get(TEST_ITEMS, {}).items():
+        merged = self._items.get(item)
+        if merged is None:
+          merged = self._items[item] = {}
+          new_items.append((item, merged))
+        for name, test in tests.items():
+          if self._origin.get((item, name), -1) <= position:
+            merged[name] = test
+            self._origin[(item, name)] = position
+    return new_items
@@ -0,0 +1,165 @@
+'''Command line interface for auditing configuration files'''
+
+import os
+import sys
+import argparse
+import itertools
+
+from . import exceptions as E
+from .audit import TestFile
+from .hooks import AuditProfiler
+from .config import ENGINES, DEFAULT_ENGINE
+from .regex import BACKENDS, DEFAULT_BACKEND
+from .cache import ResultCache, DEFAULT_MAX_ENTRIES
+from .fleet import FleetAuditor, expand_sources
+from .memo import SectionMemo
+from .store import ResultStore
+from .writers import WRITERS
+
+
+def parse_args(argv=None):
+  '''
+  Returns parsed command line arguments.
+
+  :argv: list of argument strings, defaults to sys.argv[1:]
+  '''
+  parser = argparse.ArgumentParser(
+    prog='netaudit',
+    description='Audit configuration files against a test definition file.')
+  parser.add_argument('tests', help='test definition file (YAML)')
+  parser.add_argument('configs', nargs='+',
+                      help='configuration files, directories or glob '
+                           'patterns to audit')
+  parser.add_argument('-g', '--group', required=True, action='append',
+                      help='test group to run; repeat to run several groups '
+                           'with shared tests evaluated once, or "all"')
+  parser.add_argument('-c', '--config-version', action='append', default=[],
+                      help='config version to resolve tests for; repeat in '
+                           'order of precedence')
+  parser.add_argument('-j', '--jobs', type=int, default=None,
+                      help='number of worker processes (default: one per '
+                           'CPU)')
+  parser.add_argument('--shards', type=int, default=None,
+                      help='split each large configuration across this '
+                           'many worker processes; configurations are then '
+                           'audited one at a time')
+  parser.add_argument('--engine', choices=sorted(ENGINES),
+                      default=DEFAULT_ENGINE,
+                      help='engine building the hierarchy for config tests '
+                           '(default: %(default)s)')
+  parser.add_argument('--regex-backend', choices=sorted(BACKENDS),
+                      default=DEFAULT_BACKEND,
+                      help='regex backend compiling text test patterns; re2 '
+                           'matches in linear time but must be installed '
+                           '(default: %(default)s)')
+  parser.add_argument('--regex-budget', type=float, metavar='SECONDS',
+                      default=TestFile.regex_budget,
+                      help='seconds a test with a pattern prone to '
+                           'catastrophic backtracking may run per '
+                           'configuration before it is reported as errored '
+                           '(default: %(default)s)')
+  parser.add_argument('--mmap', action='store_true',
+                      help='memory-map configuration files instead of '
+                           'reading them into memory')
+  parser.add_argument('--bytes', action='store_true',
+                      help='match text tests against configuration bytes '
+                           'as read, without decoding them')
+  parser.add_argument('--catalog-cache', metavar='DIR', default=None,
+                      help='directory caching the parsed test definition '
+                           'file between runs')
+  parser.add_argument('--cache', metavar='PATH', default=None,
+                      help='SQLite database of results reused for '
+                           'configurations that have not changed')
+  parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_ENTRIES,
+                      help='maximum number of cached results (default: '
+                           '%(default)s)')
+  parser.add_argument('--section-memo', action='store_true',
+                      help='reuse outcomes of config tests on top level '
+                           'sections identical to ones already audited')
+  parser.add_argument('-f', '--format', choices=sorted(WRITERS),
+                      default='text',
+                      help='output format (default: %(default)s)')
+  parser.add_argument('-o', '--output', default=None,
+                      help='file to write results to as they are produced '
+                           '(default: standard output)')
+  parser.add_argument('--store', metavar='PATH', default=None,
+                      help='compact result store file to add the results '
+                           'to, replacing earlier results of the same '
+                           'configurations')
+  parser.add_argument('--profile', type=int, metavar='N', default=None,
+                      help='print the N slowest tests and time per phase; '
+                           'audits run in a single process')
+  return parser.parse_args(argv)
+
+
+def main(argv=None):
+  '''
+  Runs an audit from the command line and writes each configuration's
+  results as soon as they are available.  Returns exit status 1 if any test
+  failed or errored.  Tests with risky patterns are reported on stderr
+  before the audit starts.
+
+  :argv: list of argument strings, defaults to sys.argv[1:]
+  '''
+  args = parse_args(argv)
+  tests = TestFile(args.tests, catalog_cache_dir=args.catalog_cache)
+  tests.config_engine = args.engine
+  tests.regex_backend = args.regex_backend
+  tests.regex_budget = args.regex_budget
+  if args.config_version:
+    tests.config_version = args.config_version
+  cache = None
+  if args.cache is not None:
+    cache = ResultCache(args.cache, args.cache_size)
+  store = None
+  if args.store is not None:
+    store = ResultStore()
+    if os.path.exists(args.store):
+      store = ResultStore.load(args.store)
+  memo = SectionMemo() if args.section_memo else None
+  profiler = AuditProfiler() if args.profile is not None else None
+  group = args.group[0] if len(args.group) == 1 else args.group
+  for test in tests.compile_plan(group, profiler).tests:
+    if test.risky:
+      budget = ('no regex budget' if test.budget is None else
+                'a regex budget of %gs' % test.budget)
+      sys.stderr.write('Warning: test %s has a pattern prone to catastrophic '
+                       'backtracking; it runs with %s.\n' % (test.name,
+                                                             budget))
+  auditor = FleetAuditor(tests, group, jobs=args.jobs,
+                         mapped=args.mmap, cache=cache, hooks=profiler,
+                         shards=args.shards, memo=memo, binary=args.bytes)
+  try:
+    sources = itertools.chain.from_iterable(
+      [expand_sources(pattern) for pattern in args.configs])
+  except E.ConfigNotFoundError as error:
+    sys.stderr.write('netaudit: error: %s\n' % error)
+    return 2
+  output = open(args.output, 'w') if args.output else sys.stdout
+  failed = False
+  try:
+    writer = WRITERS[args.format](output)
+    for audit_result in auditor.run(sources):
+      failed = failed or not all(result.result
+                                 for result in audit_result.results)
+      writer.write_audit(audit_result)
+      if store is not None:
+        store.add_audit(audit_result)
+    writer.close()
+  finally:
+    if output is not sys.stdout:
+      output.close()
+  if store is not None:
+    store.save(args.store)
+  if profiler is not None:
+    sys.stderr.write(profiler.report(args.profile) + '\n')
+  if memo is not None:
+    sys.stderr.write(memo.report() + '\n')
+  if cache is not None:
+    sys.stderr.write(cache.report() + '\n')
+    cache.close()
+  return 1 if failed else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,418 @@
+'''
+Module for pulling configurations from many devices concurrently with
+asyncio.  Needs Python 3.5 or later; SSH also needs the asyncssh package.
+'''
+
+import re
+import asyncio
+import collections
+
+from .config import ConfigFile
+from .connect import PROMPT_TAIL, READ_SIZE, learn_prompt
+from .connect import PROMPT_BYTES_RE as PROMPT_RE
+from .connect import USERNAME_BYTES_RE as USERNAME_RE
+from .connect import PASSWORD_BYTES_RE as PASSWORD_RE
+
+SSH = 'ssh'
+TELNET = 'telnet'
+DEFAULT_PORTS = {SSH: 22, TELNET: 23}
+
+# Number of device sessions kept in flight at once
+DEFAULT_CONCURRENCY = 200
+# Seconds a device may stay silent while logging in or answering a command
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_COMMANDS = ('terminal length 0', 'show running-config')
+
+# Telnet commands (RFC 854) used to refuse every option a device offers
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+
+CollectResult = collections.namedtuple('CollectResult', ('connection',
+                                                         'outputs', 'error'))
+
+
+def config_from_result(result):
+  '''
+  Returns ConfigFile in bytes mode with the output of the last command of
+  a result, named after the device so audit results report it.
+
+  :result: CollectResult without an error
+  '''
+  config = ConfigFile().from_bytes(result.outputs[-1])
+  config.file_name = result.connection.hostname
+  return config
+
+
+
+class TelnetFilter(object):
+  '''
+  Removes telnet commands from received data and collects the replies
+  refusing each option.  Commands split across reads are completed by the
+  next call.
+  '''
+  def __init__(self):
+    self._pending = bytearray()
+    self._subnegotiation = False
+
+  def feed(self, data):
+    '''
+    Returns tuple of the data without telnet commands and the bytes to send
+    back to the device.
+
+    :data: bytes received
+    '''
+    data = self._pending + data
+    self._pending = bytearray()
+    text = bytearray()
+    replies = bytearray()
+    index = 0
+    size = len(data)
+    while index < size:
+      byte = data[index]
+      if byte != IAC:
+        if not self._subnegotiation:
+          text.append(byte)
+        index += 1
+        continue
+      if index + 1 >= size:
+        self._pending = data[index:]
+        break
+      command = data[index + 1]
+      if command == IAC:
+        if not self._subnegotiation:
+          text.append(IAC)
+        index += 2
+      elif command in (DO, DONT, WILL, WONT):
+        if index + 2 >= size:
+          self._pending = data[index:]
+          break
+        if command == DO:
+          replies.extend((IAC, WONT, data[index + 2]))
+        elif command == WILL:
+          replies.extend((IAC, DONT, data[index + 2]))
+        index += 3
+      else:
+        self._subnegotiation = (command == SB or
+                                (self._subnegotiation and command != SE))
+        index += 2
+    return bytes(text), bytes(replies)
+
+
+
+class TelnetSession(object):
+  '''
+  Shell on a device reached by telnet, read and written as bytes.
+  '''
+  def __init__(self, reader, writer):
+    '''
+    :reader: asyncio.StreamReader of the connection
+    :writer: asyncio.StreamWriter of the connection
+    '''
+    self._reader = reader
+    self._writer = writer
+    self._filter = TelnetFilter()
+    self.needs_login = True
+
+  @classmethod
+  async def open(cls, connection, port):
+    '''
+    Returns TelnetSession connected to a device.
+
+    :connection: netaudit.connect.Connection object
+    :port: TCP port
+    '''
+    reader, writer = await asyncio.open_connection(connection.hostname, port)
+    return cls(reader, writer)
+
+  async def read(self):
+    '''Returns bytes received, empty once the device closes the session'''
+    while True:
+      data = await self._reader.read(READ_SIZE)
+      if not data:
+        return b''
+      text, replies = self._filter.feed(data)
+      if replies:
+        self._writer.write(replies)
+      if text:
+        return text
+
+  def write(self, data):
+    '''
+    Sends bytes to the device.
+
+    :data: bytes
+    '''
+    self._writer.write(data.replace(b'\xff', b'\xff\xff'))
+
+  async def close(self):
+    '''Closes the session'''
+    self._writer.close()
+
+
+
+class SSHSession(object):
+  '''
+  Interactive shell on a device reached by SSH, read and written as bytes.
+  '''
+  def __init__(self, client, process):
+    '''
+    :client: asyncssh.SSHClientConnection object
+    :process: asyncssh.SSHClientProcess running the shell
+    '''
+    self._client = client
+    self._process = process
+    self.needs_login = False
+
+  @classmethod
+  async def open(cls, connection, port):
+    '''
+    Returns SSHSession with a shell on a device.  Host keys are accepted
+    without checking, as SSH_Client does.
+
+    :connection: netaudit.connect.Connection object
+    :port: TCP port
+    '''
+    try:
+      import asyncssh
+    except ImportError:
+      msg = 'Collecting over SSH needs the asyncssh package.'
+      raise ValueError(msg)
+    client = await asyncssh.connect(
+      connection.hostname, port=port, username=connection.username,
+      password=connection.password, known_hosts=None, client_keys=None)
+    try:
+      process = await client.create_process(term_type='vt100', encoding=None)
+    except Exception:
+      client.close()
+      raise
+    return cls(client, process)
+
+  async def read(self):
+    '''Returns bytes received, empty once the device closes the session'''
+    return await self._process.stdout.read(READ_SIZE)
+
+  def write(self, data):
+    '''
+    Sends bytes to the device.
+
+    :data: bytes
+    '''
+    self._process.stdin.write(data)
+
+  async def close(self):
+    '''Closes the session'''
+    self._client.close()
+    await self._client.wait_closed()
+
+
+SESSIONS = {
+  SSH: SSHSession,
+  TELNET: TelnetSession,
+}
+
+
+
+class Collector(object):
+  '''
+  Runs commands on many devices concurrently from one process and returns
+  their output as bytes.  Each device gets its own session; at most
+  concurrency sessions are open at once.  Output is read until the device
+  prompt reappears, so a command costs its round trip instead of a fixed
+  wait, and timeout only bounds a device that stops sending.  Output still
+  arriving is never cut off, however long it takes.  The prompt is learned
+  as the device name followed by any mode, so entering configuration mode
+  costs nothing, and is learned again after each command, so a changed
+  hostname costs one timeout instead of one per later command.
+  '''
+  def __init__(self, commands=DEFAULT_COMMANDS, protocol=SSH,
+               concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+               prompt=None, eol=b'\n'):
+    '''
+    :commands: iterable of command strings run in order on every device;
+      the output of the last one is the configuration
+    :protocol: SSH or TELNET
+    :concurrency: maximum number of sessions open at once
+    :timeout: seconds a device may stay silent while logging in or
+      answering a command
+    :prompt: optional bytes regex matching the end of the device prompt;
+      by default the device name seen after login is matched in any mode
+    :eol: bytes sent after each command
+    '''
+    if protocol not in SESSIONS:
+      msg = ('"%s" is not a valid protocol.  Use one of: %s.' %
+             (protocol, ', '.join(sorted(SESSIONS))))
+      raise ValueError(msg)
+    self.commands = tuple(commands)
+    self.protocol = protocol
+    self.concurrency = concurrency
+    self.timeout = timeout
+    self.prompt = re.compile(prompt) if prompt is not None else None
+    self.eol = eol
+
+  def run(self, connections):
+    '''
+    Returns list of CollectResult, one per connection in input order,
+    running an event loop until every device is done.
+
+    :connections: iterable of netaudit.connect.Connection objects
+    '''
+    loop = asyncio.new_event_loop()
+    try:
+      return loop.run_until_complete(self.collect(connections))
+    finally:
+      loop.close()
+
+  async def collect(self, connections):
+    '''
+    Returns list of CollectResult, one per connection in input order.
+    Sessions are started as others finish, so at most concurrency are open
+    at once whatever the number of devices.
+
+    :connections: iterable of netaudit.connect.Connection objects
+    '''
+    pending = iter(enumerate(connections))
+    results = {}
+    async def worker():
+      for index, connection in pending:
+        results[index] = await self.collect_one(connection)
+    workers = [worker() for _ in range(max(self.concurrency, 1))]
+    await asyncio.gather(*workers)
+    return [results[index] for index in range(len(results))]
+
+  async def collect_one(self, connection):
+    '''
+    Returns CollectResult of running the commands on one device.  Errors
+    are reported in the result instead of raised, so one unreachable device
+    does not stop the others.
+
+    :connection: netaudit.connect.Connection object
+    '''
+    port = connection.port or DEFAULT_PORTS[self.protocol]
+    try:
+      session = await asyncio.wait_for(
+        SESSIONS[self.protocol].open(connection, port), self.timeout)
+    except Exception as error: # pylint: disable=broad-except
+      return CollectResult(connection, [], _describe(error))
+    outputs = []
+    try:
+      prompt = await self._login(session, connection)
+      for command in self.commands:
+        command = command.encode('utf-8')
+        session.write(command + self.eol)
+        output = await self._read_until(session, prompt,
+                                        quiet=self._quiet_prompt)
+        prompt = self._learn_prompt(output, prompt)
+        outputs.append(_clean_output(output, command, prompt))
+    except Exception as error: # pylint: disable=broad-except
+      return CollectResult(connection, outputs, _describe(error))
+    finally:
+      await session.close()
+    return CollectResult(connection, outputs, None)
+
+  async def _login(self, session, connection):
+    '''
+    Returns compiled regex matching the end of the device prompt, after
+    answering any username and password prompts.
+
+    :session: open TelnetSession or SSHSession
+    :connection: netaudit.connect.Connection object
+    '''
+    patterns = [self.prompt or PROMPT_RE]
+    if session.needs_login:
+      patterns.extend((USERNAME_RE, PASSWORD_RE))
+    output = await self._read_until(session, *patterns)
+    if session.needs_login and USERNAME_RE.search(output[-PROMPT_TAIL:]):
+      session.write((connection.username or '').encode('utf-8') + self.eol)
+      output = await self._read_until(session, PASSWORD_RE, *patterns[:1])
+    if session.needs_login and PASSWORD_RE.search(output[-PROMPT_TAIL:]):
+      session.write((connection.password or '').encode('utf-8') + self.eol)
+      output = await self._read_until(session, patterns[0])
+    return self._learn_prompt(output, PROMPT_RE)
+
+  @property
+  def _quiet_prompt(self):
+    '''
+    Compiled regex of any prompt ending the output of a command once the
+    device stays silent, or None when the prompt was configured.
+    '''
+    return PROMPT_RE if self.prompt is None else None
+
+  def _learn_prompt(self, output, default):
+    '''
+    Returns compiled regex matching the end of the device prompt: the
+    configured one, else the device name that ends output in any mode, else
+    default.
+
+    :output: bytes read from the device
+    :default: compiled regex used when output does not end with a prompt
+    '''
+    if self.prompt is not None:
+      return self.prompt
+    pattern = learn_prompt(output)
+    if pattern is None:
+      return default
+    return re.compile(pattern.encode('utf-8'))
+
+  async def _read_until(self, session, *patterns, quiet=None):
+    '''
+    Returns bytes read until the end of the output matches one of patterns.
+    Raises asyncio.TimeoutError if the device sends nothing for timeout
+    before it gets there, unless the output then ends with quiet, and
+    EOFError if it closes the session first.
+
+    :session: open TelnetSession or SSHSession
+    :patterns: compiled bytes regexes
+    :quiet: optional compiled bytes regex also ending the output, but only
+      after timeout of silence
+    '''
+    output = bytearray()
+    while True:
+      try:
+        data = await asyncio.wait_for(session.read(), self.timeout)
+      except asyncio.TimeoutError:
+        if quiet is None or not quiet.search(bytes(output[-PROMPT_TAIL:])):
+          raise
+        return bytes(output)
+      if not data:
+        raise EOFError('Session closed before the prompt.')
+      output.extend(data)
+      tail = bytes(output[-PROMPT_TAIL:])
+      if any(pattern.search(tail) for pattern in patterns):
+        return bytes(output)
+
+
+def _clean_output(output, command, prompt):
+  '''
+  Returns output of a command without the echoed command, the trailing
+  prompt and carriage returns.
+
+  :output: bytes read after sending command
+  :command: bytes command sent
+  :prompt: compiled regex matching the end of the prompt
+  '''
+  output = output.replace(b'\r\n', b'\n')
+  first, newline, rest = output.partition(b'\n')
+  if newline and first.strip().endswith(command.strip()):
+    output = rest
+  match = prompt.search(output)
+  if match is not None:
+    # Learned prompts also match the line break before them, which stays
+    start = match.start()
+    if output[start:start + 1] == b'\n':
+      start += 1
+    output = output[:start]
+  if output.endswith(b'\n'):
+    output = output[:-1]
+  return output
+
+
+def _describe(error):
+  '''Returns string describing why collecting from a device failed'''
+  if isinstance(error, asyncio.TimeoutError):
+    return 'Timed out waiting for the device.'
+  return str(error) or error.__class__.__name__
@@ -1,29 +1,498 @@
 '''Module for loading and parsing configuration files'''
 
-from ciscoconfparse import CiscoConfParse
+import re
+import mmap
+import hashlib
+import collections
+from array import array
+
+from .tree import ConfigTree, COMMENT, BANNER_RE, BANNER_STR_RE
+
+try:
+  TEXT_TYPE = unicode
+except NameError:
+  TEXT_TYPE = str
+
+# Encoding of memory-mapped files; on Python 2 lines stay byte strings
+ENCODING = None if str is bytes else 'utf-8'
+
+# Encoding of configurations and patterns in bytes mode
+BYTES_ENCODING = 'utf-8'
+
+
+def to_bytes(value):
+  '''
+  Returns value encoded with BYTES_ENCODING if it is text; lists and tuples
+  are encoded item by item and anything else is returned unchanged.
+
+  :value: text, bytes, list of them or any other value
+  '''
+  if isinstance(value, TEXT_TYPE):
+    return value.encode(BYTES_ENCODING)
+  if isinstance(value, (list, tuple)):
+    return type(value)(to_bytes(item) for item in value)
+  return value
+
+
+def to_text(value):
+  '''
+  Returns value decoded with BYTES_ENCODING if it is bytes (on Python 3),
+  otherwise value unchanged.
+
+  :value: text or bytes
+  '''
+  if isinstance(value, bytes) and not isinstance(value, str):
+    return value.decode(BYTES_ENCODING, 'replace')
+  return value
+
+
+def newline(contents):
+  '''Returns newline of the same type as contents'''
+  return b'\n' if isinstance(contents, bytes) else '\n'
+
+
+def content_hash(contents):
+  '''
+  Returns hex digest identifying configuration contents.
+
+  :contents: string, bytes or buffer with configuration text
+  '''
+  if isinstance(contents, TEXT_TYPE):
+    contents = contents.encode('utf-8')
+  return hashlib.sha1(contents).hexdigest()
+
+
+LINE_SPLIT_RE = re.compile('(?:\r\n|\n|\r)')
+
+# Engines that build the hierarchy used by config tests
+CISCOCONFPARSE = 'ciscoconfparse'
+NATIVE = 'native'
+DEFAULT_ENGINE = CISCOCONFPARSE
+
+
+def _ciscoconfparse(lines):
+  '''
+  Returns CiscoConfParse object built from lines.  The library is imported
+  on first use as it is slow to import.
+
+  :lines: list of configuration lines
+  '''
+  from ciscoconfparse import CiscoConfParse
+  return CiscoConfParse(lines)
+
+
+ENGINES = {
+  CISCOCONFPARSE: _ciscoconfparse,
+  NATIVE: ConfigTree,
+}
+
+# CiscoConfParse releases (from, up to but excluding) whose parent, child
+# and line number rules the native engine and split_sections follow.  Later
+# releases strip comment lines, nest banners differently and number lines
+# in other ways.
+CISCOCONFPARSE_VERSIONS = ((1, 2, 39), (1, 3))
+
+# Installed CiscoConfParse version, looked up on first use
+_CISCOCONFPARSE_VERSION = []
+
+
+def ciscoconfparse_version():
+  '''
+  Returns tuple of integers of the installed CiscoConfParse release, or
+  None if it is not installed or its version is unknown.
+  '''
+  if not _CISCOCONFPARSE_VERSION:
+    numbers = []
+    try:
+      try:
+        from importlib.metadata import version
+        installed = version(CISCOCONFPARSE)
+      except ImportError:
+        from pkg_resources import get_distribution
+        installed = get_distribution(CISCOCONFPARSE).version
+      for part in installed.split('.'):
+        if not part.isdigit():
+          break
+        numbers.append(int(part))
+    except Exception: # pylint: disable=broad-except
+      pass
+    _CISCOCONFPARSE_VERSION.append(tuple(numbers) or None)
+  return _CISCOCONFPARSE_VERSION[0]
+
+
+def ciscoconfparse_supported():
+  '''
+  Returns True if the installed CiscoConfParse is a release in
+  CISCOCONFPARSE_VERSIONS.
+  '''
+  installed = ciscoconfparse_version()
+  first, last = CISCOCONFPARSE_VERSIONS
+  return installed is not None and first <= installed < last
+
+
+def evaluates_by_section(engine):
+  '''
+  Returns True if engine builds the same hierarchy from each top level
+  section (see split_sections) as from the whole configuration, and
+  numbers only non-blank lines, so hierarchical tests can be evaluated
+  section by section and their line numbers shifted by the non-blank lines
+  before the section.  True for the native engine and supported
+  CiscoConfParse releases.
+
+  :engine: string name of an engine in ENGINES
+  '''
+  if engine == NATIVE:
+    return True
+  return engine == CISCOCONFPARSE and ciscoconfparse_supported()
+
+
+def build_tree(lines, engine=DEFAULT_ENGINE):
+  '''
+  Returns configuration hierarchy built by engine.
+
+  :lines: list of configuration lines
+  :engine: string name of an engine in ENGINES
+  '''
+  if engine not in ENGINES:
+    msg = ('"%s" is not a valid engine.  Use one of: %s.' %
+           (engine, ', '.join(sorted(ENGINES))))
+    raise ValueError(msg)
+  return ENGINES[engine](lines)
+
+
+def parse_contents(contents, engine=DEFAULT_ENGINE):
+  '''
+  Returns CiscoConfParse object (or the hierarchy of another engine) built
+  from configuration text.
+
+  :contents: string with configuration text
+  :engine: string name of an engine in ENGINES
+  '''
+  return build_tree(LINE_SPLIT_RE.split(contents), engine)
+
+
+def _banner_delimiter(line):
+  '''
+  Returns delimiter closing the multi-line banner line starts, or None if
+  line does not start one.
+
+  :line: string configuration line
+  '''
+  if BANNER_RE.search(line) is None:
+    return None
+  match = BANNER_STR_RE.search(line)
+  if match is None or len(line.split(match.group('bchar'))) > 2:
+    return None
+  return match.group('bchar')
+
+
+def split_sections(lines):
+  '''
+  Returns list of top level sections, each a tuple of lines: a config line
+  without indentation followed by every indented, blank or comment line
+  below it.  Multi-line banners are kept in one section up to their closing
+  delimiter, or up to a comment line without indentation, where hierarchy
+  engines end a banner that is not closed.  A banner line inside a banner,
+  including its closing line, starts a banner of its own.  A parent and its
+  children are always in the same section.
+
+  :lines: list of configuration lines
+  '''
+  sections = []
+  section = []
+  # Delimiters of the banners still open
+  delimiters = []
+  for line in lines:
+    if delimiters:
+      section.append(line)
+      if line[:1] == COMMENT:
+        delimiters = []
+      else:
+        delimiters = [delimiter for delimiter in delimiters
+                      if delimiter not in line.strip()]
+    elif section and (not line.strip() or line[:1].isspace() or
+                      line.lstrip()[:1] == COMMENT):
+      section.append(line)
+      continue
+    else:
+      if section:
+        sections.append(tuple(section))
+      section = [line]
+    delimiter = _banner_delimiter(line)
+    if delimiter is not None:
+      delimiters.append(delimiter)
+  if section:
+    sections.append(tuple(section))
+  return sections
+
+
+class LineIndex(object):
+  '''
+  Line access over configuration text held in a string or memory map.  Line
+  start offsets are kept in a compact array that is only built the first
+  time a line is looked up by number; iterating and substring searches work
+  directly on the buffer.  Lines are split on newlines like str.split.
+  '''
+  __slots__ = ('buffer', 'encoding', '_newline', '_offsets')
+
+  def __init__(self, buffer, encoding=None):
+    '''
+    :buffer: string, bytes or mmap with configuration text
+    :encoding: encoding used to decode lines of byte buffers, None returns
+      lines as stored
+    '''
+    self.buffer = buffer
+    self.encoding = encoding
+    self._newline = '\n' if isinstance(buffer, (str, TEXT_TYPE)) else b'\n'
+    self._offsets = None
+
+  @property
+  def offsets(self):
+    '''Returns array of line start offsets'''
+    if self._offsets is None:
+      buffer = self.buffer
+      typecode = 'I' if len(buffer) < 2 ** 32 else 'L'
+      offsets = array(typecode, [0])
+      find = buffer.find
+      newline = self._newline
+      pos = find(newline)
+      while pos != -1:
+        offsets.append(pos + 1)
+        pos = find(newline, pos + 1)
+      self._offsets = offsets
+    return self._offsets
+
+  def _decode(self, line):
+    '''Returns line decoded with the index encoding'''
+    if self.encoding is None:
+      return line
+    return line.decode(self.encoding, 'replace')
+
+  def _encode(self, text):
+    '''Returns text encoded to match the buffer'''
+    if self.encoding is None or not isinstance(text, TEXT_TYPE):
+      return text
+    return text.encode(self.encoding)
+
+  def __len__(self):
+    return len(self.offsets)
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return [self[i] for i in range(*index.indices(len(self)))]
+    offsets = self.offsets
+    if index < 0:
+      index += len(offsets)
+    start = offsets[index]
+    if index + 1 < len(offsets):
+      end = offsets[index + 1] - 1
+    else:
+      end = len(self.buffer)
+    return self._decode(self.buffer[start:end])
+
+  def __iter__(self):
+    buffer = self.buffer
+    find = buffer.find
+    newline = self._newline
+    start = 0
+    end = find(newline)
+    while end != -1:
+      yield self._decode(buffer[start:end])
+      start = end + 1
+      end = find(newline, start)
+    yield self._decode(buffer[start:])
+
+  def containing(self, literal):
+    '''
+    Yields each line that contains literal, in order and at most once.
+
+    :literal: string without newlines
+    '''
+    buffer = self.buffer
+    find = buffer.find
+    newline = self._newline
+    literal = self._encode(literal)
+    pos = find(literal)
+    while pos != -1:
+      start = buffer.rfind(newline, 0, pos) + 1
+      end = find(newline, pos)
+      if end == -1:
+        yield self._decode(buffer[start:])
+        return
+      yield self._decode(buffer[start:end])
+      pos = find(literal, end)
+
+
+
+def iter_lines(config):
+  '''
+  Returns iterable of configuration lines: a lazy LineIndex for
+  memory-mapped configurations, otherwise the split contents.
+
+  :config: a configuration object
+  '''
+  if getattr(config, 'mapped', False) is True:
+    return config.lines
+  contents = config.contents
+  return contents.split(newline(contents))
+
+
+def is_binary(config):
+  '''
+  Returns True if config is in bytes mode: its contents and lines are bytes
+  and text tests match them with patterns compiled as bytes.
+
+  :config: a configuration object
+  '''
+  return getattr(config, 'binary', False) is True
+
+
+def tree_lines(config):
+  '''
+  Returns list of configuration lines split the way hierarchy engines
+  expect.
+
+  :config: a configuration object
+  '''
+  split = getattr(config, '_tree_lines', None)
+  if split is not None:
+    return split()
+  return LINE_SPLIT_RE.split(to_text(config.contents))
+
 
 
 class ConfigFile(object):
   '''
   Represents a configuration file to be loaded and parsed.
   '''
-  def __init__(self, file_name=None):
+  def __init__(self, file_name=None, mapped=False, binary=False):
     '''
     :file_name: string name of a configuration file to load
+    :mapped: boolean, memory-map the file instead of reading it into a
+      string; lines are then read from the map as they are needed
+    :binary: boolean, bytes mode: contents and lines are kept as bytes as
+      read, and text tests match them with patterns compiled as bytes.
+      Only hierarchy engines see decoded lines.
     '''
-    self.contents = ''
+    self.binary = binary
+    self.contents = b'' if binary else ''
+    self.file_name = None
     if file_name is not None:
-      self.load(file_name)
+      self.load(file_name, mapped)
+
+  @property
+  def contents(self):
+    '''
+    Returns configuration text.  For memory-mapped files the text is only
+    read into a string when first requested.
+    '''
+    if self._contents is None:
+      self._contents = self.lines._decode(self._buffer[:])
+    return self._contents
+
+  @contents.setter
+  def contents(self, contents):
+    '''
+    Sets configuration text and drops any cached parse of the previous
+    contents.
+
+    :contents: string with configuration text
+    '''
+    self._set_buffer(contents, None)
+
+  def _set_buffer(self, contents, buffer):
+    '''
+    Replaces configuration text and resets everything derived from it.
+
+    :contents: string with configuration text, or None if held in buffer
+    :buffer: mmap with configuration text, or None
+    '''
+    self._contents = contents
+    self._buffer = buffer
+    self.mapped = buffer is not None
+    self._lines = None
+    self._hash = None
+    self._trees = {}
+
+  @property
+  def lines(self):
+    '''Returns LineIndex over the configuration text'''
+    if self._lines is None:
+      if self.mapped:
+        self._lines = LineIndex(self._buffer,
+                                None if self.binary else ENCODING)
+      else:
+        self._lines = LineIndex(self.contents)
+    return self._lines
 
-  def load(self, file_name):
+  @property
+  def hash(self):
+    '''Returns content hash of the loaded configuration'''
+    if self._hash is None:
+      buffer = self._buffer if self.mapped else self.contents
+      self._hash = content_hash(buffer)
+    return self._hash
+
+  @property
+  def parse_tree(self):
+    '''
+    Returns CiscoConfParse object for the loaded configuration.  The parse is
+    built once and reused until the contents change.
+    '''
+    return self.tree(CISCOCONFPARSE)
+
+  def tree(self, engine=DEFAULT_ENGINE):
+    '''
+    Returns configuration hierarchy built by engine.  Each engine's tree is
+    built once and reused until the contents change.
+
+    :engine: string name of an engine in netaudit.config.ENGINES
+    '''
+    key = self.hash
+    cached = self._trees.get(engine)
+    if cached is None or cached[0] != key:
+      cached = (key, build_tree(self._tree_lines(), engine))
+      self._trees[engine] = cached
+    return cached[1]
+
+  def _tree_lines(self):
+    '''Returns list of lines split the way hierarchy engines expect'''
+    if not self.mapped:
+      return LINE_SPLIT_RE.split(to_text(self.contents))
+    lines = []
+    for line in self.lines:
+      line = to_text(line)
+      if line.endswith('\r'):
+        line = line[:-1]
+      lines.extend(line.split('\r'))
+    return lines
+
+  def load(self, file_name, mapped=False):
     '''
     Loads a configuration file
 
     :file_name: string name of a configuration file to load
+    :mapped: boolean, memory-map the file instead of reading it
     '''
-    with open(file_name) as file_stream:
-      contents = ''.join(file_stream.readlines())
+    if mapped:
+      with open(file_name, 'rb') as file_stream:
+        try:
+          buffer = mmap.mmap(file_stream.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+          # Empty files cannot be mapped
+          buffer = None
+      if buffer is not None:
+        self._set_buffer(None, buffer)
+        self.file_name = file_name
+        return
+    if self.binary:
+      file_stream = open(file_name, 'rb')
+    else:
+      file_stream = open(file_name)
+    with file_stream:
+      contents = file_stream.read()
     self.contents = contents
+    self.file_name = file_name
 
   def from_string(self, config_string):
     '''
@@ -34,6 +503,71 @@ class ConfigFile(object):
     self.contents = config_string
     return self
 
+  def from_bytes(self, config_bytes):
+    '''
+    Loads a configuration as received from a collector and switches to
+    bytes mode, so it is never decoded for text tests.
+
+    :config_bytes: bytes, bytearray or memoryview with configuration text
+    '''
+    if isinstance(config_bytes, memoryview):
+      config_bytes = config_bytes.tobytes()
+    self.binary = True
+    self.contents = bytes(config_bytes)
+    return self
+
+
+
+class ConfigDiff(object):
+  '''
+  Differences between two versions of a configuration, as needed to decide
+  which tests must be re-evaluated after a change.
+  '''
+  def __init__(self, old_contents, new_contents):
+    '''
+    :old_contents: string with previous configuration text
+    :new_contents: string with current configuration text
+    '''
+    # Lines split the way hierarchy engines split them; on configurations
+    # with carriage returns text tests read lines that still end with them
+    old_contents = to_text(old_contents)
+    new_contents = to_text(new_contents)
+    self.exact_lines = '\r' not in old_contents and '\r' not in new_contents
+    old_lines = LINE_SPLIT_RE.split(old_contents)
+    new_lines = LINE_SPLIT_RE.split(new_contents)
+    old_count = collections.Counter(old_lines)
+    new_count = collections.Counter(new_lines)
+    self.removed_lines = old_count - new_count
+    self.added_lines = new_count - old_count
+    old_sections = collections.Counter(split_sections(old_lines))
+    new_sections = collections.Counter(split_sections(new_lines))
+    self.changed_sections = list((old_sections - new_sections) +
+                                 (new_sections - old_sections))
+    # Number of non-blank lines before the first difference; parsed trees
+    # number lines the same way, so lower line numbers did not move
+    self.first_changed_line = None
+    unchanged = 0
+    for old_line, new_line in zip(old_lines, new_lines):
+      if old_line != new_line:
+        self.first_changed_line = unchanged
+        break
+      if old_line.strip():
+        unchanged += 1
+    else:
+      if len(old_lines) != len(new_lines):
+        self.first_changed_line = unchanged
+
+  @property
+  def identical(self):
+    '''Returns True if both configurations have the same lines'''
+    return self.first_changed_line is None
+
+  def section_lines(self):
+    '''Yields every line of the changed sections'''
+    for section in self.changed_sections:
+      for line in section:
+        yield line
+
 
 
 class CiscoConfig(ConfigFile):
@@ -45,7 +579,4 @@ class CiscoConfig(ConfigFile):
     '''
     Returns CiscoConfParse object from loaded configuration.
     '''
-    contents = self.contents
-    if isinstance(contents, str):
-      contents = contents.split('\n')
-    return CiscoConfParse(contents)
+    return self.parse_tree
@@ -1,10 +1,152 @@
 '''Module for connecting to a switch and pulling a configuration'''
 
+import os
 import re
+import socket
+import select
 
 import paramiko
 import telnetlib
-from time import sleep
+
+from . import exceptions as E
+from .config import ConfigFile, to_bytes, to_text
+
+# Prompt of a device ready for a command, such as "switch#", "router>" or
+# "switch(config)#"; the name group is what a learned prompt keeps
+PROMPT_RE = re.compile(
+  r'(?:\A|[\r\n])(?P<name>[\w.\-@/:~]{1,64})(?:\([\w.\-]*\))?[#>$] ?\Z')
+LEARNED_PROMPT = r'(?:\A|[\r\n])%s(?:\([\w.\-]*\))?[#>$] ?\Z'
+USERNAME_RE = re.compile(r'(?i)(?:user ?name|login): ?\Z')
+PASSWORD_RE = re.compile(r'(?i)password: ?\Z')
+
+# The same prompts for output read as bytes (see netaudit.collect)
+PROMPT_BYTES_RE = re.compile(PROMPT_RE.pattern.encode('ascii'))
+USERNAME_BYTES_RE = re.compile(USERNAME_RE.pattern.encode('ascii'))
+PASSWORD_BYTES_RE = re.compile(PASSWORD_RE.pattern.encode('ascii'))
+
+# Characters at the end of a response searched for the prompt, so each read
+# costs the same however long the response is
+PROMPT_TAIL = 256
+
+# Bytes requested from a channel per read
+READ_SIZE = 65536
+
+
+def _compile(pattern, binary=False):
+  '''
+  Returns pattern compiled for responses of the client: as bytes in binary
+  mode on Python 3.
+
+  :pattern: string regex pattern
+  :binary: boolean, responses are bytes
+  '''
+  if binary and not isinstance(pattern, bytes):
+    pattern = pattern.encode('utf-8')
+  return re.compile(pattern)
+
+
+def learn_prompt(response):
+  '''
+  Returns pattern matching the prompt that ends response, keeping the
+  device name and allowing any mode, or None if response does not end with
+  a prompt.
+
+  :response: string or bytes read from a device
+  '''
+  binary = isinstance(response, bytes) and not isinstance(response, str)
+  match = _compile(PROMPT_RE.pattern, binary).search(response[-PROMPT_TAIL:])
+  if match is None:
+    return None
+  name = match.group('name')
+  if binary:
+    name = name.decode('utf-8')
+  return LEARNED_PROMPT % re.escape(name)
+
+
+
+class OutputBuffer(object):
+  '''
+  Response of a device accumulated as it arrives.  Chunks are kept as bytes
+  in a list and joined once, and only the last PROMPT_TAIL bytes are
+  searched for the prompt, so reading costs time linear in the size of the
+  response however many chunks it arrives in.  Channels return bytes on
+  Python 3, so the response is only decoded once complete, which also keeps
+  characters split across chunks whole.
+  '''
+  def __init__(self, binary=False, spool=None):
+    '''
+    :binary: boolean, getvalue returns bytes instead of text
+    :spool: optional file object opened for writing bytes; chunks are
+      written to it instead of kept, and getvalue is then empty
+    '''
+    self.binary = binary
+    self.spool = spool
+    self.size = 0
+    self.tail = b''
+    self._chunks = []
+
+  def feed(self, data):
+    '''
+    Adds data received.
+
+    :data: bytes, or text which is encoded
+    '''
+    data = to_bytes(data)
+    if self.spool is not None:
+      self.spool.write(data)
+    else:
+      self._chunks.append(data)
+    self.size += len(data)
+    if len(data) >= PROMPT_TAIL:
+      self.tail = data[-PROMPT_TAIL:]
+    else:
+      self.tail = (self.tail + data)[-PROMPT_TAIL:]
+
+  def getvalue(self):
+    '''
+    Returns response received as bytes in binary mode and as text
+    otherwise, empty if it was spooled.
+    '''
+    response = b''.join(self._chunks)
+    return response if self.binary else to_text(response)
+
+
+def _command_config(client, command, timeout=None, file_name=None):
+  '''
+  Returns ConfigFile with the response of a client to command, as the device
+  sent it.  With file_name the response is written to that file as it
+  arrives and the file is memory-mapped, so even a multi-megabyte
+  configuration is never held in memory whole.  Raises
+  IncompleteOutputError if the response did not end at the prompt (see
+  last_complete), so a truncated configuration is never audited.  A
+  partial file is removed, also when reading fails with another error.
+
+  :client: SSH_Client or Telnet_Client
+  :command: string command showing a configuration
+  :timeout: maximum number of seconds the device may stay silent
+  :file_name: optional string name of a file to spool the response to
+  '''
+  complete = False
+  try:
+    if file_name is None:
+      response = client.send_command(command, timeout)[0]
+    else:
+      with open(file_name, 'wb') as spool:
+        client.send_command(command, timeout, spool)
+    complete = client.last_complete
+  finally:
+    # A partial file is never left behind, whatever stopped the read
+    if not complete and file_name is not None and os.path.exists(file_name):
+      os.remove(file_name)
+  if not complete:
+    msg = ('Output of "%s" from %s stopped before the prompt.' %
+           (command, client.connection.hostname))
+    raise E.IncompleteOutputError(msg)
+  if file_name is not None:
+    return ConfigFile(file_name, mapped=True, binary=client.binary)
+  if client.binary:
+    return ConfigFile().from_bytes(response)
+  return ConfigFile().from_string(response)
 
 
 class Connection(object):
@@ -29,10 +171,28 @@ class SSH_Client(object):
   '''SSH Client'''
 
   def __init__(self, connection, max_sess_tries=3, cmd_timeout=3,
-               open_sess_timeout=5, ssh_eol='\n', max_buffer_length=9999,
-               max_buffer_cycle=10, default_port=22):
+               open_sess_timeout=5, ssh_eol='\n', max_buffer_length=READ_SIZE,
+               max_buffer_cycle=10, default_port=22, binary=False,
+               prompt=None, idle_timeout=None):
+    '''
+    :max_buffer_length: bytes requested per read
+    :max_buffer_cycle: unused, responses are read until the prompt
+    :binary: boolean, keep responses as the bytes received so a
+      configuration can be audited in bytes mode without decoding it (see
+      netaudit.config.ConfigFile.from_bytes)
+    :prompt: optional regex matching the end of the device prompt; by
+      default the first prompt seen is learned (see learn_prompt)
+    :idle_timeout: optional seconds without data that end a response once
+      it has started, for devices whose prompt is not recognised
+    '''
     self.connection = connection
+    self.binary = binary
+    self.prompt = prompt
+    self.learned_prompt = None
     self._ssh_channel = None
+    # Whether the last response ended at the prompt, or after IDLE_TIMEOUT
+    # of silence, rather than when the channel closed or stayed silent
+    self.last_complete = None
     self.MAX_SESS_TRIES = max_sess_tries
     self.CMD_TIMEOUT = cmd_timeout
     self.OPEN_SESS_TIMEOUT = open_sess_timeout
@@ -40,23 +200,30 @@ class SSH_Client(object):
     self.MAX_BUFFER_LENGTH = max_buffer_length
     self.MAX_BUFFER_CYCLE = max_buffer_cycle
     self.DEFAULT_PORT = default_port
+    self.IDLE_TIMEOUT = idle_timeout
     self._last_response = None
 
 
   @property
   def client(self):
     '''
-    Provides paramiko SSH client.
+    Provides paramiko SSH client, connecting again if the transport is no
+    longer active.  Nothing is sent to check the transport; is_alive does.
     '''
     try:
-      self._client.get_transport().send_ignore()
-    except (EOFError, AttributeError):
-      ssh = paramiko.SSHClient(**self.connection.ssh_opts)
+      active = self._client.get_transport().is_active()
+    except AttributeError:
+      active = False
+    if not active:
+      self._close_client()
+      conf = self.connection
+      ssh = paramiko.SSHClient(**conf.ssh_opts)
       ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
       ssh.connect(
-        self.connection.hostname,
-        username=self.connection.username,
-        password=self.connection.password,
+        conf.hostname,
+        port=conf.port if conf.port is not None else self.DEFAULT_PORT,
+        username=conf.username,
+        password=conf.password,
       )
       self._client = ssh
     return self._client
@@ -67,23 +234,28 @@ class SSH_Client(object):
 
   def connect(self):
     '''
-    Attempts to connect ssh client.
+    Attempts to connect ssh client and returns the banner, read until the
+    device prompt.
     '''
     self.client
-    sleep(self.CMD_TIMEOUT)
     self._last_response = self._read()
     return self.last_response
 
   @property
   def channel(self):
+    '''
+    Provides shell channel, opened on the connected client.  The client is
+    only replaced, and the old one closed, when opening the shell fails.
+    '''
     if self._ssh_channel is None:
-      self.client = None
       for i in range(self.MAX_SESS_TRIES):
         try:
           t = self.client.get_transport()
           self._ssh_channel = t.open_session(timeout=self.OPEN_SESS_TIMEOUT)
           self._ssh_channel.invoke_shell()
         except (EOFError, paramiko.ssh_exception.SSHException):
+          self._ssh_channel = None
+          self._close_client()
           if i == self.MAX_SESS_TRIES - 1:
             raise
           continue
@@ -94,22 +266,93 @@ class SSH_Client(object):
   def channel(self, channel):
     self._ssh_channel = channel
 
-  def _read(self):
+  def is_alive(self):
+    '''
+    Returns True if the transport and shell are still open, probing the
+    transport with an ignore message so a dropped session is noticed.
+    '''
+    try:
+      self._client.get_transport().send_ignore()
+    except (EOFError, AttributeError, socket.error,
+            paramiko.ssh_exception.SSHException):
+      return False
+    chan = self._ssh_channel
+    return (chan is not None and not chan.closed and
+            not chan.exit_status_ready())
+
+  def close(self):
+    '''
+    Closes the shell and the transport.
+    '''
+    if self._ssh_channel is not None:
+      self._ssh_channel.close()
+      self._ssh_channel = None
+    self._close_client()
+
+  def _close_client(self):
+    '''
+    Closes the paramiko client, if any, so it is connected again when next
+    used.
+    '''
+    if getattr(self, '_client', None) is not None:
+      try:
+        self._client.close()
+      except Exception: # pylint: disable=broad-except
+        pass
+      self._client = None
+
+  def _read(self, timeout=None, spool=None):
+    '''
+    Returns tuple of response and error response, read as data arrives
+    until the device prompt ends the response, the channel closes or it is
+    idle for IDLE_TIMEOUT.  The timeout bounds the silence before each
+    chunk, not the whole response, so long output still arriving is never
+    cut off.  Sets last_complete.
+
+    :timeout: maximum number of seconds without data, CMD_TIMEOUT by default
+    :spool: optional file object the response is written to (see
+      OutputBuffer)
+    '''
     chan = self.channel
-    response, err_response = '', ''
-    for i in range(self.MAX_BUFFER_CYCLE):
-      if chan.recv_ready():
-        response += chan.recv(self.MAX_BUFFER_LENGTH)
+    timeout = timeout if timeout is not None else self.CMD_TIMEOUT
+    prompt = _compile(self.prompt or self.learned_prompt or PROMPT_RE.pattern,
+                      binary=True)
+    response = OutputBuffer(self.binary, spool)
+    err_response = OutputBuffer(self.binary)
+    idle = self.IDLE_TIMEOUT is not None
+    self.last_complete = False
+    while timeout > 0:
+      # Silence only ends a response normally when the idle timeout elapses
+      # before the command timeout does
+      idle_wait = (idle and response.size > 0 and
+                   self.IDLE_TIMEOUT <= timeout)
+      chan.settimeout(self.IDLE_TIMEOUT if idle_wait else timeout)
+      try:
+        data = chan.recv(self.MAX_BUFFER_LENGTH)
+      except socket.timeout:
+        self.last_complete = idle_wait
+        break
       if chan.recv_stderr_ready():
-        err_response += chan.recv_stderr(self.MAX_BUFFER_LENGTH)
-    return (response, err_response)
+        err_response.feed(chan.recv_stderr(self.MAX_BUFFER_LENGTH))
+      if not data:
+        break
+      response.feed(data)
+      if prompt.search(response.tail):
+        self.last_complete = True
+        break
+    if self.prompt is None and self.learned_prompt is None:
+      self.learned_prompt = learn_prompt(response.tail)
+    return (response.getvalue(), err_response.getvalue())
 
-  def send_command(self, command, timeout=None):
+  def send_command(self, command, timeout=None, spool=None):
     '''
     Send command to remote host.
 
     :command: String command to send
-    :timeout: Number of seconds to wait for command result
+    :timeout: Maximum number of seconds to wait for more of the command
+      result before giving up on the prompt
+    :spool: optional file object opened for writing bytes; the result is
+      written to it as it arrives instead of returned
     '''
     chan = self.channel
     timeout = timeout if timeout is not None else self.CMD_TIMEOUT
@@ -118,10 +361,21 @@ class SSH_Client(object):
       command += self.SSH_EOL
     if chan.send_ready():
       chan.send(command)
-      sleep(self.CMD_TIMEOUT)
-    self._last_response = self._read()
+    self._last_response = self._read(timeout, spool)
     return self.last_response
 
+  def command_config(self, command='show running-config', timeout=None,
+                     file_name=None):
+    '''
+    Returns netaudit.config.ConfigFile with the result of command.
+
+    :command: String command showing the configuration
+    :timeout: Maximum number of seconds the device may stay silent
+    :file_name: optional file to write the result to as it arrives, which
+      is then memory-mapped instead of read into memory
+    '''
+    return _command_config(self, command, timeout, file_name)
+
   @property
   def last_response(self):
     return self._last_response
@@ -132,9 +386,26 @@ class Telnet_Client(object):
   '''Telnet Client'''
 
   def __init__(self, connection, max_sess_tries=3, cmd_timeout=3,
-               open_sess_timeout=5, telnet_eol='\n', max_buffer_length=9999,
-               max_buffer_cycle=10, default_port=23):
+               open_sess_timeout=5, telnet_eol='\n',
+               max_buffer_length=READ_SIZE, max_buffer_cycle=10,
+               default_port=23, binary=False, prompt=None, idle_timeout=None):
+    '''
+    :max_buffer_cycle: unused, responses are read until the prompt
+    :binary: boolean, keep responses as the bytes received so a
+      configuration can be audited in bytes mode without decoding it (see
+      netaudit.config.ConfigFile.from_bytes)
+    :prompt: optional regex matching the end of the device prompt; by
+      default the first prompt seen is learned (see learn_prompt)
+    :idle_timeout: optional seconds without data that end a response once
+      it has started, for devices whose prompt is not recognised
+    '''
     self.connection = connection
+    self.binary = binary
+    self.prompt = prompt
+    self.learned_prompt = None
+    # Whether the last response ended at the prompt, or after IDLE_TIMEOUT
+    # of silence, rather than when the channel closed or stayed silent
+    self.last_complete = None
     self.MAX_SESS_TRIES = max_sess_tries
     self.CMD_TIMEOUT = cmd_timeout
     self.OPEN_SESS_TIMEOUT = open_sess_timeout
@@ -142,25 +413,73 @@ class Telnet_Client(object):
     self.MAX_BUFFER_LENGTH = max_buffer_length
     self.MAX_BUFFER_CYCLE = max_buffer_cycle
     self.DEFAULT_PORT = default_port
+    self.IDLE_TIMEOUT = idle_timeout
     self._last_response = None
 
   def connect(self):
     '''
-    Connect to Telnet host and return banner and beginning text.
+    Connect to Telnet host and return banner and beginning text, read until
+    a username, password or device prompt.
     '''
     self.client
-    sleep(self.CMD_TIMEOUT)
-    self._last_response = (self.client.read_very_eager(),'')
+    self._last_response = (self._read(None, None, USERNAME_RE, PASSWORD_RE),
+                           b'' if self.binary else '')
     return self.last_response
 
+  def _read(self, timeout=None, spool=None, *patterns):
+    '''
+    Returns response read as data arrives until the device prompt, or one of
+    patterns, ends it, the connection closes or it is idle for
+    IDLE_TIMEOUT.  The timeout bounds the silence before each chunk, not
+    the whole response.  Unlike Telnet.expect, which searches everything
+    read so far after each read, only the end of the response is searched.
+    Sets last_complete.
+
+    :timeout: maximum number of seconds without data, CMD_TIMEOUT by default
+    :spool: optional file object the response is written to (see
+      OutputBuffer)
+    :patterns: compiled regexes of other prompts that end the response
+    '''
+    client = self.client
+    timeout = timeout if timeout is not None else self.CMD_TIMEOUT
+    prompt = self.prompt or self.learned_prompt or PROMPT_RE.pattern
+    expected = [_compile(pattern, binary=True) for pattern in
+                [prompt] + [pattern.pattern for pattern in patterns]]
+    response = OutputBuffer(self.binary, spool)
+    idle = self.IDLE_TIMEOUT is not None
+    self.last_complete = False
+    while True:
+      try:
+        data = client.read_very_eager()
+      except EOFError:
+        break
+      if data:
+        response.feed(data)
+        if any(pattern.search(response.tail) for pattern in expected):
+          self.last_complete = True
+          break
+        continue
+      # Silence only ends a response normally when the idle timeout elapses
+      # before the command timeout does
+      idle_wait = (idle and response.size > 0 and
+                   self.IDLE_TIMEOUT <= timeout)
+      wait = self.IDLE_TIMEOUT if idle_wait else timeout
+      if wait <= 0:
+        break
+      if not select.select([client], [], [], wait)[0]:
+        self.last_complete = idle_wait
+        break
+    if self.prompt is None and self.learned_prompt is None:
+      self.learned_prompt = learn_prompt(response.tail)
+    return response.getvalue()
+
   @property
   def client(self):
     '''
-    Provides telnetlib Telnet client.
+    Provides telnetlib Telnet client, connecting again if it was closed.
+    Nothing is sent to check the connection; is_alive does.
     '''
-    try:
-      self._client.sock.sendall(telnetlib.IAC + telnetlib.NOP)
-    except (EOFError, AttributeError):
+    if not getattr(getattr(self, '_client', None), 'sock', None):
       conf = self.connection
       port = conf.port if conf.port is not None else self.DEFAULT_PORT
       self._client = telnetlib.Telnet(conf.hostname, port,
@@ -177,23 +496,55 @@ class Telnet_Client(object):
     '''
     self._client = client
 
-  def send_command(self, command, timeout=None):
+  def is_alive(self):
+    '''
+    Returns True if the connection is still open, probing it with a telnet
+    NOP so a dropped session is noticed.
+    '''
+    try:
+      self._client.sock.sendall(telnetlib.IAC + telnetlib.NOP)
+    except (EOFError, AttributeError, socket.error):
+      return False
+    return True
+
+  def close(self):
+    '''
+    Closes the connection.
+    '''
+    if getattr(self, '_client', None) is not None:
+      self._client.close()
+      self._client = None
+
+  def send_command(self, command, timeout=None, spool=None):
     '''
     Send command to Telnet host.
 
     :command: command text to send.  If EOL not found, it is appended.
-    :timeout: time to wait for response from command.
+    :timeout: maximum time to wait for more of the response before giving
+      up on the prompt.
+    :spool: optional file object opened for writing bytes; the response is
+      written to it as it arrives instead of returned
     '''
-    response, err_response = '', ''
-    timeout = timeout if timeout is not None else self.CMD_TIMEOUT
+    err_response = b'' if self.binary else ''
     if not re.search(r'%s$' % self.TELNET_EOL, command):
       command += self.TELNET_EOL
-    self.client.write(command)
-    sleep(self.CMD_TIMEOUT)
-    response += self.client.read_very_eager()
+    self.client.write(to_bytes(command))
+    response = self._read(timeout, spool)
     self._last_response = (response, err_response)
     return self.last_response
 
+  def command_config(self, command='show running-config', timeout=None,
+                     file_name=None):
+    '''
+    Returns netaudit.config.ConfigFile with the response to command.
+
+    :command: command text showing the configuration
+    :timeout: maximum time the device may stay silent
+    :file_name: optional file to write the response to as it arrives, which
+      is then memory-mapped instead of read into memory
+    '''
+    return _command_config(self, command, timeout, file_name)
+
   @property
   def last_response(self):
     '''
@@ -208,17 +559,17 @@ if __name__ == '__main__':
   if ctelnet == True:
     conf = Connection('192.168.0.221', username='admin', password='l3tm3in')
     client = Telnet_Client(conf, telnet_eol='\n')
-    print 'connect: ___\n%s\n___' % client.connect()[0]
+    print('connect: ___\n%s\n___' % client.connect()[0])
     if re.search('Password: ', client.last_response[0]):
-      print client.send_command(conf.password)
+      print(client.send_command(conf.password))
     client.send_command('term len 0')
     res = client.send_command('sh ver', 1)
-    print 'result:\n%s\n\nstderr:\n%s\n\n' % (res[0], res[1])
+    print('result:\n%s\n\nstderr:\n%s\n\n' % (res[0], res[1]))
   else:
     conf = Connection('192.168.0.221', username='admin', password='l3tm3in')
     client = SSH_Client(conf)
-    print 'connect: ___\n%s\n___' % client.connect()[0]
+    print('connect: ___\n%s\n___' % client.connect()[0])
     client.send_command('term len 0')
     res = client.send_command('sh ver', 1)
-    print 'result:\n%s\n\nstderr:\n%s\n\n' % (res[0], res[1])
+    print('result:\n%s\n\nstderr:\n%s\n\n' % (res[0], res[1]))
 
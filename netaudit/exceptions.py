@@ -23,3 +23,39 @@ class TestItemNotFoundError(Exception):
 class TestGroupDoesNotExistError(Exception):
   '''Test group was not found in test definition configuration'''
   pass
+
+
+
+class InvalidTestDefinitionError(Exception):
+  '''Test definition file does not have the expected structure'''
+  pass
+
+
+
+class InvalidResultStoreError(Exception):
+  '''Result store file is not in the expected format'''
+  pass
+
+
+
+class RegexBudgetExceededError(Exception):
+  '''Test pattern ran longer than the regex budget of the test'''
+  pass
+
+
+
+class PoolExhaustedError(Exception):
+  '''No pooled session to a device became available in time'''
+  pass
+
+
+
+class IncompleteOutputError(Exception):
+  '''Device output stopped before the device prompt was seen'''
+  pass
+
+
+
+class ConfigNotFoundError(Exception):
+  '''No configuration file was found for a path or glob pattern'''
+  pass
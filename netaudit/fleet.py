@@ -0,0 +1,232 @@
+'''Module for auditing many configuration files in parallel'''
+
+import os
+import glob
+import collections
+import multiprocessing
+
+from . import exceptions as E
+from .config import ConfigFile
+from .cache import ResultCache
+from .memo import SectionMemo
+from .shard import sharded_results
+
+# Number of configurations queued per worker before results are collected
+DEFAULT_BACKLOG = 4
+
+try:
+  STRING_TYPES = (str, unicode)
+except NameError:
+  STRING_TYPES = (str,)
+
+AuditResult = collections.namedtuple('AuditResult', ('source', 'results'))
+
+# Compiled test plan, load options, result cache and section memo of the
+# current worker process, set by _init_worker
+_WORKER_PLAN = None
+_WORKER_MAPPED = False
+_WORKER_CACHE = None
+_WORKER_MEMO = None
+_WORKER_BINARY = False
+
+
+def _init_worker(plan, mapped=False, cache_args=None, memo_args=None,
+                 binary=False):
+  '''
+  Stores the compiled test plan once per worker process.
+
+  :plan: netaudit.audit.TestPlan object
+  :mapped: boolean, memory-map configuration files
+  :cache_args: optional tuple of ResultCache arguments; each worker opens
+    its own connection to the cache database
+  :memo_args: optional tuple of SectionMemo arguments; each worker keeps
+    its own memo
+  :binary: boolean, load configuration files in bytes mode
+  '''
+  # pylint: disable=global-statement
+  global _WORKER_PLAN, _WORKER_MAPPED, _WORKER_CACHE, _WORKER_MEMO
+  global _WORKER_BINARY
+  _WORKER_PLAN = plan
+  _WORKER_MAPPED = mapped
+  _WORKER_CACHE = ResultCache(*cache_args) if cache_args else None
+  _WORKER_MEMO = SectionMemo(*memo_args) if memo_args else None
+  _WORKER_BINARY = binary
+
+
+def _count_deltas(counter, before):
+  '''Returns tuple of what counter.counts added since before, or None'''
+  if counter is None:
+    return None
+  return tuple(now - then for now, then in zip(counter.counts, before))
+
+
+def _audit_worker(source):
+  '''
+  Audits one configuration with the worker's test plan.  Returns tuple of
+  AuditResult and the cache and memo counts it added (None if there is
+  neither), so the parent can report them.
+
+  :source: file name or configuration object
+  '''
+  cache = _WORKER_CACHE
+  memo = _WORKER_MEMO
+  cache_before = cache.counts if cache is not None else None
+  memo_before = memo.counts if memo is not None else None
+  result = audit_config(_WORKER_PLAN, source, _WORKER_MAPPED, cache,
+                        memo=memo, binary=_WORKER_BINARY)
+  if cache is None and memo is None:
+    return result, None
+  return result, (_count_deltas(cache, cache_before),
+                  _count_deltas(memo, memo_before))
+
+
+def audit_config(plan, source, mapped=False, cache=None, hooks=None,
+                 shards=None, memo=None, binary=False):
+  '''
+  Returns AuditResult of running plan against one configuration.
+
+  :plan: netaudit.audit.TestPlan object
+  :source: file name or configuration object as defined in netaudit.config
+  :mapped: boolean, memory-map configuration files
+  :cache: optional netaudit.cache.ResultCache
+  :hooks: optional netaudit.hooks.AuditHooks object
+  :shards: optional number of worker processes to split the configuration
+    across; ignored when hooks are set
+  :memo: optional netaudit.memo.SectionMemo
+  :binary: boolean, load configuration files in bytes mode (see
+    netaudit.config.ConfigFile)
+  '''
+  if isinstance(source, STRING_TYPES):
+    config = ConfigFile(source, mapped=mapped, binary=binary)
+  else:
+    config = source
+    source = getattr(config, 'file_name', None) or config
+  if hooks is None and shards is not None and shards > 1:
+    return AuditResult(source, list(sharded_results(plan, config, shards,
+                                                    cache, memo=memo)))
+  return AuditResult(source, list(plan.results(config, cache, hooks, memo)))
+
+
+def expand_sources(configs):
+  '''
+  Returns iterable of configuration sources.  A string is treated as a
+  directory (every file in it, sorted) or a glob pattern, and raises
+  ConfigNotFoundError when it names no file, so a mistyped path is not
+  mistaken for a clean audit; any other iterable is passed through
+  unchanged.
+
+  :configs: directory name, glob pattern or iterable of file names and
+    configuration objects
+  '''
+  if not isinstance(configs, STRING_TYPES):
+    return configs
+  if os.path.isdir(configs):
+    names = (os.path.join(configs, name)
+             for name in sorted(os.listdir(configs)))
+    sources = [name for name in names if os.path.isfile(name)]
+  else:
+    sources = sorted(glob.glob(configs))
+  if not sources:
+    msg = 'No configuration file found for "%s".' % configs
+    raise E.ConfigNotFoundError(msg)
+  return sources
+
+
+
+class FleetAuditor(object):
+  '''
+  Audits a fleet of configuration files against one test group, sharding
+  the configurations across a pool of worker processes.
+  '''
+  def __init__(self, tests, test_group, jobs=None, backlog=DEFAULT_BACKLOG,
+               mapped=False, cache=None, hooks=None, shards=None,
+               memo=None, binary=False):
+    '''
+    :tests: netaudit.audit.TestFile object
+    :test_group: string name of group to run
+    :jobs: number of worker processes; None uses one per CPU and 1 audits in
+      the calling process
+    :backlog: number of configurations queued per worker; bounds how many
+      results are held in memory at once
+    :mapped: boolean, memory-map configuration files instead of reading them
+      into strings
+    :cache: optional netaudit.cache.ResultCache; worker processes open the
+      same database and their hits and misses are added to this object
+    :hooks: optional netaudit.hooks.AuditHooks object; hooks cannot be shared
+      with worker processes, so configurations are then audited in the
+      calling process
+    :shards: optional number of worker processes each configuration is
+      split across (see netaudit.shard); configurations are then audited
+      one at a time
+    :memo: optional netaudit.memo.SectionMemo; each worker process keeps a
+      memo of its own and its hits and misses are added to this object
+    :binary: boolean, load configuration files in bytes mode so text tests
+      match the bytes as read without decoding them
+    '''
+    self.tests = tests
+    self.test_group = test_group
+    self.jobs = jobs
+    self.backlog = backlog
+    self.mapped = mapped
+    self.cache = cache
+    self.hooks = hooks
+    self.shards = shards
+    self.memo = memo
+    self.binary = binary
+
+  def run(self, configs):
+    '''
+    Yields an AuditResult for each configuration, in input order, as soon as
+    it is available.
+
+    :configs: directory name, glob pattern or iterable of file names and
+      configuration objects
+    '''
+    plan = self.tests.compile_plan(self.test_group, self.hooks)
+    sources = expand_sources(configs)
+    jobs = self.jobs if self.jobs is not None else multiprocessing.cpu_count()
+    cache = self.cache
+    sharded = self.shards is not None and self.shards > 1
+    if jobs <= 1 or self.hooks is not None or sharded:
+      for source in sources:
+        yield audit_config(plan, source, self.mapped, cache, self.hooks,
+                           self.shards, self.memo, self.binary)
+      return
+    cache_args = None
+    if cache is not None:
+      cache_args = (cache.path, cache.max_entries)
+    memo_args = None
+    if self.memo is not None:
+      memo_args = (self.memo.max_sections,)
+    pool = multiprocessing.Pool(
+      jobs, initializer=_init_worker,
+      initargs=(plan, self.mapped, cache_args, memo_args, self.binary))
+    try:
+      max_pending = jobs * max(self.backlog, 1)
+      pending = collections.deque()
+      for source in sources:
+        pending.append(pool.apply_async(_audit_worker, (source,)))
+        if len(pending) >= max_pending:
+          yield self._collect(pending.popleft())
+      while pending:
+        yield self._collect(pending.popleft())
+      pool.close()
+    finally:
+      pool.terminate()
+      pool.join()
+
+  def _collect(self, async_result):
+    '''
+    Returns AuditResult of a worker and adds its counts to self.cache and
+    self.memo.
+
+    :async_result: multiprocessing AsyncResult of _audit_worker
+    '''
+    result, counts = async_result.get()
+    if counts is not None:
+      cache_counts, memo_counts = counts
+      if cache_counts is not None:
+        self.cache.record(*cache_counts)
+      if memo_counts is not None:
+        self.memo.record(*memo_counts)
+    return result
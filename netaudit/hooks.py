@@ -0,0 +1,110 @@
+'''Module for observing audits as they run, e.g. to profile them'''
+
+import collections
+
+# Cost of evaluating one test, reported to AuditHooks.test_finished
+TestTiming = collections.namedtuple('TestTiming', ('name', 'seconds',
+                                                   'lines_scanned',
+                                                   'regex_evaluations'))
+
+
+
+class AuditHooks(object):
+  '''
+  Receives events while an audit runs.  Every method does nothing; subclass
+  and override the events of interest.  Audits run without hooks do not pay
+  for any of this.
+  '''
+  def plan_built(self, plan, seconds):
+    '''
+    Called when TestFile.compile_plan builds a new plan.
+
+    :plan: netaudit.audit.TestPlan object
+    :seconds: float time spent building it
+    '''
+    pass
+
+  def parse_built(self, config, engine, seconds):
+    '''
+    Called when the hierarchy of a configuration is requested.
+
+    :config: a configuration object as defined in netaudit.config
+    :engine: string name of the engine
+    :seconds: float time spent, near zero if the tree was already cached
+    '''
+    pass
+
+  def test_started(self, test):
+    '''
+    Called before a test is evaluated.
+
+    :test: netaudit.audit.TestCase object
+    '''
+    pass
+
+  def test_finished(self, test, test_result, timing):
+    '''
+    Called after a test is evaluated.
+
+    :test: netaudit.audit.TestCase object
+    :test_result: netaudit.audit.TestResult object
+    :timing: TestTiming object
+    '''
+    pass
+
+
+
+class AuditProfiler(AuditHooks):
+  '''
+  Hooks that record the timing of every test and phase, for finding the
+  tests that make an audit slow.
+  '''
+  def __init__(self):
+    self.timings = []
+    self.phases = collections.defaultdict(float)
+
+  def plan_built(self, plan, seconds):
+    self.phases['plan'] += seconds
+
+  def parse_built(self, config, engine, seconds):
+    self.phases['parse'] += seconds
+
+  def test_finished(self, test, test_result, timing):
+    self.timings.append(timing)
+
+  def slowest(self, limit=10):
+    '''
+    Returns list of TestTiming totals per test name, slowest first.
+
+    :limit: maximum number of tests returned, None for all
+    '''
+    totals = collections.OrderedDict()
+    for timing in self.timings:
+      total = totals.get(timing.name)
+      if total is None:
+        totals[timing.name] = timing
+      else:
+        totals[timing.name] = TestTiming(
+          timing.name, total.seconds + timing.seconds,
+          total.lines_scanned + timing.lines_scanned,
+          total.regex_evaluations + timing.regex_evaluations)
+    ordered = sorted(totals.values(), key=lambda total: -total.seconds)
+    return ordered if limit is None else ordered[:limit]
+
+  def report(self, limit=10):
+    '''
+    Returns string report of the slowest tests and the time of each phase.
+
+    :limit: maximum number of tests listed, None for all
+    '''
+    lines = ['Slowest tests:']
+    for timing in self.slowest(limit):
+      lines.append('  %10.6fs  %s  (%d lines, %d regex evaluations)' %
+                   (timing.seconds, timing.name, timing.lines_scanned,
+                    timing.regex_evaluations))
+    total = sum(timing.seconds for timing in self.timings)
+    lines.append('Tests: %.6fs in %d evaluations' % (total,
+                                                      len(self.timings)))
+    for phase in sorted(self.phases):
+      lines.append('Phase %s: %.6fs' % (phase, self.phases[phase]))
+    return '\n'.join(lines)
@@ -0,0 +1,153 @@
+'''Module for reusing hierarchical test outcomes across identical sections'''
+
+import bisect
+import collections
+
+from .config import build_tree, split_sections, tree_lines, content_hash
+
+# Number of distinct sections remembered before the oldest are dropped
+DEFAULT_MAX_SECTIONS = 100000
+
+Section = collections.namedtuple('Section', ('digest', 'lines', 'offset',
+                                             'size'))
+
+
+def config_sections(config):
+  '''
+  Returns list of Section for the top level sections of config: content
+  hash, lines, number of lines hierarchy engines keep before the section
+  and in it.
+
+  :config: a configuration object as defined in netaudit.config
+  '''
+  sections = []
+  offset = 0
+  for lines in split_sections(tree_lines(config)):
+    size = sum(1 for line in lines if line.strip())
+    sections.append(Section(content_hash('\n'.join(lines)), lines, offset,
+                            size))
+    offset += size
+  return sections
+
+
+def outcome_key(test, engine):
+  '''
+  Returns key of what decides the parent outcomes of a hierarchical test:
+  its patterns, expected value and the engine.  Tests that only differ in
+  name or quantifier share outcomes.
+
+  :test: netaudit.audit.TestCase object
+  :engine: string name of an engine in netaudit.config.ENGINES
+  '''
+  return (engine, tuple(test.pattern), test.expected)
+
+
+
+class SectionMemo(object):
+  '''
+  Parent outcomes (see TestCase.parent_outcomes) of hierarchical tests per
+  top level section content.  A parent and its children are always in the
+  same top level section, so a test finds the same outcomes in identical
+  sections of any configuration; only their line numbers move, and they are
+  kept relative to the start of the section.  Sections generated from the
+  same templates across a fleet are then parsed and evaluated once.  Only
+  valid for engines that build the same hierarchy section by section, see
+  netaudit.config.evaluates_by_section.
+  '''
+  def __init__(self, max_sections=DEFAULT_MAX_SECTIONS):
+    '''
+    :max_sections: maximum number of distinct sections remembered
+    '''
+    self.max_sections = max_sections
+    self.hits = 0
+    self.misses = 0
+    self._sections = collections.OrderedDict()
+
+  def outcomes(self, config, tests, engine):
+    '''
+    Returns dict of each test to the list of its parent outcomes on config,
+    in the order TestCase.parent_outcomes gives for the whole configuration.
+    Sections not seen before are parsed together in one tree.
+
+    :config: a configuration object as defined in netaudit.config
+    :tests: iterable of hierarchical netaudit.audit.TestCase objects
+    :engine: string name of an engine in netaudit.config.ENGINES
+    '''
+    tests = [(test, outcome_key(test, engine)) for test in tests]
+    sections = config_sections(config)
+    missing = collections.OrderedDict()
+    for section in sections:
+      known = self._sections.get(section.digest, {})
+      for test, key in tests:
+        if key in known:
+          self.hits += 1
+        else:
+          self.misses += 1
+          missing.setdefault(section.digest, section)
+    if missing:
+      self._evaluate(list(missing.values()), tests, engine)
+    found = dict((test, []) for test, _ in tests)
+    for section in sections:
+      known = self._sections[section.digest]
+      for test, key in tests:
+        found[test].extend((level, outcome, linenum + section.offset)
+                           for level, outcome, linenum in known[key])
+    for test in found:
+      # Sections hold outcomes level by level; a stable sort by level gives
+      # the order of the whole configuration
+      found[test].sort(key=lambda outcome: outcome[0])
+    while len(self._sections) > self.max_sections:
+      self._sections.popitem(last=False)
+    return found
+
+  def _evaluate(self, sections, tests, engine):
+    '''
+    Stores the outcomes of every test on sections, parsed as one tree.
+
+    :sections: list of Section with distinct digests
+    :tests: list of (TestCase, outcome key) tuples
+    :engine: string name of an engine in netaudit.config.ENGINES
+    '''
+    lines = []
+    starts = []
+    start = 0
+    for section in sections:
+      lines.extend(section.lines)
+      starts.append(start)
+      start += section.size
+    parse = build_tree(lines, engine)
+    stored = [{} for _ in sections]
+    for test, key in tests:
+      split = [[] for _ in sections]
+      for level, outcome, linenum in test.parent_outcomes(parse):
+        position = bisect.bisect_right(starts, linenum) - 1
+        split[position].append((level, outcome,
+                                linenum - starts[position]))
+      for known, outcomes in zip(stored, split):
+        known[key] = tuple(outcomes)
+    for section, outcomes in zip(sections, stored):
+      known = self._sections.pop(section.digest, {})
+      known.update(outcomes)
+      self._sections[section.digest] = known
+
+  def record(self, hits=0, misses=0):
+    '''
+    Adds counts from a memo in another process.
+
+    :hits: number of section outcomes reused
+    :misses: number of section outcomes evaluated
+    '''
+    self.hits += hits
+    self.misses += misses
+
+  @property
+  def counts(self):
+    '''Returns tuple of hits and misses'''
+    return (self.hits, self.misses)
+
+  def report(self):
+    '''Returns string summary of section outcomes reused'''
+    total = self.hits + self.misses
+    rate = 100.0 * self.hits / total if total else 0.0
+    return ('Section memo: %d hits, %d misses (%.1f%% hit rate)' %
+            (self.hits, self.misses, rate))
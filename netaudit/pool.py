@@ -0,0 +1,243 @@
+'''Module for reusing authenticated device sessions across collections'''
+
+import time
+import threading
+import contextlib
+import collections
+
+from . import exceptions as E
+from .connect import SSH_Client
+
+# Sessions kept open to one (hostname, port, username) at once
+DEFAULT_MAX_PER_HOST = 2
+# Seconds an unused session is kept before it is closed
+DEFAULT_IDLE_TIMEOUT = 300.0
+# Seconds acquire waits for a session of a host at its limit
+DEFAULT_ACQUIRE_TIMEOUT = 60.0
+
+IdleSession = collections.namedtuple('IdleSession', ('client', 'released'))
+
+
+def pool_key(connection):
+  '''
+  Returns key sessions are shared by: sessions of the same user on the same
+  host and port are interchangeable.
+
+  :connection: netaudit.connect.Connection object
+  '''
+  return (connection.hostname, connection.port, connection.username)
+
+
+
+class SessionPool(object):
+  '''
+  Connected clients (SSH_Client or Telnet_Client) kept open between uses, so
+  repeated collections from a device skip the handshake, authentication and
+  setup commands.  Sessions unused for idle_timeout are closed, and a
+  session is health checked (see SSH_Client.is_alive) before it is handed
+  out again.  Safe to share between threads.
+  '''
+  def __init__(self, client_class=SSH_Client,
+               max_per_host=DEFAULT_MAX_PER_HOST,
+               idle_timeout=DEFAULT_IDLE_TIMEOUT,
+               acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT, prepare=None,
+               **client_opts):
+    '''
+    :client_class: netaudit.connect.SSH_Client or Telnet_Client
+    :max_per_host: maximum number of sessions open to one pool key
+    :idle_timeout: seconds an unused session is kept open
+    :acquire_timeout: seconds to wait for a session when max_per_host are
+      in use
+    :prepare: optional function called with each new client once it is
+      connected, e.g. to log in or send "terminal length 0"
+    :client_opts: keyword arguments for client_class
+    '''
+    self.client_class = client_class
+    self.max_per_host = max_per_host
+    self.idle_timeout = idle_timeout
+    self.acquire_timeout = acquire_timeout
+    self.prepare = prepare
+    self.client_opts = client_opts
+    self.hits = 0
+    self.misses = 0
+    self.closed = False
+    self._lock = threading.Condition()
+    self._idle = collections.defaultdict(list)
+    self._open = collections.Counter()
+    self._in_use = {}
+
+  def acquire(self, connection):
+    '''
+    Returns connected client for connection: an idle session of the same
+    pool key that passes its health check, or a new one.  Waits up to
+    acquire_timeout when max_per_host sessions are in use and raises
+    PoolExhaustedError if none is released.
+
+    :connection: netaudit.connect.Connection object
+    '''
+    key = pool_key(connection)
+    while True:
+      client = self._reserve(key)
+      if client is None:
+        break
+      if client.is_alive():
+        with self._lock:
+          self.hits += 1
+        return client
+      self._discard(key, client)
+    try:
+      client = self.client_class(connection, **self.client_opts)
+      client.connect()
+      if self.prepare is not None:
+        self.prepare(client)
+    except Exception:
+      self._discard(key, None)
+      raise
+    with self._lock:
+      self.misses += 1
+      self._in_use[id(client)] = key
+    return client
+
+  def _reserve(self, key):
+    '''
+    Returns most recently used idle client of key, marked in use, or None
+    after reserving room for a new session.  Idle clients past idle_timeout
+    are closed on the way, once the lock is released.
+
+    :key: tuple from pool_key
+    '''
+    deadline = time.time() + self.acquire_timeout
+    expired = []
+    try:
+      with self._lock:
+        while True:
+          if self.closed:
+            raise E.PoolExhaustedError('Session pool is closed.')
+          expired.extend(self._prune(key))
+          if self._idle[key]:
+            client = self._idle[key].pop().client
+            self._in_use[id(client)] = key
+            return client
+          if self._open[key] < self.max_per_host:
+            self._open[key] += 1
+            return None
+          remaining = deadline - time.time()
+          if remaining <= 0:
+            msg = ('No session to %s:%s as %s released within %gs.' %
+                   (key + (self.acquire_timeout,)))
+            raise E.PoolExhaustedError(msg)
+          self._lock.wait(remaining)
+    finally:
+      for client in expired:
+        _close(client)
+
+  def _prune(self, key):
+    '''
+    Returns list of idle clients of key unused for longer than idle_timeout,
+    removed from the pool.  Called with the lock held; the caller closes
+    them after releasing it, so a slow disconnect does not hold up other
+    hosts.
+
+    :key: tuple from pool_key
+    '''
+    cutoff = time.time() - self.idle_timeout
+    idle = self._idle[key]
+    expired = []
+    while idle and idle[0].released < cutoff:
+      expired.append(idle.pop(0).client)
+      self._open[key] -= 1
+    if expired:
+      self._lock.notify_all()
+    return expired
+
+  def _discard(self, key, client):
+    '''
+    Frees the room of a session of key that is gone, closing client.
+
+    :key: tuple from pool_key
+    :client: client object or None if it was never created
+    '''
+    with self._lock:
+      if client is not None:
+        self._in_use.pop(id(client), None)
+      self._open[key] -= 1
+      # Waiters of every host share the lock, so all are woken to check
+      # their own key
+      self._lock.notify_all()
+    if client is not None:
+      _close(client)
+
+  def release(self, client, discard=False):
+    '''
+    Returns client to the pool for reuse.
+
+    :client: client object from acquire
+    :discard: boolean, close the session instead, e.g. after an error left
+      it in an unknown state
+    '''
+    with self._lock:
+      key = self._in_use.pop(id(client))
+      if not (discard or self.closed):
+        self._idle[key].append(IdleSession(client, time.time()))
+        self._lock.notify_all()
+        return
+      self._open[key] -= 1
+      self._lock.notify_all()
+    _close(client)
+
+  @contextlib.contextmanager
+  def session(self, connection):
+    '''
+    Context manager providing a client from acquire, released when the
+    block ends and discarded if the block raises.
+
+    :connection: netaudit.connect.Connection object
+    '''
+    client = self.acquire(connection)
+    try:
+      yield client
+    except Exception:
+      self.release(client, discard=True)
+      raise
+    self.release(client)
+
+  def prune(self):
+    '''
+    Closes idle sessions of every host unused for longer than idle_timeout.
+    '''
+    expired = []
+    with self._lock:
+      for key in list(self._idle):
+        expired.extend(self._prune(key))
+    for client in expired:
+      _close(client)
+
+  def close(self):
+    '''
+    Closes idle sessions; sessions in use are closed when released.
+    '''
+    with self._lock:
+      self.closed = True
+      idle_clients = []
+      for key, idle in self._idle.items():
+        idle_clients.extend(session.client for session in idle)
+        self._open[key] -= len(idle)
+      self._idle.clear()
+      self._lock.notify_all()
+    for client in idle_clients:
+      _close(client)
+
+  def report(self):
+    '''Returns string summary of sessions reused'''
+    total = self.hits + self.misses
+    rate = 100.0 * self.hits / total if total else 0.0
+    return ('Session pool: %d reused, %d opened (%.1f%% reuse rate)' %
+            (self.hits, self.misses, rate))
+
+
+def _close(client):
+  '''Closes client, ignoring errors of sessions that are already gone'''
+  try:
+    client.close()
+  except Exception: # pylint: disable=broad-except
+    pass
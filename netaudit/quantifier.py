@@ -0,0 +1,87 @@
+'''Module for how many matches a test needs to pass'''
+
+import re
+import operator
+import collections
+
+QUANTIFIER_RE = re.compile(
+  r'^\s*(?:(?P<kind>any|all|none)|'
+  r'count\s*(?P<operator>>=|<=|==|!=|>|<)\s*(?P<number>\d+))\s*$')
+
+COMPARISONS = {
+  '>=': operator.ge,
+  '>': operator.gt,
+  '<=': operator.le,
+  '<': operator.lt,
+  '==': operator.eq,
+  '!=': operator.ne,
+}
+
+
+
+class Quantifier(collections.namedtuple('Quantifier', ('kind', 'operator',
+                                                       'number'))):
+  '''
+  How many matches a test needs to pass: 'any', 'all', 'none' or 'count'
+  compared with number.  A match is a line (text tests) or parent (config
+  tests) for which group 1 equals the expected value; a mismatch is one
+  that was found but has a different value.
+  '''
+  __slots__ = ()
+
+  def decided(self, matches, mismatches):
+    '''
+    Returns the result if no further line can change it, else None.
+
+    :matches: number of matches so far
+    :mismatches: number of mismatches so far
+    '''
+    if self.kind == 'any':
+      return True if matches else None
+    if self.kind == 'all':
+      return False if mismatches else None
+    if self.kind == 'none':
+      return False if matches else None
+    # Counts only grow: past number every comparison is fixed, and a
+    # lower bound stays met once it is met
+    compare = COMPARISONS[self.operator]
+    if matches > self.number or (self.operator in ('>=', '>') and
+                                 compare(matches, self.number)):
+      return compare(matches, self.number)
+    return None
+
+  def result(self, matches, mismatches):
+    '''
+    Returns the result once every line has been seen.
+
+    :matches: number of matches
+    :mismatches: number of mismatches
+    '''
+    if self.kind == 'any':
+      return matches > 0
+    if self.kind == 'all':
+      return matches > 0 and not mismatches
+    if self.kind == 'none':
+      return not matches
+    return COMPARISONS[self.operator](matches, self.number)
+
+
+def parse_quantifier(quantifier):
+  '''
+  Returns Quantifier for a test definition's quantifier, or None if it is
+  not set.
+
+  :quantifier: string 'any', 'all', 'none' or 'count <op> <n>' where op is
+    one of >=, >, <=, <, == or !=; None for the default of the test type
+  '''
+  if quantifier is None:
+    return None
+  match = QUANTIFIER_RE.match(str(quantifier))
+  if match is None:
+    msg = ('"%s" is not a valid quantifier.  Use any, all, none or count '
+           'followed by a comparison, e.g. "count >= 2".' % quantifier)
+    raise ValueError(msg)
+  if match.group('kind') is not None:
+    return Quantifier(match.group('kind'), None, None)
+  return Quantifier('count', match.group('operator'),
+                    int(match.group('number')))
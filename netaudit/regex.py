@@ -0,0 +1,156 @@
+'''Module for compiling test patterns and bounding the time they run'''
+
+import re
+import signal
+import threading
+import contextlib
+try:
+  from re import _parser as sre_parse
+except ImportError:
+  import sre_parse
+
+from . import exceptions as E
+
+# Names of the regex backends test patterns can be compiled with
+STDLIB = 're'
+LINEAR = 're2'
+DEFAULT_BACKEND = STDLIB
+
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+
+
+def _compile_stdlib(pattern):
+  '''
+  Returns pattern compiled with the re module.
+
+  :pattern: string or bytes pattern
+  '''
+  return re.compile(pattern)
+
+
+def _compile_linear(pattern):
+  '''
+  Returns pattern compiled with re2, which matches in linear time.  Patterns
+  re2 does not support, such as backreferences and lookarounds, are
+  compiled with the re module instead (see is_linear).
+
+  :pattern: string or bytes pattern
+  '''
+  try:
+    import re2
+  except ImportError:
+    msg = ('The %s regex backend needs the re2 module, which is not '
+           'installed.' % LINEAR)
+    raise ValueError(msg)
+  try:
+    return re2.compile(pattern)
+  except Exception: # pylint: disable=broad-except
+    return re.compile(pattern)
+
+
+BACKENDS = {
+  STDLIB: _compile_stdlib,
+  LINEAR: _compile_linear,
+}
+
+
+def compile_regex(pattern, backend=DEFAULT_BACKEND):
+  '''
+  Returns pattern compiled with a backend.
+
+  :pattern: string or bytes pattern
+  :backend: string name of a backend in BACKENDS
+  '''
+  if backend not in BACKENDS:
+    msg = ('"%s" is not a valid regex backend.  Use one of: %s.' %
+           (backend, ', '.join(sorted(BACKENDS))))
+    raise ValueError(msg)
+  return BACKENDS[backend](pattern)
+
+
+def is_linear(regex):
+  '''
+  Returns True if a compiled regex matches in linear time, i.e. it was not
+  compiled by the re module.
+
+  :regex: compiled regex of any backend
+  '''
+  return not isinstance(regex, type(re.compile('')))
+
+
+def risky_pattern(pattern):
+  '''
+  Returns True if pattern can backtrack catastrophically on the re module:
+  a repeat without an upper bound contains another such repeat or an
+  alternation, as in "(a+)+" or "(a|ab)*".  This is a heuristic that errs
+  on the side of reporting a pattern.
+
+  :pattern: string or bytes pattern
+  '''
+  try:
+    parsed = sre_parse.parse(pattern)
+  except Exception: # pylint: disable=broad-except
+    return False
+  return _nested_repeat(parsed, False)
+
+
+def _nested_repeat(sequence, unbounded):
+  '''
+  Returns True if a parsed sequence nests an unbounded repeat or an
+  alternation inside an unbounded repeat.
+
+  :sequence: parsed pattern (sre_parse.SubPattern or list of opcodes)
+  :unbounded: boolean, sequence is inside an unbounded repeat
+  '''
+  for opcode, args in sequence:
+    if opcode in _REPEATS:
+      repeat = args[1] == sre_parse.MAXREPEAT
+      if repeat and unbounded:
+        return True
+      if _nested_repeat(args[2], unbounded or repeat):
+        return True
+    elif opcode == sre_parse.BRANCH:
+      if unbounded:
+        return True
+      if any(_nested_repeat(item, unbounded) for item in args[1]):
+        return True
+    elif opcode == sre_parse.SUBPATTERN:
+      if _nested_repeat(args[-1], unbounded):
+        return True
+    elif opcode in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+      if _nested_repeat(args[1], unbounded):
+        return True
+  return False
+
+
+def _can_interrupt():
+  '''Returns True if a timer signal can interrupt the running code'''
+  return (hasattr(signal, 'setitimer') and
+          isinstance(threading.current_thread(), threading._MainThread) and
+          signal.getitimer(signal.ITIMER_REAL)[0] == 0)
+
+
+@contextlib.contextmanager
+def time_budget(seconds):
+  '''
+  Context manager raising RegexBudgetExceededError in the block once it has
+  run for seconds.  The re module checks for signals while it backtracks,
+  so a runaway match is stopped too.  Budgets need a timer signal, so they
+  are only enforced in the main thread of a process, without another timer
+  set, on platforms that have one; elsewhere the block runs unbounded.
+
+  :seconds: number of seconds, None for no budget
+  '''
+  if seconds is None or not _can_interrupt():
+    yield
+    return
+  def expired(signum, frame):
+    raise E.RegexBudgetExceededError(
+      'Regex budget of %gs exceeded.' % seconds)
+  previous = signal.signal(signal.SIGALRM, expired)
+  signal.setitimer(signal.ITIMER_REAL, seconds)
+  try:
+    yield
+  finally:
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    signal.signal(signal.SIGALRM, previous)
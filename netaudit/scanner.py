@@ -0,0 +1,305 @@
+'''Module for evaluating text tests together in one pass'''
+
+import re
+try:
+  from re import _parser as sre_parse
+except ImportError:
+  import sre_parse
+
+from .config import LineIndex, to_bytes, newline
+from .regex import is_linear, risky_pattern
+
+# Shortest literal fragment worth using to preselect candidate lines
+MIN_LITERAL_LENGTH = 3
+NEWLINE = ord('\n')
+
+
+
+class TextScanner(object):
+  '''
+  Evaluates a set of text tests together.  A test passes when any line
+  matches its pattern with group 1 equal to the expected value, exactly as
+  TestCase.evaluate does for one test.
+
+  Tests whose pattern requires a literal fragment only run their regex on
+  the lines containing that fragment, which are located with substring
+  searches over the whole text.  The remaining tests share a single pass
+  over the configuration lines.
+
+  A scanner for bytes mode configurations (see for_bytes) matches byte
+  lines with the patterns, literals and expected values encoded.
+  '''
+  __slots__ = ('tests', 'literal_prefilter', 'binary', '_matchers',
+               '_literals', '_line_tests', '_prefilter', '_bytes_scanner')
+
+  # Patterns that cannot safely share one alternation: backreferences are
+  # renumbered by the wrapping groups and inline flags apply globally.
+  UNCOMBINABLE = re.compile(r'\\[1-9]|\(\?P=|\(\?[aiLmsux]+\)')
+
+  def __init__(self, tests, literal_prefilter=True, binary=False):
+    '''
+    :tests: iterable of TestCase objects with text patterns
+    :literal_prefilter: boolean, if False every test is run on every line
+    :binary: boolean, scan bytes instead of text
+    '''
+    self.tests = tuple(tests)
+    self.literal_prefilter = literal_prefilter
+    self.binary = binary
+    self._matchers = dict((test, test.matcher(binary)) for test in self.tests)
+    self._bytes_scanner = None
+    literals = []
+    line_tests = []
+    for test in self.tests:
+      literal = required_literal(test.regex) if literal_prefilter else None
+      if literal is None:
+        line_tests.append(test)
+      else:
+        literals.append((test, to_bytes(literal) if binary else literal))
+    self._literals = tuple(literals)
+    self._line_tests = tuple(line_tests)
+    self._prefilter = self._combine(test.pattern for test in line_tests)
+    if binary and self._prefilter is not None:
+      self._prefilter = re.compile(to_bytes(self._prefilter.pattern))
+
+  @classmethod
+  def _combine(cls, patterns):
+    '''
+    Returns a compiled alternation of all patterns used to skip lines that
+    no test can match, or None if the patterns cannot be combined.
+
+    :patterns: iterable of pattern strings
+    '''
+    patterns = list(patterns)
+    if not patterns:
+      return None
+    for pattern in patterns:
+      # A risky pattern would make the prefilter backtrack in the re module
+      # even if the test itself is compiled with a linear backend
+      if cls.UNCOMBINABLE.search(pattern) or risky_pattern(pattern):
+        return None
+    try:
+      return re.compile('|'.join('(?:%s)' % pattern for pattern in patterns))
+    except (re.error, OverflowError, AssertionError):
+      return None
+
+  def single(self, test):
+    '''
+    Returns TextScanner for test alone, with the same options.
+
+    :test: TestCase object
+    '''
+    return TextScanner((test,), literal_prefilter=self.literal_prefilter,
+                       binary=self.binary)
+
+  def for_bytes(self):
+    '''
+    Returns TextScanner for the same tests and options that scans bytes
+    mode configurations; it is built once per scanner.
+    '''
+    if self.binary:
+      return self
+    if self._bytes_scanner is None:
+      self._bytes_scanner = TextScanner(
+        self.tests, literal_prefilter=self.literal_prefilter, binary=True)
+    return self._bytes_scanner
+
+  def scan(self, contents, counts=None):
+    '''
+    Returns dict of TestCase to boolean result for every test.
+
+    :contents: string with configuration text (bytes for a bytes mode
+      scanner) or netaudit.config.LineIndex
+    :counts: optional list of two integers, incremented by the number of
+      lines read and regex evaluations made
+    '''
+    results = dict((test, False) for test in self.tests)
+    if isinstance(contents, LineIndex):
+      index, lines = contents, contents
+    else:
+      index, lines = LineIndex(contents), None
+    for test, literal in self._literals:
+      search, expected = self._matchers[test]
+      candidates = index.containing(literal)
+      if counts is not None:
+        search = counted_search(search, counts)
+        candidates = counted_lines(candidates, counts)
+      for line in candidates:
+        match = search(line)
+        if match is not None and match.group(1) == expected:
+          results[test] = True
+          break
+    if self._line_tests:
+      if lines is None:
+        lines = contents.split(newline(contents))
+      self._scan_lines(lines, results, counts)
+    return results
+
+  def _scan_lines(self, lines, results, counts=None):
+    '''
+    Runs tests without a literal fragment over every line in one pass.
+
+    :lines: iterable of configuration lines
+    :results: dict of TestCase to boolean result, updated in place
+    :counts: optional list of lines read and regex evaluations, updated in
+      place
+    '''
+    pending = [(test,) + self._matchers[test] for test in self._line_tests]
+    prefilter = None
+    if self._prefilter is not None:
+      prefilter = self._prefilter.search
+    if counts is not None:
+      pending = [(test, counted_search(search, counts), expected)
+                 for test, search, expected in pending]
+      if prefilter is not None:
+        prefilter = counted_search(prefilter, counts)
+      lines = counted_lines(lines, counts)
+    for line in lines:
+      if prefilter is not None and prefilter(line) is None:
+        continue
+      remaining = []
+      for item in pending:
+        match = item[1](line)
+        if match is not None and match.group(1) == item[2]:
+          results[item[0]] = True
+        else:
+          remaining.append(item)
+      if len(remaining) != len(pending):
+        if not remaining:
+          break
+        pending = remaining
+
+
+
+def counted_search(search, counts):
+  '''
+  Returns search function that adds one to counts[1] per call.
+
+  :search: regex search function
+  :counts: list of lines read and regex evaluations
+  '''
+  def counted(line):
+    counts[1] += 1
+    return search(line)
+  return counted
+
+
+def counted_lines(lines, counts):
+  '''
+  Yields lines, adding one to counts[0] per line.
+
+  :lines: iterable of configuration lines
+  :counts: list of lines read and regex evaluations
+  '''
+  for line in lines:
+    counts[0] += 1
+    yield line
+
+
+
+def lines_containing(contents, literal):
+  '''
+  Yields each line of contents that contains literal, in order and at most
+  once.
+
+  :contents: string with configuration text
+  :literal: string without newlines
+  '''
+  return LineIndex(contents).containing(literal)
+
+
+
+def config_text(config):
+  '''
+  Returns what text tests scan for config: the lazy LineIndex of a
+  memory-mapped configuration, otherwise its contents string.
+
+  :config: a configuration object as defined in netaudit.config
+  '''
+  if getattr(config, 'mapped', False) is True:
+    return config.lines
+  return config.contents
+
+
+
+def required_literal(regex):
+  '''
+  Returns the longest literal string that every match of regex must
+  contain, or None if there is no usable fragment.
+
+  :regex: compiled regular expression
+  '''
+  if is_linear(regex):
+    # Patterns of other backends are analysed as re module patterns
+    regex = re.compile(regex.pattern)
+  if regex.flags & re.IGNORECASE:
+    return None
+  try:
+    parsed = sre_parse.parse(regex.pattern, regex.flags)
+  except Exception: # pylint: disable=broad-except
+    return None
+  fragments = [_codes_to_string(codes, regex.pattern)
+               for codes in _literal_fragments(parsed)
+               if len(codes) >= MIN_LITERAL_LENGTH and NEWLINE not in codes]
+  if not fragments:
+    return None
+  return max(fragments, key=len)
+
+
+def _literal_fragments(sequence):
+  '''
+  Returns list of literal runs, as lists of code points, that are required
+  by a parsed regex sequence.  Anything optional or variable ends the
+  current run.
+
+  :sequence: parsed pattern (sre_parse.SubPattern or list of opcodes)
+  '''
+  fragments = []
+  run = []
+  for opcode, args in _flatten_groups(sequence):
+    if opcode == sre_parse.LITERAL:
+      run.append(args)
+      continue
+    if run:
+      fragments.append(run)
+      run = []
+    if opcode in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and args[0] >= 1:
+      fragments.extend(_literal_fragments(args[2]))
+  if run:
+    fragments.append(run)
+  return fragments
+
+
+def _flatten_groups(sequence):
+  '''
+  Yields opcodes of a parsed sequence with plain groups inlined, since a
+  group is matched exactly once in place.  Groups that switch on case
+  insensitivity are yielded as an opaque item.
+
+  :sequence: parsed pattern (sre_parse.SubPattern or list of opcodes)
+  '''
+  for opcode, args in sequence:
+    if opcode == sre_parse.SUBPATTERN:
+      # args is (group, pattern) on Python 2 and
+      # (group, add_flags, del_flags, pattern) on Python 3
+      if len(args) > 2 and args[1] & re.IGNORECASE:
+        yield (None, None)
+        continue
+      for item in _flatten_groups(args[-1]):
+        yield item
+    else:
+      yield (opcode, args)
+
+
+def _codes_to_string(codes, pattern):
+  '''
+  Returns code points as the same string type as pattern.
+
+  :codes: list of integer code points
+  :pattern: pattern the code points were parsed from
+  '''
+  if isinstance(pattern, bytes):
+    return bytes(bytearray(codes))
+  try:
+    return u''.join(unichr(code) for code in codes)
+  except NameError:
+    return ''.join(chr(code) for code in codes)
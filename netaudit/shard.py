@@ -0,0 +1,254 @@
+'''Module for auditing one large configuration in parallel'''
+
+import multiprocessing
+
+from .audit import TestResult
+from .scanner import TextScanner
+from .config import build_tree, split_sections, iter_lines, tree_lines
+from .config import is_binary, evaluates_by_section
+
+# Fewest configuration lines worth giving a worker process of their own
+MIN_SHARD_LINES = 10000
+
+# Kinds of shard: a line range for text tests, whole top level sections for
+# hierarchical tests
+TEXT = 'text'
+TREE = 'tree'
+
+# Test plan, configuration lines, indexes of the tests to evaluate and
+# bytes mode of the current worker process, set by _init_shard_worker
+_SHARD_PLAN = None
+_SHARD_TEXT_LINES = None
+_SHARD_HIERARCHY_LINES = None
+_SHARD_NEEDED = None
+_SHARD_BINARY = False
+
+
+def _init_shard_worker(plan, text_lines, hierarchy_lines, needed,
+                       binary=False):
+  '''
+  Stores the test plan and the configuration once per worker process.
+
+  :plan: netaudit.audit.TestPlan object
+  :text_lines: list of lines text tests read
+  :hierarchy_lines: list of lines hierarchy engines read
+  :needed: tuple of indexes in plan.tests of the tests to evaluate
+  :binary: boolean, text_lines are bytes of a bytes mode configuration
+  '''
+  # pylint: disable=global-statement
+  global _SHARD_PLAN, _SHARD_TEXT_LINES, _SHARD_HIERARCHY_LINES
+  global _SHARD_NEEDED, _SHARD_BINARY
+  _SHARD_PLAN = plan
+  _SHARD_TEXT_LINES = text_lines
+  _SHARD_HIERARCHY_LINES = hierarchy_lines
+  _SHARD_NEEDED = needed
+  _SHARD_BINARY = binary
+
+
+def _shard_worker(task):
+  '''
+  Evaluates the tests of the worker's plan on one shard.  Returns dict of
+  test index to a partial result, see text_shard and tree_shard.
+
+  :task: tuple of kind (TEXT or TREE), start and stop line and, for TREE,
+    the number of lines before start that hierarchy engines keep
+  '''
+  kind, start, stop, offset = task
+  if kind == TEXT:
+    return text_shard(_SHARD_PLAN, _SHARD_TEXT_LINES[start:stop],
+                      _SHARD_NEEDED, _SHARD_BINARY)
+  return tree_shard(_SHARD_PLAN, _SHARD_HIERARCHY_LINES[start:stop], offset,
+                    _SHARD_NEEDED)
+
+
+def text_shard(plan, lines, needed, binary=False):
+  '''
+  Returns dict of test index to the partial result of each text test over
+  lines: a boolean for tests that pass on any matching line, a tuple of
+  matches and mismatches for tests with another quantifier.
+
+  :plan: netaudit.audit.TestPlan object
+  :lines: list of configuration lines
+  :needed: iterable of indexes in plan.tests of the tests to evaluate
+  :binary: boolean, lines are bytes of a bytes mode configuration
+  '''
+  tests = [(index, plan.tests[index]) for index in needed]
+  scannable = [test for _, test in tests if test.scannable]
+  scanned = {}
+  if scannable:
+    scanner = plan.text_scanner
+    if scanner is None:
+      scanner = TextScanner(scannable)
+    if binary:
+      scanned = scanner.for_bytes().scan(b'\n'.join(lines))
+    else:
+      scanned = scanner.scan('\n'.join(lines))
+  partial = {}
+  for index, test in tests:
+    if test.scannable:
+      partial[index] = scanned[test]
+    elif test.is_text:
+      partial[index] = test.count_matches(lines, binary)
+  return partial
+
+
+def tree_shard(plan, lines, offset, needed):
+  '''
+  Returns dict of test index to the list of parent outcomes (see
+  TestCase.parent_outcomes) of each hierarchical test over lines, with line
+  numbers of the whole configuration.
+
+  :plan: netaudit.audit.TestPlan object
+  :lines: list of configuration lines made of whole top level sections
+  :offset: number of lines before lines that hierarchy engines keep
+  :needed: iterable of indexes in plan.tests of the tests to evaluate
+  '''
+  parse = build_tree(lines, plan.engine)
+  partial = {}
+  for index in needed:
+    test = plan.tests[index]
+    if test.is_hierarchical:
+      partial[index] = [(level, outcome, linenum + offset) for
+                        level, outcome, linenum in test.parent_outcomes(parse)]
+  return partial
+
+
+def line_ranges(count, shards):
+  '''
+  Returns list of (start, stop) tuples splitting count lines into at most
+  shards contiguous ranges of nearly equal size.
+
+  :count: number of lines
+  :shards: maximum number of ranges
+  '''
+  shards = max(1, min(shards, count))
+  size, extra = divmod(count, shards)
+  ranges = []
+  start = 0
+  for index in range(shards):
+    stop = start + size + (1 if index < extra else 0)
+    ranges.append((start, stop))
+    start = stop
+  return ranges
+
+
+def section_ranges(lines, shards):
+  '''
+  Returns list of (start, stop, offset) tuples splitting lines into at most
+  shards contiguous ranges of whole top level sections, so every parent is
+  in the same range as its children.  Offset is the number of non-blank
+  lines before start, which hierarchy engines number from.
+
+  :lines: list of configuration lines
+  :shards: maximum number of ranges
+  '''
+  target = max(1, -(-len(lines) // max(shards, 1)))
+  ranges = []
+  start = 0
+  stop = 0
+  offset = 0
+  kept = 0
+  for section in split_sections(lines):
+    stop += len(section)
+    kept += sum(1 for line in section if line.strip())
+    if stop - start >= target:
+      ranges.append((start, stop, offset))
+      start = stop
+      offset = kept
+  if stop > start or not ranges:
+    ranges.append((start, stop, offset))
+  return ranges
+
+
+def sharded_results(plan, config, shards, cache=None,
+                    min_lines=MIN_SHARD_LINES, memo=None):
+  '''
+  Yields a TestResult for each test in the plan, in group order, like
+  TestPlan.results, but splits the work on config across worker processes:
+  text tests by line ranges and hierarchical tests by top level sections
+  (on engines that build the same hierarchy section by section, see
+  netaudit.config.evaluates_by_section; otherwise they are evaluated in the
+  calling process).  Partial results are merged in line order, so results
+  and messages equal those of a serial run.  Configurations too small to
+  split are evaluated in the calling process.
+
+  :plan: netaudit.audit.TestPlan object
+  :config: a configuration object as defined in netaudit.config
+  :shards: number of worker processes
+  :cache: optional netaudit.cache.ResultCache
+  :min_lines: fewest lines per worker process
+  :memo: optional netaudit.memo.SectionMemo; hierarchical tests are then
+    answered from it in the calling process and only text tests are split
+  '''
+  text_lines = list(iter_lines(config))
+  shards = min(shards, len(text_lines) // max(min_lines, 1))
+  if shards <= 1:
+    for test_result in plan.results(config, cache, memo=memo):
+      yield test_result
+    return
+  cached = cache.lookup(plan, config) if cache is not None else {}
+  # Tests with a regex budget are evaluated in this process, where the
+  # budget is enforced, as are hierarchical tests the memo answers or that
+  # cannot be split by section
+  split_tree = memo is None and evaluates_by_section(plan.engine)
+  needed = tuple(index for index, test in enumerate(plan.tests)
+                 if test not in cached and test.budget is None and
+                 (split_tree or not test.is_hierarchical))
+  tasks = []
+  if any(plan.tests[index].is_text for index in needed):
+    tasks.extend((TEXT, start, stop, 0)
+                 for start, stop in line_ranges(len(text_lines), shards))
+  hierarchy_lines = None
+  if any(plan.tests[index].is_hierarchical for index in needed):
+    hierarchy_lines = tree_lines(config)
+    tasks.extend((TREE, start, stop, offset) for start, stop, offset in
+                 section_ranges(hierarchy_lines, shards))
+  partials = []
+  if tasks:
+    pool = multiprocessing.Pool(
+      min(shards, len(tasks)), initializer=_init_shard_worker,
+      initargs=(plan, text_lines, hierarchy_lines, needed,
+                is_binary(config)))
+    try:
+      partials = pool.map(_shard_worker, tasks)
+      pool.close()
+    finally:
+      pool.terminate()
+      pool.join()
+  found = {}
+  tallies = {}
+  outcomes = {}
+  for task, partial in zip(tasks, partials):
+    for index, value in partial.items():
+      if task[0] == TREE:
+        outcomes.setdefault(index, []).extend(value)
+      elif isinstance(value, bool):
+        found[index] = found.get(index, False) or value
+      else:
+        before = tallies.get(index, (0, 0))
+        tallies[index] = (before[0] + value[0], before[1] + value[1])
+  # Tests left to this process share one parse of config and the memo
+  evaluate = plan._evaluator(config, memo)
+  evaluated = []
+  for index, test in enumerate(plan.tests):
+    if test in cached:
+      result, message = cached[test]
+      yield TestResult(test.name, result, message)
+      continue
+    if index in outcomes:
+      # Shards hold outcomes level by level; a stable sort by level gives
+      # the order of a serial run
+      result, message = test.fold_outcomes(
+        sorted(outcomes[index], key=lambda outcome: outcome[0]))
+    elif index in found:
+      result, message = found[index], None
+    elif index in tallies:
+      result, message = test.quantifier.result(*tallies[index]), None
+    else:
+      test_result = evaluate(test)
+      result, message = test_result.result, test_result.message
+    test_result = TestResult(test.name, result, message)
+    evaluated.append((test, test_result))
+    yield test_result
+  if cache is not None and evaluated:
+    cache.store(plan, config, evaluated)
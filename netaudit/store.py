@@ -0,0 +1,342 @@
+'''Module for storing the audit results of a fleet compactly'''
+
+import os
+import gzip
+import json
+import base64
+import binascii
+import tempfile
+import collections
+
+from . import exceptions as E
+from .audit import TestResult
+
+# Bump when the layout of saved stores changes
+STORE_VERSION = 2
+# Earlier versions load can still read; version 1 had no errored results
+READABLE_VERSIONS = (1, STORE_VERSION)
+
+GroupSummary = collections.namedtuple('GroupSummary', (
+  'group', 'devices', 'compliant', 'failing', 'pass_rate', 'errored'))
+
+
+def _to_int(column):
+  '''
+  Returns integer with bit n set for each bit n set in column, counting
+  from the least significant bit of the first byte.
+
+  :column: bytearray bitset
+  '''
+  if not column:
+    return 0
+  return int(binascii.hexlify(bytes(column[::-1])), 16)
+
+
+def _bit_count(value):
+  '''Returns number of bits set in a non-negative integer'''
+  return bin(value).count('1')
+
+
+def _bit_indexes(value):
+  '''Yields index of each bit set in a non-negative integer, lowest first'''
+  while value:
+    lowest = value & -value
+    yield lowest.bit_length() - 1
+    value ^= lowest
+
+
+
+class ResultStore(object):
+  '''
+  Outcomes of many devices by many tests.  Each test is a column of three
+  bitsets over devices: the devices it was evaluated on, the devices it
+  passed on and the devices it errored on (result None, e.g. out of its
+  regex budget), so a test costs about three bits per device.  Errored
+  results are neither evaluated nor failed, so they do not count in pass
+  rates or failing devices.
+  Device names, test names and messages are interned, and messages are
+  kept apart from the outcomes for the results that have one.  Aggregates
+  over a column run as integer operations on the whole bitset.
+  '''
+  def __init__(self):
+    self.devices = []
+    self.tests = []
+    self.messages = []
+    self._device_index = {}
+    self._test_index = {}
+    self._message_index = {}
+    self._evaluated = []
+    self._passed = []
+    self._errored = []
+    # Device index to dict of test index to message index
+    self._message_refs = {}
+
+  def __len__(self):
+    return len(self.devices)
+
+  def _intern(self, names, index, name):
+    '''
+    Returns position of name in names, appending it if it is new.
+
+    :names: list of names
+    :index: dict of name to position in names
+    :name: string
+    '''
+    position = index.get(name)
+    if position is None:
+      position = len(names)
+      names.append(name)
+      index[name] = position
+    return position
+
+  def add(self, source, results):
+    '''
+    Stores the results of one device, replacing any earlier results for it.
+
+    :source: name of the device or its configuration
+    :results: iterable of TestResult
+    '''
+    source = str(source)
+    known = source in self._device_index
+    device = self._intern(self.devices, self._device_index, source)
+    byte = device >> 3
+    bit = 1 << (device & 7)
+    if known:
+      for column in self._evaluated + self._passed + self._errored:
+        if len(column) > byte:
+          column[byte] &= ~bit & 0xff
+      self._message_refs.pop(device, None)
+    refs = {}
+    for test_result in results:
+      test = self._test_index.get(test_result.name)
+      if test is None:
+        test = self._intern(self.tests, self._test_index, test_result.name)
+        self._evaluated.append(bytearray())
+        self._passed.append(bytearray())
+        self._errored.append(bytearray())
+      if test_result.result is None:
+        columns = [self._errored[test]]
+      else:
+        columns = [self._evaluated[test]]
+      if test_result.result:
+        columns.append(self._passed[test])
+      for column in columns:
+        if len(column) <= byte:
+          column.extend(bytearray(byte + 1 - len(column)))
+        column[byte] |= bit
+      if test_result.message:
+        refs[test] = self._intern(self.messages, self._message_index,
+                                  test_result.message)
+    if refs:
+      self._message_refs[device] = refs
+
+  def add_audit(self, audit_result):
+    '''
+    Stores the results of one device.
+
+    :audit_result: netaudit.fleet.AuditResult object
+    '''
+    self.add(audit_result.source, audit_result.results)
+
+  def result(self, source, test_name):
+    '''
+    Returns TestResult of a test on a device, with result None if it
+    errored, or None if it was not stored.
+
+    :source: name of the device
+    :test_name: string name of the test
+    '''
+    device = self._device_index.get(str(source))
+    test = self._test_index.get(test_name)
+    if device is None or test is None:
+      return None
+    byte = device >> 3
+    bit = 1 << (device & 7)
+    message = self._message_refs.get(device, {}).get(test)
+    message = None if message is None else self.messages[message]
+    errored = self._errored[test]
+    if len(errored) > byte and errored[byte] & bit:
+      return TestResult(test_name, None, message)
+    evaluated = self._evaluated[test]
+    if len(evaluated) <= byte or not evaluated[byte] & bit:
+      return None
+    passed = self._passed[test]
+    return TestResult(test_name, len(passed) > byte and
+                      bool(passed[byte] & bit), message)
+
+  def device_results(self, source):
+    '''
+    Returns list of TestResult stored for a device, in the order the tests
+    were first stored.
+
+    :source: name of the device
+    '''
+    results = (self.result(source, test_name) for test_name in self.tests)
+    return [test_result for test_result in results if test_result is not None]
+
+  def _columns(self, test_name):
+    '''
+    Returns tuple of the evaluated, passed and errored bitsets of a test as
+    integers.
+
+    :test_name: string name of the test
+    '''
+    test = self._test_index[test_name]
+    return (_to_int(self._evaluated[test]), _to_int(self._passed[test]),
+            _to_int(self._errored[test]))
+
+  def counts(self, test_name):
+    '''
+    Returns tuple of the number of devices a test was evaluated on and
+    passed on; devices it errored on are not counted.  Raises KeyError for
+    a test without stored results.
+
+    :test_name: string name of the test
+    '''
+    evaluated, passed = self._columns(test_name)[:2]
+    return _bit_count(evaluated), _bit_count(passed)
+
+  def pass_rate(self, test_name):
+    '''
+    Returns fraction of the devices a test was evaluated on that it passed
+    on, or None if it was never evaluated.
+
+    :test_name: string name of the test
+    '''
+    evaluated, passed = self.counts(test_name)
+    return float(passed) / evaluated if evaluated else None
+
+  def pass_rates(self):
+    '''Returns OrderedDict of test name to pass rate for every test'''
+    return collections.OrderedDict(
+      (test_name, self.pass_rate(test_name)) for test_name in self.tests)
+
+  def failing_devices(self, test_name):
+    '''
+    Returns list of the devices a test failed on, in the order they were
+    first stored.
+
+    :test_name: string name of the test
+    '''
+    evaluated, passed = self._columns(test_name)[:2]
+    return [self.devices[device] for device in
+            _bit_indexes(evaluated & ~passed)]
+
+  def errored_devices(self, test_name):
+    '''
+    Returns list of the devices a test errored on, in the order they were
+    first stored.
+
+    :test_name: string name of the test
+    '''
+    errored = self._columns(test_name)[2]
+    return [self.devices[device] for device in _bit_indexes(errored)]
+
+  def group_summary(self, group, test_names):
+    '''
+    Returns GroupSummary of a group of tests: the number of devices any of
+    them was evaluated or errored on, passed on all of them, and failed at
+    least one, the pass rate over every evaluated result of the group and
+    the number of devices at least one errored on.  Tests without stored
+    results are left out.
+
+    :group: string name of the group
+    :test_names: list of test names in the group
+    '''
+    seen = 0
+    compliant = None
+    failing = 0
+    errored_any = 0
+    total = 0
+    passes = 0
+    for test_name in collections.OrderedDict.fromkeys(test_names):
+      if test_name not in self._test_index:
+        continue
+      evaluated, passed, errored = self._columns(test_name)
+      seen |= evaluated | errored
+      errored_any |= errored
+      compliant = passed if compliant is None else compliant & passed
+      failing |= evaluated & ~passed
+      total += _bit_count(evaluated)
+      passes += _bit_count(passed)
+    return GroupSummary(group, _bit_count(seen), _bit_count(compliant or 0),
+                        _bit_count(failing),
+                        float(passes) / total if total else None,
+                        _bit_count(errored_any))
+
+  def group_summaries(self, test_groups):
+    '''
+    Returns list of GroupSummary for every group, sorted by name.
+
+    :test_groups: dict of group name to list of test names, such as
+      netaudit.audit.TestFile.test_groups
+    '''
+    return [self.group_summary(group, test_groups[group])
+            for group in sorted(test_groups)]
+
+  def save(self, file_name):
+    '''
+    Writes the store to a gzip compressed file.  The file is replaced
+    atomically, so readers never see a partial store.
+
+    :file_name: string name of the file
+    '''
+    entry = {
+      'version': STORE_VERSION,
+      'devices': self.devices,
+      'tests': self.tests,
+      'messages': self.messages,
+      'evaluated': [base64.b64encode(bytes(column)).decode('ascii')
+                    for column in self._evaluated],
+      'passed': [base64.b64encode(bytes(column)).decode('ascii')
+                 for column in self._passed],
+      'errored': [base64.b64encode(bytes(column)).decode('ascii')
+                  for column in self._errored],
+      'message_refs': sorted([device, test, message] for device, refs in
+                             self._message_refs.items()
+                             for test, message in refs.items()),
+      }
+    encoded = json.dumps(entry, sort_keys=True).encode('utf-8')
+    directory = os.path.dirname(os.path.abspath(file_name))
+    handle, temp_name = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+      with os.fdopen(handle, 'wb') as raw_stream:
+        with gzip.GzipFile(fileobj=raw_stream, mode='wb') as file_stream:
+          file_stream.write(encoded)
+      os.rename(temp_name, file_name)
+    except Exception:
+      os.remove(temp_name)
+      raise
+
+  @classmethod
+  def load(cls, file_name):
+    '''
+    Returns ResultStore read from a file written by save.
+
+    :file_name: string name of the file
+    '''
+    with gzip.GzipFile(file_name, 'rb') as file_stream:
+      entry = json.loads(file_stream.read().decode('utf-8'))
+    if (not isinstance(entry, dict) or
+        entry.get('version') not in READABLE_VERSIONS):
+      raise E.InvalidResultStoreError(
+        '%s is not a result store of version %d.' % (file_name,
+                                                     STORE_VERSION))
+    store = cls()
+    for names, index, key in ((store.devices, store._device_index,
+                               'devices'),
+                              (store.tests, store._test_index, 'tests'),
+                              (store.messages, store._message_index,
+                               'messages')):
+      for name in entry[key]:
+        store._intern(names, index, name)
+    store._evaluated = [bytearray(base64.b64decode(column))
+                        for column in entry['evaluated']]
+    store._passed = [bytearray(base64.b64decode(column))
+                     for column in entry['passed']]
+    store._errored = [bytearray(base64.b64decode(column))
+                      for column in entry.get('errored', [''] * len(
+                        store._evaluated))]
+    for device, test, message in entry['message_refs']:
+      store._message_refs.setdefault(device, {})[test] = message
+    return store
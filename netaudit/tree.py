@@ -0,0 +1,161 @@
+'''Module for a lightweight hierarchical index of configuration lines'''
+
+import re
+
+COMMENT = '!'
+
+# Banner detection as done by CiscoConfParse, so both engines agree on which
+# lines belong to a banner
+BANNER_RE = re.compile(
+  r'^(set\s+)*banner\s+(?:login|motd|incoming|exec|telnet|lcd)')
+BANNER_STR_RE = re.compile(
+  r'^(?:(?P<btype>(?:set\s+)*banner\s\w+\s+)(?P<bchar>\S)(?:\S)?)$')
+
+
+def _is_comment(text):
+  '''Returns True if text is a comment line'''
+  return text.lstrip()[:1] == COMMENT
+
+
+
+class ConfigNode(object):
+  '''
+  One configuration line with links to its parent and children.
+  '''
+  __slots__ = ('text', 'linenum', 'indent', 'parent', '_children')
+
+  def __init__(self, text, linenum, indent):
+    '''
+    :text: string configuration line
+    :linenum: line number, counting lines kept in the tree from 0
+    :indent: number of leading whitespace characters
+    '''
+    self.text = text
+    self.linenum = linenum
+    self.indent = indent
+    self.parent = None
+    self._children = None
+
+  def __repr__(self):
+    return '<ConfigNode # %s %r>' % (self.linenum, self.text)
+
+  @property
+  def children(self):
+    '''Returns list of child nodes'''
+    return self._children if self._children is not None else []
+
+  def add_child(self, child):
+    '''
+    Appends child node and sets this node as its parent.
+
+    :child: ConfigNode object
+    '''
+    if self._children is None:
+      self._children = []
+    self._children.append(child)
+    child.parent = self
+
+  def re_search_children(self, regex):
+    '''
+    Returns list of child nodes whose text matches regex.
+
+    :regex: string or compiled regular expression
+    '''
+    search = re.compile(regex).search
+    return [child for child in self.children if search(child.text)]
+
+  def re_match_iter_typed(self, regex, group=1, result_type=str, default=''):
+    '''
+    Returns group of the first child whose text matches regex, cast to
+    result_type; if no child matches, default cast to result_type.
+
+    :regex: string or compiled regular expression
+    :group: integer group index to return
+    :result_type: type used to cast the result
+    :default: value returned if there is no match
+    '''
+    search = re.compile(regex).search
+    for child in self.children:
+      match = search(child.text)
+      if match is not None:
+        return result_type(match.group(group))
+    return result_type(default)
+
+
+
+class ConfigTree(object):
+  '''
+  Hierarchy of configuration lines built from indentation in one pass.
+  Implements the subset of the CiscoConfParse interface used by
+  hierarchical tests (find_objects, and re_search_children and
+  re_match_iter_typed on the returned nodes) with the same parent, child and
+  line number rules.
+  '''
+  __slots__ = ('nodes',)
+
+  def __init__(self, lines, ignore_blank_lines=True):
+    '''
+    :lines: iterable of configuration lines
+    :ignore_blank_lines: boolean, leave blank lines out of the tree and the
+      line numbering
+    '''
+    nodes = []
+    # Config lines that can still become parents, with increasing indent
+    stack = []
+    for line in lines:
+      stripped = line.strip()
+      if ignore_blank_lines and stripped == '':
+        continue
+      indent = len(line) - len(line.lstrip())
+      node = ConfigNode(line, len(nodes), indent)
+      if stripped and not _is_comment(line):
+        while stack and stack[-1].indent >= indent:
+          stack.pop()
+        if indent > 0 and stack:
+          stack[-1].add_child(node)
+        stack.append(node)
+      elif indent > 0:
+        parent = None
+        for candidate in reversed(stack):
+          if candidate.indent < indent:
+            parent = candidate
+            break
+        # A comment is not a child when the line above is indented further
+        if parent is not None and not (stripped and
+                                       nodes[-1].indent > indent):
+          parent.add_child(node)
+      nodes.append(node)
+    self.nodes = nodes
+    self._mark_banners()
+
+  def _mark_banners(self):
+    '''Makes the lines of multi-line banners children of the banner line'''
+    nodes = self.nodes
+    for parent in nodes:
+      if BANNER_RE.search(parent.text) is None:
+        continue
+      match = BANNER_STR_RE.search(parent.text)
+      if match is None:
+        continue
+      delimiter = match.group('bchar')
+      if len(parent.text.split(delimiter)) > 2:
+        continue
+      for node in nodes[parent.linenum + 1:]:
+        if delimiter in node.text.strip():
+          parent.add_child(node)
+          break
+        if node.indent == 0 and _is_comment(node.text):
+          break
+        parent.add_child(node)
+
+  def __len__(self):
+    return len(self.nodes)
+
+  def find_objects(self, linespec):
+    '''
+    Returns list of nodes at any depth whose text matches linespec.
+
+    :linespec: string or compiled regular expression
+    '''
+    search = re.compile(linespec).search
+    return [node for node in self.nodes if search(node.text)]
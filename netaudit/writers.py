@@ -0,0 +1,190 @@
+'''Module for writing audit results to a stream as they are produced'''
+
+import csv
+import json
+from xml.sax.saxutils import escape, quoteattr
+
+
+def status(test_result):
+  '''
+  Returns 'OK', 'FAIL' or 'ERROR' for a result; errored results have a
+  result of None.
+
+  :test_result: netaudit.audit.TestResult object
+  '''
+  if test_result.result is None:
+    return 'ERROR'
+  return 'OK' if test_result.result else 'FAIL'
+
+
+class ResultWriter(object):
+  '''
+  Writes TestResult objects to a stream one at a time, so results can be
+  read while an audit is still running and are never all held in memory.
+  Subclasses implement write.
+  '''
+  def __init__(self, stream):
+    '''
+    :stream: file-like object opened for writing text
+    '''
+    self.stream = stream
+
+  def write(self, source, test_result):
+    '''
+    Writes one result.
+
+    :source: name of the audited configuration
+    :test_result: netaudit.audit.TestResult object
+    '''
+    raise NotImplementedError
+
+  def write_results(self, source, results):
+    '''
+    Writes each result of an iterable as it is produced and flushes the
+    stream.
+
+    :source: name of the audited configuration
+    :results: iterable of TestResult, e.g. AuditTests.iter_run()
+    '''
+    for test_result in results:
+      self.write(source, test_result)
+    self.flush()
+
+  def write_audit(self, audit_result):
+    '''
+    Writes the results of one configuration and flushes the stream.
+
+    :audit_result: netaudit.fleet.AuditResult object
+    '''
+    self.write_results(audit_result.source, audit_result.results)
+
+  def flush(self):
+    '''Flushes the stream'''
+    self.stream.flush()
+
+  def close(self):
+    '''Writes anything still pending and flushes the stream'''
+    self.flush()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+
+
+class TextWriter(ResultWriter):
+  '''
+  Writes one "source: test: OK|FAIL|ERROR" line per result.
+  '''
+  def write(self, source, test_result):
+    self.stream.write('%s: %s: %s\n' % (source, test_result.name,
+                                        status(test_result)))
+
+
+
+class JsonLinesWriter(ResultWriter):
+  '''
+  Writes one JSON object per line with source, test, result and message.
+  The result of an errored test is null.
+  '''
+  def write(self, source, test_result):
+    result = test_result.result
+    self.stream.write(json.dumps({
+      'source': str(source),
+      'test': test_result.name,
+      'result': None if result is None else bool(result),
+      'message': test_result.message,
+      }, sort_keys=True) + '\n')
+
+
+
+class CsvWriter(ResultWriter):
+  '''
+  Writes CSV rows of source, test, result and message after a header row.
+  '''
+  HEADER = ('source', 'test', 'result', 'message')
+
+  def __init__(self, stream):
+    super(CsvWriter, self).__init__(stream)
+    self._writer = csv.writer(stream, lineterminator='\n')
+    self._writer.writerow(self.HEADER)
+
+  def write(self, source, test_result):
+    self._writer.writerow((source, test_result.name, status(test_result),
+                           test_result.message or ''))
+
+
+
+class JUnitWriter(ResultWriter):
+  '''
+  Writes JUnit XML with a testsuite per configuration and a testcase per
+  test.  A suite's counts are only known once its last result is in, so
+  only the results of the current configuration are held back.
+  '''
+  def __init__(self, stream):
+    super(JUnitWriter, self).__init__(stream)
+    self._source = None
+    self._cases = []
+    self._failures = 0
+    self._errors = 0
+    stream.write('<?xml version="1.0" encoding="UTF-8"?>\n<testsuites>\n')
+
+  def write(self, source, test_result):
+    if self._cases and source != self._source:
+      self._write_suite()
+    self._source = source
+    name = quoteattr(test_result.name)
+    if test_result.result:
+      self._cases.append('    <testcase classname=%s name=%s/>\n' % (
+        quoteattr(str(source)), name))
+      return
+    if test_result.result is None:
+      self._errors += 1
+      element = 'error'
+    else:
+      self._failures += 1
+      element = 'failure'
+    message = test_result.message or ''
+    self._cases.append(
+      '    <testcase classname=%s name=%s>\n'
+      '      <%s message=%s>%s</%s>\n'
+      '    </testcase>\n' % (quoteattr(str(source)), name, element,
+                             quoteattr(message.strip() or 'Test failed'),
+                             escape(message), element))
+
+  def _write_suite(self):
+    '''Writes the suite of the current configuration'''
+    self.stream.write(
+      '  <testsuite name=%s tests="%d" failures="%d" errors="%d">\n' % (
+        quoteattr(str(self._source)), len(self._cases), self._failures,
+        self._errors))
+    self.stream.write(''.join(self._cases))
+    self.stream.write('  </testsuite>\n')
+    self._cases = []
+    self._failures = 0
+    self._errors = 0
+
+  def write_results(self, source, results):
+    for test_result in results:
+      self.write(source, test_result)
+    # The configuration is complete, so its suite can be written now
+    if self._cases:
+      self._write_suite()
+    self.flush()
+
+  def close(self):
+    if self._cases:
+      self._write_suite()
+    self.stream.write('</testsuites>\n')
+    self.flush()
+
+
+
+WRITERS = {
+  'text': TextWriter,
+  'jsonl': JsonLinesWriter,
+  'csv': CsvWriter,
+  'junit': JUnitWriter,
+}
@@ -27,8 +27,11 @@ setup(
     url='',
     packages=['netaudit'],
     scripts=[],
+    entry_points={
+        'console_scripts': ['netaudit = netaudit.cli:main'],
+    },
     data_files=[],
-    install_requires=['ciscoconfparse', 'pyyaml'],
+    install_requires=['ciscoconfparse>=1.2.39,<1.3', 'pyyaml'],
     tests_require=['mock'],
     test_suite='__main__.discoverTests',
 )
@@ -1,14 +1,17 @@
 ''''Unit tests for audit'''
 
+import os
+import tempfile
 import unittest
 from mock import patch, mock_open, PropertyMock, MagicMock
-import mock
 
 #from . import common
 import tests.common as C
 from netaudit import exceptions as E
 from netaudit import audit
-from netaudit.config import ConfigFile
+from netaudit import quantifier
+from netaudit.hooks import AuditHooks, AuditProfiler
+from netaudit.config import ConfigFile, ConfigDiff, build_tree
 
 class TestFileTests(unittest.TestCase):
   '''
@@ -36,12 +39,12 @@ class TestFileTests(unittest.TestCase):
     test_file.from_string(C.SAMPLE_TEST_FILE)
     self.assertEquals('Default', test_file.test_definitions[0][0])
 
-  @patch('yaml.safe_load', new=MagicMock())
-  @patch('netaudit.audit.open', new_callable=mock_open(
-    read_data=C.SAMPLE_TEST_FILE), create=True)
-  def test_load_calls_open(self, mock_file_stream):
+  @patch('netaudit.audit.parse_catalog', new=MagicMock())
+  def test_load_calls_open(self):
     filename = 'someFile'
-    audit.TestFile().load(filename)
+    mock_file_stream = mock_open(read_data=C.SAMPLE_TEST_FILE)
+    with patch('netaudit.audit.open', new=mock_file_stream, create=True):
+      audit.TestFile().load(filename)
     mock_file_stream.assert_called_with(filename)
 
   @patch('netaudit.audit.open', new=mock_open(
@@ -112,6 +115,60 @@ class TestFileTests(unittest.TestCase):
     self.assertRaises(E.TestNotFoundError, test_file.find_test_by_name,
                       test_name)
 
+  def test_find_test_by_name_missing_item_raises(self):
+    test_file = audit.TestFile()
+    test_file.config_version = 'NoSuchItem'
+    test_file.from_string(C.SAMPLE_TEST_FILE)
+    self.assertRaises(E.TestItemNotFoundError, test_file.find_test_by_name,
+                      'test2')
+
+  def test_compile_plan_resolves_tests(self):
+    test_file = audit.TestFile()
+    test_file.config_version = 'Catalyst3750'
+    test_file.from_string(C.SAMPLE_TEST_FILE)
+    plan = test_file.compile_plan('Basic')
+    self.assertEqual([test.pattern for test in plan.tests],
+                     ['this_is_cat3750'])
+
+  def test_compile_plan_is_reused(self):
+    test_file = audit.TestFile()
+    test_file.from_string(C.SAMPLE_TEST_FILE)
+    self.assertIs(test_file.compile_plan('Basic'),
+                  test_file.compile_plan('Basic'))
+
+  def test_compile_plan_keyed_by_config_version(self):
+    test_file = audit.TestFile()
+    test_file.from_string(C.SAMPLE_TEST_FILE)
+    plan = test_file.compile_plan('Basic')
+    test_file.config_version = 'Catalyst3750'
+    self.assertIsNot(test_file.compile_plan('Basic'), plan)
+
+  def test_from_string_invalidates_plans(self):
+    test_file = audit.TestFile()
+    test_file.from_string(C.SAMPLE_TEST_FILE)
+    plan = test_file.compile_plan('Basic')
+    test_file.from_string(C.SAMPLE_TEST_FILE)
+    self.assertIsNot(test_file.compile_plan('Basic'), plan)
+
+  def test_compile_plan_group_not_found_raises(self):
+    test_file = audit.TestFile()
+    test_file.from_string(C.SAMPLE_TEST_FILE)
+    self.assertRaises(E.TestGroupDoesNotExistError, test_file.compile_plan,
+                      'NotFound')
+
+  def test_literal_prefilter_switch_disables_prefilter(self):
+    test_file = audit.TestFile()
+    test_file.literal_prefilter = False
+    test_file.from_string(C.SAMPLE_TEST_FILE)
+    plan = test_file.compile_plan('Basic')
+    self.assertEqual(plan.text_scanner._literals, ())
+
+  def test_plan_is_immutable(self):
+    test_file = audit.TestFile()
+    test_file.from_string(C.SAMPLE_TEST_FILE)
+    plan = test_file.compile_plan('Basic')
+    self.assertRaises(AttributeError, setattr, plan, 'tests', ())
+
 
 
 class TestCaseTests(unittest.TestCase):
@@ -147,6 +204,29 @@ class TestCaseTests(unittest.TestCase):
       setattr(case, attr, properties[attr])
       self.assertEqual(getattr(case, attr), properties[attr])
 
+  def test_pattern_is_compiled(self):
+    case = audit.TestCase('MyTest', pattern=self.properties['pattern'])
+    self.assertEqual(case.regex.pattern, self.properties['pattern'])
+
+  def test_pattern_setter_recompiles(self):
+    case = audit.TestCase('MyTest', pattern='first')
+    case.pattern = ['second', '(third)']
+    self.assertEqual([regex.pattern for regex in case.regex],
+                     case.pattern)
+
+  def test_has_no_instance_dict(self):
+    case = audit.TestCase('MyTest')
+    self.assertFalse(hasattr(case, '__dict__'))
+
+  def test_evaluate_does_not_set_last_message(self):
+    conf = ConfigFile().from_string(C.SAMPLE_CONFIG)
+    pattern = ['interface GigabitEthernet1/0/27', '(shutdown)']
+    case = audit.TestCase('testTest', pattern=pattern, expected='shutdown')
+    result, message = case.evaluate(conf)
+    self.assertFalse(result)
+    self.assertRegexpMatches(message, '^Match failed')
+    self.assertIsNone(case.last_message)
+
   def test_getresult_result_returns_true(self):
     conf = MagicMock(ConfigFile)
     type(conf).contents = PropertyMock(return_value='PatternMatch')
@@ -231,6 +311,134 @@ class TestCaseTests(unittest.TestCase):
 
 
 
+QUANTIFIER_CONFIG = '''logging host 10.0.0.1
+logging host 10.0.0.2
+logging host 10.0.0.1
+interface GigabitEthernet1/0/1
+ shutdown
+interface GigabitEthernet1/0/2
+ no shutdown
+interface GigabitEthernet1/0/3
+ shutdown
+'''
+
+QUANTIFIER_TEST_FILE = '''---
+TestItems:
+  Default:
+    oneLoggingHost:
+      match: 'logging host (\\S+)'
+      expected: 10.0.0.1
+      quantifier: count == 1
+    anyLoggingHost:
+      match: 'logging host (\\S+)'
+      expected: 10.0.0.1
+TestGroups:
+  Logging:
+    - oneLoggingHost
+    - anyLoggingHost
+'''
+
+
+
+class QuantifierTests(unittest.TestCase):
+  '''
+  Tests for test quantifiers
+  '''
+  def setUp(self):
+    self.config = ConfigFile().from_string(QUANTIFIER_CONFIG)
+
+  def text_test(self, quantifier, expected='10.0.0.1'):
+    return audit.TestCase('test', pattern='logging host (\\S+)',
+                          expected=expected, quantifier=quantifier)
+
+  def config_test(self, quantifier):
+    return audit.TestCase('test', pattern=['^interface', '^ (shutdown)'],
+                          expected='shutdown', test_type='config',
+                          quantifier=quantifier)
+
+  def test_text_any_stops_at_first_match(self):
+    counts = [0, 0]
+    result, _ = self.text_test('any').evaluate(self.config, counts=counts)
+    self.assertTrue(result)
+    self.assertEqual(counts, [1, 1])
+
+  def test_text_all_stops_at_first_mismatch(self):
+    counts = [0, 0]
+    result, _ = self.text_test('all').evaluate(self.config, counts=counts)
+    self.assertFalse(result)
+    self.assertEqual(counts, [2, 2])
+
+  def test_text_all_passes(self):
+    test = self.text_test('all')
+    test.pattern = 'logging host (10)'
+    test.expected = '10'
+    self.assertTrue(test.evaluate(self.config)[0])
+
+  def test_text_none(self):
+    self.assertFalse(self.text_test('none').evaluate(self.config)[0])
+    self.assertTrue(self.text_test('none', '10.0.0.3').evaluate(
+      self.config)[0])
+
+  def test_text_count(self):
+    self.assertTrue(self.text_test('count == 2').evaluate(self.config)[0])
+    self.assertFalse(self.text_test('count == 1').evaluate(self.config)[0])
+    self.assertTrue(self.text_test('count < 3').evaluate(self.config)[0])
+
+  def test_config_default_reports_every_mismatch(self):
+    test = self.config_test(None)
+    test.pattern = ['^interface', '(speed)']
+    result, message = test.evaluate(self.config)
+    self.assertFalse(result)
+    self.assertEqual(message.count('Match failed'), 3)
+
+  def test_config_all_stops_at_first_mismatch(self):
+    result, message = self.config_test('all').evaluate(self.config)
+    self.assertFalse(result)
+    self.assertEqual(message, 'Match failed for configuration, line 5.\n')
+
+  def test_config_any(self):
+    result, message = self.config_test('any').evaluate(self.config)
+    self.assertTrue(result)
+    self.assertIsNone(message)
+
+  def test_config_none_reports_match(self):
+    result, message = self.config_test('none').evaluate(self.config)
+    self.assertFalse(result)
+    self.assertEqual(message,
+                     'Unexpected match for configuration, line 3.\n')
+
+  def test_config_count(self):
+    self.assertTrue(self.config_test('count >= 2').evaluate(self.config)[0])
+    self.assertFalse(self.config_test('count > 2').evaluate(self.config)[0])
+
+  def test_find_test_by_name_sets_quantifier(self):
+    test_file = audit.TestFile()
+    test_file.from_string(QUANTIFIER_TEST_FILE)
+    test = test_file.find_test_by_name('oneLoggingHost')
+    self.assertEqual(test.quantifier, quantifier.Quantifier('count', '==', 1))
+    self.assertFalse(test.scannable)
+
+  def test_plan_scans_only_any_tests(self):
+    test_file = audit.TestFile()
+    test_file.from_string(QUANTIFIER_TEST_FILE)
+    plan = test_file.compile_plan('Logging')
+    self.assertEqual([test.name for test in plan.text_scanner.tests],
+                     ['anyLoggingHost'])
+    self.assertEqual([res.result for res in plan.results(self.config)],
+                     [False, True])
+
+  def test_incremental_reevaluates_quantified_text_test(self):
+    test = self.text_test('count == 2')
+    previous = QUANTIFIER_CONFIG
+    current = previous.replace('logging host 10.0.0.1\n', '', 1)
+    self.config.contents = current
+    diff = ConfigDiff(previous, current)
+    self.assertFalse(test.incremental_result(self.config, diff, True))
+    diff = ConfigDiff(previous, previous.replace(' no shutdown', ''))
+    self.assertIsNone(test.incremental_result(self.config, diff, True))
+
+
+
 class AuditTestsTests(unittest.TestCase):
   '''
   Tests for audit test
@@ -304,24 +512,48 @@ class AuditTestsRunTests(unittest.TestCase):
     self.mocks['TestFile']().find_test_by_name.return_value = audit.TestCase()
     type(mocks['TestFile']()).test_groups = PropertyMock(
       return_value={'testGroup1': ['test1']})
+    self.result = audit.TestResult('test1', True, None)
+    plan = self.mocks['TestFile']().compile_plan.return_value
+    plan.results.return_value = iter([self.result])
 
   def tearDown(self):
     del self.patchers
     del self.mocks
 
-  def test_run_calls_testfile_find_test_by_name(self):
+  def test_run_calls_testfile_compile_plan(self):
+    suite = audit.AuditTests(C.FakeConfigFile())
+    suite.tests = audit.TestFile('fake_file')
+    suite.test_group = 'testGroup1'
+    suite.run()
+    suite.tests.compile_plan.assert_called_once_with('testGroup1')
+
+  def test_run_calls_plan_results(self):
     suite = audit.AuditTests(C.FakeConfigFile())
     suite.tests = audit.TestFile('fake_file')
     suite.test_group = 'testGroup1'
     suite.run()
-    suite.tests.find_test_by_name.assert_called_once_with('test1')
+    plan = suite.tests.compile_plan.return_value
+    plan.results.assert_called_once_with(suite.config, None)
 
-  def test_run_calls_testcase_getresult(self):
+  def test_run_sets_last_results(self):
     suite = audit.AuditTests(C.FakeConfigFile())
     suite.tests = audit.TestFile('fake_file')
     suite.test_group = 'testGroup1'
     suite.run()
-    audit.TestCase().get_result.assert_called_once_with(suite.config)
+    self.assertEqual(suite.last_results, [self.result])
+
+  def test_iter_run_yields_plan_results(self):
+    suite = audit.AuditTests(C.FakeConfigFile())
+    suite.tests = audit.TestFile('fake_file')
+    results = suite.iter_run('testGroup1')
+    self.assertEqual(list(results), [self.result])
+    self.assertIsNone(suite.last_results)
+
+  def test_iter_run_checks_group_when_called(self):
+    suite = audit.AuditTests(C.FakeConfigFile())
+    suite.tests = audit.TestFile('fake_file')
+    self.assertRaises(E.TestGroupDoesNotExistError, suite.iter_run,
+                      'testGroup2')
 
   def test_run_unset_test_group_raises_error(self):
     suite = audit.AuditTests(C.FakeConfigFile())
@@ -337,5 +569,422 @@ class AuditTestsRunTests(unittest.TestCase):
 
 
 
+class AuditTestsParseSharingTests(unittest.TestCase):
+  '''
+  Tests that an audit parses the configuration only once
+  '''
+  TESTS = '''---
+TestItems:
+  Default:
+    uplink:
+      type: "config"
+      match: ["interface GigabitEthernet1/0/28", "(shutdown)"]
+      expected: shutdown
+    vlan1:
+      type: "config"
+      match: ['interface Vlan1', 'ip address (\\S+)']
+      expected: 192.168.0.3
+TestGroups:
+  Hierarchical:
+    - uplink
+    - vlan1
+'''
+
+  @patch('netaudit.config.build_tree', wraps=build_tree)
+  def test_run_parses_config_once(self, mock_parse):
+    test_file = audit.TestFile()
+    test_file.from_string(self.TESTS)
+    conf = ConfigFile().from_string(C.SAMPLE_CONFIG)
+    suite = audit.AuditTests(conf, test_file, 'Hierarchical')
+    suite.run()
+    self.assertEqual(mock_parse.call_count, 1)
+    self.assertEqual([res.result for res in suite.last_results],
+                     [True, True])
+
+
+
+class AuditTestsIncrementalTests(unittest.TestCase):
+  '''
+  Tests for incremental audits
+  '''
+  TESTS = '''---
+TestItems:
+  Default:
+    sshVersion2:
+      match: "ip ssh version ([0-9])"
+      expected: "2"
+    snmpCommunity:
+      match: "snmp-server community (private)"
+      expected: "private"
+    uplink:
+      type: "config"
+      match: ["interface GigabitEthernet1/0/28", "(shutdown)"]
+      expected: shutdown
+    port27:
+      type: "config"
+      match: ["interface GigabitEthernet1/0/27", "(shutdown)"]
+      expected: shutdown
+    vtyLogin:
+      type: "config"
+      match: ["line vty", "(login)"]
+      expected: login
+TestGroups:
+  All:
+    - sshVersion2
+    - snmpCommunity
+    - uplink
+    - port27
+    - vtyLogin
+'''
+
+  def setUp(self):
+    self.tests = audit.TestFile()
+    self.tests.from_string(self.TESTS)
+    self.previous = ConfigFile().from_string(C.SAMPLE_CONFIG)
+    suite = audit.AuditTests(self.previous, self.tests, 'All')
+    suite.run()
+    self.previous_results = suite.last_results
+
+  def tearDown(self):
+    del self.tests
+    del self.previous
+    del self.previous_results
+
+  def audit(self, contents):
+    config = ConfigFile().from_string(contents)
+    full = audit.AuditTests(config, self.tests, 'All')
+    full.run()
+    suite = audit.AuditTests(config, self.tests, 'All')
+    suite.run_incremental(self.previous, self.previous_results)
+    self.assertEqual(suite.last_results, full.last_results)
+    return suite
+
+  def test_identical_config_evaluates_nothing(self):
+    suite = self.audit(C.SAMPLE_CONFIG)
+    self.assertEqual(suite.last_evaluated, [])
+
+  def test_unrelated_change_evaluates_nothing(self):
+    suite = self.audit(C.SAMPLE_CONFIG.replace(
+      'snmp-server community public RO', 'snmp-server community other RO'))
+    self.assertEqual(suite.last_evaluated, [])
+
+  def test_removed_matching_line_reevaluates_text_test(self):
+    suite = self.audit(C.SAMPLE_CONFIG.replace('ip ssh version 2\n', ''))
+    # port27 is re-evaluated because its failure message refers to a line
+    # that moved
+    self.assertEqual(suite.last_evaluated, ['sshVersion2', 'port27'])
+
+  def test_added_matching_line_passes_text_test(self):
+    suite = self.audit(C.SAMPLE_CONFIG.replace(
+      'snmp-server community public RO',
+      'snmp-server community private RO'))
+    self.assertEqual(suite.last_evaluated, ['snmpCommunity'])
+    self.assertTrue(suite.last_results[1].result)
+
+  def test_section_change_reevaluates_config_test(self):
+    suite = self.audit(C.SAMPLE_CONFIG.replace(' shutdown\n', ''))
+    self.assertEqual(suite.last_evaluated, ['uplink'])
+    self.assertFalse(suite.last_results[2].result)
+
+  def test_moved_lines_refresh_failure_message(self):
+    suite = self.audit(C.SAMPLE_CONFIG.replace('hostname SampleSwitch\n', ''))
+    self.assertEqual(suite.last_evaluated, ['port27'])
+
+  def crlf_previous(self, definitions):
+    self.tests = audit.TestFile()
+    self.tests.from_string(definitions)
+    self.previous = ConfigFile().from_string(
+      C.SAMPLE_CONFIG.replace('\n', '\r\n'))
+    suite = audit.AuditTests(self.previous, self.tests, 'All')
+    suite.run()
+    self.previous_results = suite.last_results
+
+  def test_crlf_section_change_reevaluates_config_test(self):
+    self.crlf_previous(self.TESTS.replace('GigabitEthernet1/0/28"',
+                                          'GigabitEthernet1/0/28$"'))
+    self.assertTrue(self.previous_results[2].result)
+    suite = self.audit(C.SAMPLE_CONFIG.replace(' shutdown\n', '')
+                       .replace('\n', '\r\n'))
+    self.assertEqual(suite.last_evaluated, ['uplink'])
+    self.assertFalse(suite.last_results[2].result)
+
+  def test_crlf_added_line_confirmed_by_text_test(self):
+    self.crlf_previous(self.TESTS.replace('community (private)',
+                                          'community (private) RO$'))
+    # Text tests read lines ending with the carriage return, so the added
+    # line does not make the test pass
+    suite = self.audit(C.SAMPLE_CONFIG.replace(
+      'snmp-server community public RO',
+      'snmp-server community private RO').replace('\n', '\r\n'))
+    self.assertEqual(suite.last_evaluated, ['snmpCommunity'])
+    self.assertFalse(suite.last_results[1].result)
+
+  def test_new_test_is_evaluated(self):
+    suite = audit.AuditTests(self.previous, self.tests, 'All')
+    suite.run_incremental(self.previous, self.previous_results[1:])
+    self.assertEqual(suite.last_evaluated, ['sshVersion2'])
+
+
+
+
+class AuditHooksTests(unittest.TestCase):
+  '''
+  Tests for profiling hooks
+  '''
+  def setUp(self):
+    self.tests = audit.TestFile()
+    self.tests.from_string(C.FLEET_TEST_FILE)
+    self.config = ConfigFile().from_string(C.SAMPLE_CONFIG)
+
+  def run_profiled(self, hooks):
+    suite = audit.AuditTests(self.config, self.tests, 'Fleet', hooks=hooks)
+    suite.run()
+    return suite.last_results
+
+  def test_profiled_results_match(self):
+    expected = list(self.tests.compile_plan('Fleet').results(self.config))
+    self.tests = audit.TestFile()
+    self.tests.from_string(C.FLEET_TEST_FILE)
+    self.assertEqual(self.run_profiled(AuditProfiler()), expected)
+
+  def test_events_in_order(self):
+    hooks = MagicMock(spec=AuditHooks)
+    self.run_profiled(hooks)
+    self.run_profiled(hooks)
+    names = [call[0] for call in hooks.method_calls]
+    self.assertEqual(names, ['plan_built',
+                             'test_started', 'test_finished',
+                             'parse_built', 'test_started', 'test_finished',
+                             'test_started', 'test_finished',
+                             'parse_built', 'test_started', 'test_finished'])
+
+  def test_counts_text_test(self):
+    profiler = AuditProfiler()
+    self.run_profiled(profiler)
+    timing = profiler.timings[0]
+    self.assertEqual(timing.name, 'sshVersion2')
+    # One candidate line contains the literal "ip ssh version "
+    self.assertEqual((timing.lines_scanned, timing.regex_evaluations), (1, 1))
+
+  def test_counts_config_test(self):
+    profiler = AuditProfiler()
+    self.run_profiled(profiler)
+    timing = profiler.timings[1]
+    lines = len(self.config.parse_tree.ConfigObjs)
+    self.assertEqual((timing.lines_scanned, timing.regex_evaluations),
+                     (lines, lines + 2))
+
+  def test_evaluate_counts_text_lines(self):
+    test = audit.TestCase('test', pattern='ip ssh version ([0-9])',
+                          expected='3')
+    counts = [0, 0]
+    test.evaluate(self.config, counts=counts)
+    lines = len(C.SAMPLE_CONFIG.split('\n'))
+    self.assertEqual(counts, [lines, lines])
+
+  def test_report_lists_slowest_first(self):
+    profiler = AuditProfiler()
+    profiler.test_finished(None, None, audit.TestTiming('fast', 1.0, 1, 1))
+    profiler.test_finished(None, None, audit.TestTiming('slow', 3.0, 5, 6))
+    profiler.test_finished(None, None, audit.TestTiming('fast', 1.5, 1, 1))
+    profiler.parse_built(None, 'native', 0.25)
+    self.assertEqual([timing.name for timing in profiler.slowest()],
+                     ['slow', 'fast'])
+    self.assertEqual(profiler.slowest(1)[0],
+                     audit.TestTiming('slow', 3.0, 5, 6))
+    report = profiler.report()
+    self.assertIn('3.000000s  slow  (5 lines, 6 regex evaluations)', report)
+    self.assertIn('Phase parse: 0.250000s', report)
+
+
+
+MULTI_GROUP_TEST_FILE = C.FLEET_TEST_FILE + '''  Basic:
+    - sshVersion2
+  Advanced:
+    - uplink
+    - sshVersion2
+    - uplink
+'''
+
+
+
+class MultiGroupTests(unittest.TestCase):
+  '''
+  Tests for running several test groups in one pass
+  '''
+  def setUp(self):
+    self.tests = audit.TestFile()
+    self.tests.from_string(MULTI_GROUP_TEST_FILE)
+    self.config = ConfigFile().from_string(C.SAMPLE_CONFIG)
+
+  def test_group_names(self):
+    self.assertEqual(self.tests.group_names('all'),
+                     ['Advanced', 'Basic', 'Fleet'])
+    self.assertEqual(self.tests.group_names(['Fleet', 'Basic']),
+                     ['Fleet', 'Basic'])
+    self.assertRaises(E.TestGroupDoesNotExistError, self.tests.group_names,
+                      ['Fleet', 'Missing'])
+
+  def test_plan_holds_each_test_once(self):
+    plan = self.tests.compile_plan(['Basic', 'Advanced'])
+    self.assertEqual([test.name for test in plan.tests],
+                     ['sshVersion2', 'uplink'])
+    self.assertIs(self.tests.compile_plan(('Basic', 'Advanced')), plan)
+    self.assertEqual(len(self.tests.compile_plan('Advanced').tests), 3)
+
+  def test_run_fans_out_results(self):
+    hooks = MagicMock(spec=AuditHooks)
+    suite = audit.AuditTests(self.config, self.tests, hooks=hooks)
+    suite.run('all')
+    self.assertEqual(hooks.test_finished.call_count, 2)
+    self.assertEqual(list(suite.last_results),
+                     ['Advanced', 'Basic', 'Fleet'])
+    for group, results in suite.last_results.items():
+      single = audit.AuditTests(self.config, self.tests, group)
+      single.run()
+      self.assertEqual(results, single.last_results)
+
+  def test_iter_run_yields_distinct_tests(self):
+    suite = audit.AuditTests(self.config, self.tests)
+    results = list(suite.iter_run(['Advanced', 'Basic']))
+    self.assertEqual([res.name for res in results], ['uplink', 'sshVersion2'])
+    self.assertRaises(E.TestGroupDoesNotExistError, suite.iter_run,
+                      ['Basic', 'Missing'])
+
+  def test_group_named_all(self):
+    self.tests.test_groups['all'] = ['uplink']
+    suite = audit.AuditTests(self.config, self.tests, 'all')
+    suite.run()
+    self.assertEqual([res.name for res in suite.last_results], ['uplink'])
+
+
+
+class BytesModeTests(unittest.TestCase):
+  '''
+  Tests for auditing configurations in bytes mode
+  '''
+  def setUp(self):
+    from tests.shard_unit_tests import SHARD_TEST_FILE, sharding_config
+    self.tests = audit.TestFile()
+    self.tests.from_string(SHARD_TEST_FILE)
+    self.contents = sharding_config()
+    self.config = ConfigFile().from_string(self.contents)
+    self.binary = ConfigFile().from_bytes(self.contents.encode('utf-8'))
+
+  def test_results_match_text_mode(self):
+    plan = self.tests.compile_plan('Shard')
+    expected = list(plan.results(self.config))
+    self.assertTrue(any(res.message for res in expected))
+    self.assertEqual(list(plan.results(self.binary)), expected)
+    for test in plan.tests:
+      self.assertEqual(test.evaluate(self.binary),
+                       test.evaluate(self.config), test.name)
+
+  def test_mapped_results_match_text_mode(self):
+    handle, file_name = tempfile.mkstemp()
+    self.addCleanup(os.remove, file_name)
+    with os.fdopen(handle, 'w') as file_stream:
+      file_stream.write(self.contents)
+    mapped = ConfigFile(file_name, mapped=True, binary=True)
+    suite = audit.AuditTests(mapped, self.tests, 'Shard')
+    suite.run()
+    serial = audit.AuditTests(self.config, self.tests, 'Shard')
+    serial.run()
+    self.assertEqual(suite.last_results, serial.last_results)
+
+  def test_scanner_for_bytes(self):
+    plan = self.tests.compile_plan('Shard')
+    scanner = plan.text_scanner.for_bytes()
+    self.assertIs(plan.text_scanner.for_bytes(), scanner)
+    self.assertIs(scanner.for_bytes(), scanner)
+    self.assertEqual(scanner.scan(self.binary.contents),
+                     plan.text_scanner.scan(self.contents))
+
+  def test_bytes_regex_follows_pattern(self):
+    test = audit.TestCase('t', pattern='^hostname (\\S+)', expected='a')
+    self.assertEqual(test.bytes_regex.pattern, b'^hostname (\\S+)')
+    test.pattern = '^ip (\\S+)'
+    self.assertEqual(test.bytes_regex.pattern, b'^ip (\\S+)')
+
+
+
+BUDGET_CONFIG = '''hostname Switch
+access-list 10 permit %s
+interface Vlan1
+ description %s
+!
+''' % ('a' * 40 + 'b', 'a' * 40 + 'b')
+
+BUDGET_TEST_FILE = '''---
+TestItems:
+  Default:
+    hostname:
+      match: "^hostname (\\\\S+)"
+      expected: Switch
+    acl:
+      match: "^access-list 10 permit ((?:a+)+)$"
+      expected: aaa
+    aclPrefix:
+      match: "^access-list (\\\\d+) (?:\\\\w+ ?)+"
+      expected: "10"
+    description:
+      type: config
+      match: ["^interface", "description ((?:a+)+)$"]
+      expected: aaa
+TestGroups:
+  Budget:
+    - hostname
+    - acl
+    - aclPrefix
+    - description
+'''
+
+
+
+class RegexBudgetTests(unittest.TestCase):
+  '''
+  Tests for regex budgets of tests with risky patterns
+  '''
+  def setUp(self):
+    self.tests = audit.TestFile()
+    self.tests.from_string(BUDGET_TEST_FILE)
+    self.config = ConfigFile().from_string(BUDGET_CONFIG)
+
+  def test_risky_tests_get_budget(self):
+    plan = self.tests.compile_plan('Budget')
+    self.assertEqual([test.budget for test in plan.tests],
+                     [None, audit.DEFAULT_REGEX_BUDGET,
+                      audit.DEFAULT_REGEX_BUDGET, audit.DEFAULT_REGEX_BUDGET])
+    self.assertEqual(plan.text_scanner.tests, plan.tests[:1])
+    self.tests.regex_budget = None
+    plan = self.tests.compile_plan('Budget')
+    self.assertTrue(all(test.budget is None for test in plan.tests))
+    self.assertTrue(plan.tests[2].risky)
+    self.assertIsNone(plan.text_scanner._prefilter)
+
+  def test_runaway_tests_error(self):
+    self.tests.regex_budget = 0.1
+    suite = audit.AuditTests(self.config, self.tests, 'Budget')
+    suite.run()
+    message = audit.BUDGET_MESSAGE % 0.1
+    self.assertEqual(suite.last_results, [
+      audit.TestResult('hostname', True, None),
+      audit.TestResult('acl', None, message),
+      audit.TestResult('aclPrefix', True, None),
+      audit.TestResult('description', None, message),
+      ])
+
+  def test_budget_does_not_change_results(self):
+    config = ConfigFile().from_string(BUDGET_CONFIG.replace('a' * 40 + 'b',
+                                                            'aaa'))
+    plan = self.tests.compile_plan('Budget')
+    self.tests.regex_budget = None
+    unbounded = self.tests.compile_plan('Budget')
+    self.assertEqual(list(plan.results(config)),
+                     list(unbounded.results(config)))
+    self.assertTrue(all(res.result for res in plan.results(config)))
+
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,127 @@
+'''Unit tests for cache'''
+
+import os
+import unittest
+from mock import patch
+
+import tests.common as C
+from netaudit import audit
+from netaudit import cache
+from netaudit import fleet
+from netaudit.config import ConfigFile, NATIVE
+from tests.fleet_unit_tests import FleetTestBase
+
+
+class ResultCacheTests(unittest.TestCase):
+  '''
+  Tests for ResultCache
+  '''
+  def setUp(self):
+    self.cache = cache.ResultCache(':memory:')
+    self.tests = audit.TestFile()
+    self.tests.from_string(C.FLEET_TEST_FILE)
+    self.config = ConfigFile().from_string(C.SAMPLE_CONFIG)
+
+  def tearDown(self):
+    self.cache.close()
+
+  def run_plan(self, config=None):
+    plan = self.tests.compile_plan('Fleet')
+    return list(plan.results(config or self.config, self.cache))
+
+  def test_first_run_misses(self):
+    self.run_plan()
+    self.assertEqual(self.cache.counts, (0, 2, 0))
+
+  def test_unchanged_config_hits(self):
+    expected = self.run_plan()
+    with patch.object(audit.TestCase, 'evaluate') as mock_evaluate:
+      results = self.run_plan(ConfigFile().from_string(C.SAMPLE_CONFIG))
+    self.assertFalse(mock_evaluate.called)
+    self.assertEqual(results, expected)
+    self.assertEqual(self.cache.counts, (2, 2, 0))
+
+  def test_cached_message_is_kept(self):
+    self.config.contents = C.SAMPLE_CONFIG.replace(' shutdown\n', '')
+    expected = self.run_plan()
+    self.assertIsNotNone(expected[1].message)
+    self.assertEqual(self.run_plan(), expected)
+
+  def test_changed_config_misses(self):
+    self.run_plan()
+    self.run_plan(ConfigFile().from_string(C.SAMPLE_CONFIG + '!\n'))
+    self.assertEqual(self.cache.hits, 0)
+
+  def test_changed_definition_misses(self):
+    self.run_plan()
+    self.tests = audit.TestFile()
+    self.tests.from_string(C.FLEET_TEST_FILE.replace('"2"', '"1"'))
+    results = self.run_plan()
+    self.assertEqual(self.cache.hits, 1)
+    self.assertFalse(results[0].result)
+
+  def test_engine_is_part_of_config_test_key(self):
+    self.run_plan()
+    self.tests.config_engine = NATIVE
+    self.run_plan()
+    self.assertEqual(self.cache.hits, 1)
+
+  def test_evicts_least_recently_used(self):
+    small = cache.ResultCache(':memory:', max_entries=3)
+    plan = self.tests.compile_plan('Fleet')
+    first = ConfigFile().from_string(C.SAMPLE_CONFIG)
+    second = ConfigFile().from_string(C.SAMPLE_CONFIG + '!\n')
+    with patch('time.time', side_effect=[1, 2]):
+      list(plan.results(first, small))
+      list(plan.results(second, small))
+    # Evicted down to 90% of max_entries
+    self.assertEqual(small.evictions, 2)
+    self.assertEqual(len(small.lookup(plan, second)), 2)
+    self.assertEqual(len(small.lookup(plan, first)), 0)
+
+  def test_rows_counted_only_past_max_entries(self):
+    small = cache.ResultCache(':memory:', max_entries=10)
+    plan = self.tests.compile_plan('Fleet')
+    configs = [ConfigFile().from_string(C.SAMPLE_CONFIG + '!\n' * index)
+               for index in range(6)]
+    with patch.object(cache.ResultCache, '_count_rows',
+                      wraps=small._count_rows) as mock_count:
+      for config in configs:
+        list(plan.results(config, small))
+    self.assertEqual(mock_count.call_count, 1)
+    self.assertEqual(small.evictions, 3)
+    self.assertEqual(small._count_rows(), 9)
+    indexes = [row[1] for row in
+               small._connection.execute('PRAGMA index_list(results)')]
+    self.assertIn('results_used', indexes)
+
+  def test_report(self):
+    self.cache.record(hits=3, misses=1, evictions=2)
+    self.assertEqual(self.cache.report(), 'Result cache: 3 hits, 1 misses '
+                     '(75.0% hit rate), 2 evicted')
+
+  def test_audit_tests_run_uses_cache(self):
+    suite = audit.AuditTests(self.config, self.tests, 'Fleet', self.cache)
+    suite.run()
+    suite.run()
+    self.assertEqual(self.cache.counts, (2, 2, 0))
+
+
+
+class FleetCacheTests(FleetTestBase):
+  '''
+  Tests for FleetAuditor with a result cache
+  '''
+  def test_workers_share_cache(self):
+    result_cache = cache.ResultCache(os.path.join(self.directory, 'cache.db'))
+    auditor = fleet.FleetAuditor(self.tests, 'Fleet', jobs=2,
+                                 cache=result_cache)
+    expected = list(auditor.run(self.file_names))
+    self.assertEqual(list(auditor.run(self.file_names)), expected)
+    self.assertEqual(result_cache.counts, (10, 10, 0))
+    result_cache.close()
+
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,312 @@
+'''Unit tests for catalog'''
+
+import os
+import shutil
+import tempfile
+import unittest
+from mock import patch
+
+import yaml
+
+import tests.common as C
+from netaudit import catalog
+from netaudit import exceptions as E
+from netaudit.audit import TestFile
+from netaudit.config import ConfigFile
+
+SAMPLE_DIR = os.path.join(os.path.dirname(__file__), '..', 'sample')
+
+SPLIT_CATALOG = {
+  'main.yaml': '''---
+Include:
+  - groups.yaml
+  - items/
+TestItems:
+  Default:
+    sshVersion2:
+      match: "ip ssh version ([0-9])"
+      expected: "2"
+''',
+  'groups.yaml': '''TestGroups:
+  Fleet:
+    - sshVersion2
+    - uplink
+  Other:
+    - port27
+''',
+  'items/a_default.yaml': '''TestItems:
+  Default:
+    sshVersion2:
+      match: "ip ssh version ([0-9])"
+      expected: "1"
+    uplink:
+      type: "config"
+      match: ["interface GigabitEthernet1/0/28", "(shutdown)"]
+      expected: shutdown
+''',
+  'items/b_catalyst.yaml': '''TestItems:
+  'Catalyst3750':
+    uplink:
+      type: config
+      match: ["interface GigabitEthernet1/0/28", "(description) noaccess"]
+      expected: description
+''',
+  'items/c_other.yaml': '''TestItems:
+  Default:
+    port27:
+      type: config
+      match: ["interface GigabitEthernet1/0/27", "(shutdown)"]
+      expected: shutdown
+''',
+  }
+
+
+class ParseCatalogTests(unittest.TestCase):
+  '''
+  Tests for parsing and validating test definitions
+  '''
+  def test_parse_matches_safe_load(self):
+    self.assertEqual(catalog.parse_catalog(C.SAMPLE_TEST_FILE),
+                     C.SAMPLE_TEST_FILE_DICT)
+
+  def test_missing_sections_raises(self):
+    self.assertRaises(E.InvalidTestDefinitionError, catalog.parse_catalog,
+                      'Other: {}')
+
+  def test_missing_expected_raises(self):
+    text = C.SAMPLE_TEST_FILE.replace('      expected: "match2"\n', '')
+    self.assertRaises(E.InvalidTestDefinitionError, catalog.parse_catalog,
+                      text)
+
+  def test_invalid_quantifier_raises(self):
+    text = C.SAMPLE_TEST_FILE.replace('expected: "match2"',
+                                      'expected: "match2"\n'
+                                      '      quantifier: most')
+    self.assertRaises(E.InvalidTestDefinitionError, catalog.parse_catalog,
+                      text)
+
+  def test_group_must_be_list(self):
+    text = C.SAMPLE_TEST_FILE + '  Other: bin-test\n'
+    self.assertRaises(E.InvalidTestDefinitionError, catalog.parse_catalog,
+                      text)
+
+
+
+class LoadCatalogTests(unittest.TestCase):
+  '''
+  Tests for the parsed catalog cache
+  '''
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.cache_dir = os.path.join(self.directory, 'cache')
+    self.file_name = os.path.join(self.directory, 'tests.yaml')
+    self.write(C.SAMPLE_TEST_FILE)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def write(self, text, mtime=None):
+    with open(self.file_name, 'w') as file_stream:
+      file_stream.write(text)
+    if mtime is not None:
+      os.utime(self.file_name, (mtime, mtime))
+
+  def load(self):
+    with patch('netaudit.catalog.parse_catalog',
+               wraps=catalog.parse_catalog) as mock_parse:
+      result = catalog.load_catalog(self.file_name, self.cache_dir)
+    return result, mock_parse.call_count
+
+  def test_first_load_parses_and_caches(self):
+    self.assertEqual(self.load(), (C.SAMPLE_TEST_FILE_DICT, 1))
+    cache_name = catalog.cache_file_name(self.cache_dir, self.file_name)
+    self.assertTrue(os.path.exists(cache_name))
+
+  def test_unchanged_file_is_not_parsed(self):
+    self.load()
+    self.assertEqual(self.load(), (C.SAMPLE_TEST_FILE_DICT, 0))
+
+  def test_touched_file_with_same_contents_is_not_parsed(self):
+    self.load()
+    self.write(C.SAMPLE_TEST_FILE, mtime=1000000000)
+    self.assertEqual(self.load()[1], 0)
+
+  def test_changed_file_is_parsed(self):
+    self.load()
+    self.write(C.SAMPLE_TEST_FILE.replace('match2', 'match3'),
+               mtime=1000000000)
+    result, parses = self.load()
+    self.assertEqual(parses, 1)
+    self.assertEqual(result['TestItems']['Default']['test2']['expected'],
+                     'match3')
+
+  def test_corrupt_cache_is_ignored(self):
+    self.load()
+    cache_name = catalog.cache_file_name(self.cache_dir, self.file_name)
+    with open(cache_name, 'wb') as file_stream:
+      file_stream.write(b'not a pickle')
+    self.assertEqual(self.load(), (C.SAMPLE_TEST_FILE_DICT, 1))
+
+  def test_invalid_catalog_is_not_cached(self):
+    self.write('Other: {}\n')
+    self.assertRaises(E.InvalidTestDefinitionError, catalog.load_catalog,
+                      self.file_name, self.cache_dir)
+    cache_name = catalog.cache_file_name(self.cache_dir, self.file_name)
+    self.assertFalse(os.path.exists(cache_name))
+
+  def test_test_file_uses_cache(self):
+    TestFile(self.file_name, catalog_cache_dir=self.cache_dir)
+    with patch('netaudit.catalog.parse_catalog') as mock_parse:
+      test_file = TestFile(self.file_name, catalog_cache_dir=self.cache_dir)
+    self.assertFalse(mock_parse.called)
+    self.assertEqual(test_file.test_groups,
+                     C.SAMPLE_TEST_FILE_DICT['TestGroups'])
+
+
+
+
+class ScanCatalogTests(unittest.TestCase):
+  '''
+  Tests for scan_catalog
+  '''
+  def assert_scan_matches_parse(self, text):
+    layout = catalog.scan_catalog(text)
+    parsed = yaml.safe_load(text)
+    self.assertEqual(dict((item, sorted(tests)) for item, tests in
+                          layout['TestItems'].items()),
+                     dict((item, sorted(tests)) for item, tests in
+                          parsed['TestItems'].items()))
+    groups = yaml.safe_load(layout['TestGroups'])
+    self.assertEqual(groups['TestGroups'], parsed['TestGroups'])
+
+  def test_sample_tests(self):
+    with open(os.path.join(SAMPLE_DIR, 'tests.yaml')) as file_stream:
+      self.assert_scan_matches_parse(file_stream.read())
+
+  def test_common_catalogs(self):
+    for text in (C.SAMPLE_TEST_FILE, C.FLEET_TEST_FILE):
+      self.assert_scan_matches_parse(text)
+
+  def test_includes(self):
+    layout = catalog.scan_catalog(SPLIT_CATALOG['main.yaml'])
+    self.assertEqual(layout['Include'], ['groups.yaml', 'items/'])
+    layout = catalog.scan_catalog("Include: 'a b.yaml' # one file\n")
+    self.assertEqual(layout['Include'], ['a b.yaml'])
+
+  def test_unsupported_layout_returns_none(self):
+    for text in ('TestItems: {Default: {}}\n',
+                 'Include: [a.yaml, b.yaml]\n',
+                 'TestItems:\n  Default:\n    <<: *base\n',
+                 'TestItems:\n\tDefault: {}\n',
+                 'TestItems:\n  yes:\n    a: {}\n'):
+      self.assertIsNone(catalog.scan_catalog(text), text)
+
+
+
+class SplitCatalogTests(unittest.TestCase):
+  '''
+  Tests for catalogs split over several files with Include
+  '''
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    os.mkdir(os.path.join(self.directory, 'items'))
+    for name, text in SPLIT_CATALOG.items():
+      self.write(name, text)
+    self.main = os.path.join(self.directory, 'main.yaml')
+    self.config = ConfigFile().from_string(C.SAMPLE_CONFIG)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def write(self, name, text):
+    with open(os.path.join(self.directory, name), 'w') as file_stream:
+      file_stream.write(text)
+
+  def parsed_files(self, test_file, func):
+    with patch('netaudit.catalog.parse_catalog',
+               wraps=catalog.parse_catalog) as mock_parse:
+      result = func()
+    texts = [call[0][0] for call in mock_parse.call_args_list]
+    names = [name for name, text in SPLIT_CATALOG.items() if text in texts]
+    return result, sorted(names)
+
+  def test_groups_loaded_items_not(self):
+    test_file, parsed = self.parsed_files(None, lambda: TestFile(self.main))
+    self.assertEqual(sorted(test_file.test_groups), ['Fleet', 'Other'])
+    self.assertEqual(test_file.test_definitions, [])
+    # Only the TestGroups section of groups.yaml is parsed
+    self.assertEqual(parsed, [])
+
+  def test_plan_parses_reachable_files(self):
+    test_file = TestFile(self.main)
+    plan, parsed = self.parsed_files(
+      test_file, lambda: test_file.compile_plan('Fleet'))
+    self.assertEqual(parsed, ['items/a_default.yaml', 'main.yaml'])
+    self.assertEqual([test.name for test in plan.tests],
+                     ['sshVersion2', 'uplink'])
+
+  def test_including_file_overrides_included(self):
+    test_file = TestFile(self.main)
+    self.assertEqual(test_file.find_test_by_name('sshVersion2').expected,
+                     '2')
+
+  def test_config_version_chain(self):
+    test_file = TestFile(self.main)
+    test_file.config_version = 'Catalyst3750'
+    plan, parsed = self.parsed_files(
+      test_file, lambda: test_file.compile_plan('Fleet'))
+    self.assertIn('items/b_catalyst.yaml', parsed)
+    self.assertEqual(plan.tests[1].expected, 'description')
+    self.assertEqual([res.result for res in plan.results(self.config)],
+                     [True, True])
+
+  def test_other_group_loads_later(self):
+    test_file = TestFile(self.main)
+    test_file.compile_plan('Fleet')
+    plan, parsed = self.parsed_files(
+      test_file, lambda: test_file.compile_plan('Other'))
+    self.assertEqual(parsed, ['items/c_other.yaml'])
+    self.assertEqual([res.result for res in plan.results(self.config)],
+                     [False])
+    self.assertEqual(test_file.find_test_by_name('uplink').expected,
+                     'shutdown')
+
+  def test_matches_single_file(self):
+    test_file = TestFile(self.main)
+    single = TestFile()
+    single.from_string(SPLIT_CATALOG['items/a_default.yaml'])
+    single.from_string(SPLIT_CATALOG['main.yaml'].replace(
+      'Include:\n  - groups.yaml\n  - items/\n', ''))
+    single.from_string(SPLIT_CATALOG['groups.yaml'])
+    for name in ('sshVersion2', 'uplink'):
+      self.assertEqual(test_file.find_test_by_name(name).pattern,
+                       single.find_test_by_name(name).pattern)
+
+  def test_flow_style_file_is_parsed(self):
+    self.write('items/c_other.yaml', 'TestItems: {Default: {port27: '
+               '{match: "(x)", expected: x}}}\n')
+    test_file = TestFile(self.main)
+    self.assertEqual(test_file.find_test_by_name('port27').pattern, '(x)')
+
+  def test_include_cycle(self):
+    self.write('groups.yaml', SPLIT_CATALOG['groups.yaml'] +
+               'Include: main.yaml\n')
+    self.assertEqual(len(catalog.CatalogIndex(self.main).files), 5)
+
+  def test_missing_include_raises(self):
+    self.write('main.yaml', 'Include: missing.yaml\n')
+    self.assertRaises(E.InvalidTestDefinitionError, TestFile, self.main)
+
+  def test_uses_catalog_cache(self):
+    cache_dir = os.path.join(self.directory, 'cache')
+    TestFile(self.main, catalog_cache_dir=cache_dir).compile_plan('Fleet')
+    test_file = TestFile(self.main, catalog_cache_dir=cache_dir)
+    plan, parsed = self.parsed_files(
+      test_file, lambda: test_file.compile_plan('Fleet'))
+    self.assertEqual(parsed, [])
+    self.assertEqual(len(plan.tests), 2)
+
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,129 @@
+'''Unit tests for cli'''
+
+import os
+import unittest
+from mock import patch
+
+from netaudit import cli
+from netaudit.store import ResultStore
+from tests.fleet_unit_tests import FleetTestBase
+import tests.common as C
+
+
+class CliTests(FleetTestBase):
+  '''
+  Tests for command line interface
+  '''
+  def setUp(self):
+    super(CliTests, self).setUp()
+    self.test_file = os.path.join(self.directory, 'tests.yaml')
+    with open(self.test_file, 'w') as file_stream:
+      file_stream.write(C.FLEET_TEST_FILE)
+
+  def test_parse_args_sets_jobs(self):
+    args = cli.parse_args(['-g', 'Fleet', '-j', '3', 'tests.yaml', 'a.cfg'])
+    self.assertEqual(args.jobs, 3)
+
+  def test_parse_args_requires_group(self):
+    with patch('sys.stderr'):
+      self.assertRaises(SystemExit, cli.parse_args, ['tests.yaml', 'a.cfg'])
+
+  @patch('sys.stdout')
+  def test_main_reports_failures(self, mock_stdout):
+    status = cli.main(['-g', 'Fleet', '-j', '1', self.test_file] +
+                      self.file_names)
+    output = ''.join(call[0][0] for call in mock_stdout.write.call_args_list)
+    self.assertEqual(status, 1)
+    self.assertIn('%s: sshVersion2: FAIL' % self.file_names[1], output)
+    self.assertIn('%s: sshVersion2: OK' % self.file_names[0], output)
+
+  @patch('sys.stderr')
+  @patch('sys.stdout')
+  def test_main_fails_on_missing_config(self, mock_stdout, mock_stderr):
+    missing = os.path.join(self.directory, 'missing.cfg')
+    status = cli.main(['-g', 'Fleet', '-j', '1', self.test_file,
+                       self.file_names[0], missing])
+    self.assertEqual(status, 2)
+    self.assertFalse(mock_stdout.write.called)
+    self.assertIn(missing, mock_stderr.write.call_args[0][0])
+
+  @patch('sys.stdout')
+  def test_main_runs_several_groups(self, mock_stdout):
+    with open(self.test_file, 'a') as file_stream:
+      file_stream.write('  Basic:\n    - sshVersion2\n')
+    cli.main(['-g', 'Fleet', '-g', 'Basic', '-j', '1', self.test_file,
+              self.file_names[0]])
+    output = ''.join(call[0][0] for call in mock_stdout.write.call_args_list)
+    self.assertEqual(output.count('sshVersion2'), 1)
+    self.assertEqual(output.count('uplink'), 1)
+
+  @patch('sys.stdout')
+  def test_main_adds_to_store(self, mock_stdout):
+    store_file = os.path.join(self.directory, 'results.store')
+    cli.main(['-g', 'Fleet', '-j', '1', '--store', store_file,
+              self.test_file, self.file_names[0]])
+    cli.main(['-g', 'Fleet', '-j', '1', '--store', store_file,
+              self.test_file] + self.file_names[:2])
+    result_store = ResultStore.load(store_file)
+    self.assertEqual(len(result_store), 2)
+    self.assertEqual(result_store.failing_devices('sshVersion2'),
+                     [self.file_names[1]])
+
+  @patch('sys.stdout')
+  def test_main_passes(self, mock_stdout):
+    status = cli.main(['-g', 'Fleet', '-j', '1', self.test_file,
+                       self.file_names[0]])
+    self.assertEqual(status, 0)
+
+  def test_main_writes_output_file(self):
+    output = os.path.join(self.directory, 'results.jsonl')
+    cli.main(['-g', 'Fleet', '-j', '1', '-f', 'jsonl', '-o', output,
+              self.test_file] + self.file_names)
+    with open(output) as file_stream:
+      lines = file_stream.read().splitlines()
+    self.assertEqual(len(lines), 2 * len(self.file_names))
+    self.assertIn('"test": "sshVersion2"', lines[0])
+
+  @patch('sys.stderr')
+  @patch('sys.stdout')
+  def test_main_reports_cache(self, mock_stdout, mock_stderr):
+    argv = ['-g', 'Fleet', '-j', '1', '--cache',
+            os.path.join(self.directory, 'cache.db'), self.test_file,
+            self.file_names[0]]
+    cli.main(argv)
+    cli.main(argv)
+    output = ''.join(call[0][0] for call in mock_stderr.write.call_args_list)
+    self.assertIn('Result cache: 2 hits, 0 misses', output)
+
+  @patch('sys.stderr')
+  @patch('sys.stdout')
+  def test_main_reports_profile(self, mock_stdout, mock_stderr):
+    cli.main(['-g', 'Fleet', '-j', '2', '--profile', '1', self.test_file] +
+             self.file_names)
+    output = ''.join(call[0][0] for call in mock_stderr.write.call_args_list)
+    self.assertIn('Slowest tests:', output)
+    self.assertIn('Tests: ', output)
+    self.assertIn(' in 10 evaluations', output)
+
+
+  @patch('sys.stderr')
+  @patch('sys.stdout')
+  def test_main_warns_about_risky_patterns(self, mock_stdout, mock_stderr):
+    with open(self.test_file, 'w') as file_stream:
+      file_stream.write(C.FLEET_TEST_FILE.replace('TestGroups:', '''    risky:
+      match: "^banner ((?:\\\\S+ ?)+)"
+      expected: x
+TestGroups:
+  Risky:
+    - risky'''))
+    cli.main(['-g', 'Risky', '-j', '1', '--regex-budget', '2.5',
+              self.test_file, self.file_names[0]])
+    output = ''.join(call[0][0] for call in mock_stderr.write.call_args_list)
+    self.assertIn('Warning: test risky has a pattern prone to catastrophic '
+                  'backtracking; it runs with a regex budget of 2.5s.',
+                  output)
+
+
+
+if __name__ == '__main__':
+  unittest.main()
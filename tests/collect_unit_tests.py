@@ -0,0 +1,375 @@
+'''Unit tests for collect'''
+
+import re
+import sys
+import time
+import socket
+import unittest
+
+from netaudit.connect import Connection
+
+if sys.version_info >= (3, 5):
+  import asyncio
+  from netaudit import collect
+else:
+  asyncio = None
+
+try:
+  import asyncssh
+except ImportError:
+  asyncssh = None
+
+
+STAND_IN_CONFIG = b'\r\n'.join(
+  [b'!', b'hostname sw1'] +
+  [b'interface GigabitEthernet1/0/%d\r\n description port %d\r\n!' %
+   (index, index) for index in range(1, 5001)] +
+  [b'ip ssh version 2', b'end'])
+
+PROMPT = b'sw1#'
+
+
+class StandInShell(object):
+  '''
+  Answers like a switch shell: optional login, then the output of each
+  command followed by the prompt, which changes in configuration mode and
+  with the hostname.
+  '''
+  def __init__(self, server, write, close, login=True):
+    '''
+    :server: StandInServer keeping count of sessions
+    :write: function sending bytes to the client
+    :close: function closing the session
+    :login: boolean, ask for a username and password first
+    '''
+    self.server = server
+    self.write = write
+    self.close = close
+    self.buffer = b''
+    self.prompt = PROMPT
+    self.state = 'username' if login else 'command'
+    server.opened()
+    if login:
+      write(b'Username: ')
+    else:
+      self.start()
+
+  def start(self):
+    self.write(b'\r\nAuthorized access only #\r\n' + self.prompt)
+
+  def feed(self, data):
+    self.buffer += re.sub(b'\xff[\xfb-\xfe].', b'', data)
+    while b'\n' in self.buffer:
+      line, self.buffer = self.buffer.split(b'\n', 1)
+      self.line_received(line.rstrip(b'\r'))
+
+  def line_received(self, line):
+    if self.state == 'username':
+      self.state = 'password'
+      self.write(line + b'\r\nPassword: ')
+    elif self.state == 'password':
+      if line != b'secret':
+        self.write(b'\r\n% Login invalid\r\n')
+        self.close()
+        return
+      self.state = 'command'
+      self.start()
+    else:
+      self.write(line + b'\r\n')
+      if line == b'show running-config':
+        output = STAND_IN_CONFIG + b'\r\n'
+      elif line == b'terminal length 0':
+        output = b''
+      elif line == b'configure terminal':
+        output = b''
+        self.prompt = self.prompt[:-1] + b'(config)#'
+      elif line.startswith(b'hostname '):
+        output = b''
+        self.prompt = line.split()[1] + b'(config)#'
+      else:
+        output = b'% Invalid input\r\n'
+      if self.server.silent:
+        return
+      self.server.busy(1)
+      loop = asyncio.get_event_loop()
+      output += self.prompt
+      pieces = self.server.pieces
+      size = -(-len(output) // pieces)
+      for index in range(pieces):
+        loop.call_later(self.server.delay * (index + 1), self.answer,
+                        output[index * size:(index + 1) * size],
+                        index == pieces - 1)
+
+  def answer(self, output, last=True):
+    if last:
+      self.server.busy(-1)
+    self.write(output)
+
+
+
+class StandInServer(object):
+  '''
+  Counts the sessions of stand-in devices and the commands they are
+  answering at once.
+  '''
+  def __init__(self, delay=0, silent=False, pieces=1):
+    '''
+    :delay: seconds before each command is answered, or each piece of the
+      answer
+    :silent: boolean, never answer commands
+    :pieces: number of pieces each answer is sent in
+    '''
+    self.delay = delay
+    self.silent = silent
+    self.pieces = pieces
+    self.sessions = 0
+    self.answering = 0
+    self.max_answering = 0
+
+  def opened(self):
+    self.sessions += 1
+
+  def busy(self, change):
+    self.answering += change
+    self.max_answering = max(self.max_answering, self.answering)
+
+
+
+class StandInTelnet(object):
+  '''
+  asyncio protocol of a stand-in telnet device, which also offers options
+  the client has to refuse.
+  '''
+  def __init__(self, server):
+    self.server = server
+    self.shell = None
+    self.transport = None
+
+  def connection_made(self, transport):
+    self.transport = transport
+    transport.write(b'\xff\xfb\x01\xff\xfd\x1f')
+    self.shell = StandInShell(self.server, transport.write, transport.close)
+
+  def data_received(self, data):
+    self.shell.feed(data)
+
+  def eof_received(self):
+    return False
+
+  def connection_lost(self, exc):
+    pass
+
+
+
+@unittest.skipIf(asyncio is None, 'the collector needs Python 3.5')
+class CollectorTestBase(unittest.TestCase):
+  '''
+  Runs a collector against stand-in devices on an event loop of the test.
+  '''
+  def setUp(self):
+    self.loop = asyncio.new_event_loop()
+    self.addCleanup(self.loop.close)
+
+  def serve(self, protocol_factory):
+    '''Returns port of a stand-in server closed when the test ends'''
+    server = self.loop.run_until_complete(
+      self.loop.create_server(protocol_factory, '127.0.0.1', 0))
+    def close():
+      server.close()
+      self.loop.run_until_complete(server.wait_closed())
+    self.addCleanup(close)
+    return server.sockets[0].getsockname()[1]
+
+  def collect(self, collector, connections):
+    return self.loop.run_until_complete(collector.collect(connections))
+
+
+
+class TelnetCollectorTests(CollectorTestBase):
+  '''
+  Tests for Collector over telnet
+  '''
+  def connections(self, port, count=1, password='secret'):
+    return [Connection('127.0.0.1', port=port, username='user%d' % index,
+                       password=password) for index in range(count)]
+
+  def test_collects_configuration(self):
+    server = StandInServer()
+    port = self.serve(lambda: StandInTelnet(server))
+    collector = collect.Collector(protocol=collect.TELNET, timeout=5)
+    connections = self.connections(port)
+    result = self.collect(collector, connections)[0]
+    self.assertIsNone(result.error)
+    self.assertIs(result.connection, connections[0])
+    self.assertEqual(result.outputs,
+                     [b'', STAND_IN_CONFIG.replace(b'\r\n', b'\n')])
+    config = collect.config_from_result(result)
+    self.assertTrue(config.binary)
+    self.assertEqual(config.file_name, '127.0.0.1')
+
+  def test_concurrency_limit(self):
+    server = StandInServer(delay=0.05)
+    port = self.serve(lambda: StandInTelnet(server))
+    collector = collect.Collector(protocol=collect.TELNET, concurrency=4,
+                                  timeout=5)
+    connections = self.connections(port, 12)
+    start = time.time()
+    results = self.collect(collector, connections)
+    self.assertEqual([result.connection for result in results], connections)
+    self.assertTrue(all(result.error is None for result in results))
+    self.assertEqual(server.sessions, 12)
+    self.assertTrue(1 < server.max_answering <= 4)
+    # Three rounds of two delayed commands, not twelve
+    self.assertTrue(time.time() - start < 12 * 2 * 0.05)
+
+  def test_errors_reported_per_device(self):
+    server = StandInServer()
+    port = self.serve(lambda: StandInTelnet(server))
+    collector = collect.Collector(protocol=collect.TELNET, timeout=5)
+    connections = (self.connections(port, password='wrong') +
+                   self.connections(port))
+    results = self.collect(collector, connections)
+    self.assertIn('Session closed', results[0].error)
+    self.assertIsNone(results[1].error)
+
+  def test_silent_device_times_out(self):
+    server = StandInServer(silent=True)
+    port = self.serve(lambda: StandInTelnet(server))
+    collector = collect.Collector(protocol=collect.TELNET, timeout=0.2)
+    result = self.collect(collector, self.connections(port))[0]
+    self.assertEqual(result.error, 'Timed out waiting for the device.')
+    self.assertEqual(result.outputs, [])
+
+  def test_slow_output_not_cut_off(self):
+    # Every piece arrives within the timeout but the whole output does not
+    server = StandInServer(delay=0.1, pieces=6)
+    port = self.serve(lambda: StandInTelnet(server))
+    collector = collect.Collector(protocol=collect.TELNET, timeout=0.3)
+    result = self.collect(collector, self.connections(port))[0]
+    self.assertIsNone(result.error)
+    self.assertEqual(result.outputs[-1],
+                     STAND_IN_CONFIG.replace(b'\r\n', b'\n'))
+
+  def test_prompt_follows_mode(self):
+    server = StandInServer()
+    port = self.serve(lambda: StandInTelnet(server))
+    commands = ('configure terminal', 'show running-config')
+    collector = collect.Collector(commands, protocol=collect.TELNET,
+                                  timeout=1)
+    start = time.time()
+    result = self.collect(collector, self.connections(port))[0]
+    self.assertIsNone(result.error)
+    self.assertEqual(result.outputs,
+                     [b'', STAND_IN_CONFIG.replace(b'\r\n', b'\n')])
+    self.assertTrue(time.time() - start < 1)
+
+  def test_prompt_follows_hostname(self):
+    server = StandInServer()
+    port = self.serve(lambda: StandInTelnet(server))
+    commands = ('configure terminal', 'hostname sw2', 'x', 'y', 'z')
+    collector = collect.Collector(commands, protocol=collect.TELNET,
+                                  timeout=0.3)
+    start = time.time()
+    result = self.collect(collector, self.connections(port))[0]
+    self.assertIsNone(result.error)
+    self.assertEqual(result.outputs, [b'', b''] + [b'% Invalid input'] * 3)
+    # Only the command changing the hostname waits out the timeout
+    self.assertTrue(time.time() - start < 2 * 0.3)
+
+  def test_run_reports_unreachable_devices(self):
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    listener.close()
+    collector = collect.Collector(protocol=collect.TELNET, timeout=5)
+    results = collector.run(self.connections(port, 2))
+    self.assertEqual(len(results), 2)
+    self.assertTrue(all(result.error for result in results))
+
+  def test_invalid_protocol(self):
+    self.assertRaises(ValueError, collect.Collector, protocol='rsh')
+
+
+
+@unittest.skipIf(asyncio is None, 'the collector needs Python 3.5')
+class TelnetFilterTests(unittest.TestCase):
+  '''
+  Tests for TelnetFilter
+  '''
+  def test_refuses_options_split_across_reads(self):
+    telnet_filter = collect.TelnetFilter()
+    self.assertEqual(telnet_filter.feed(b'ab\xff\xfd'), (b'ab', b''))
+    self.assertEqual(telnet_filter.feed(b'\x18cd\xff\xfb\x01'),
+                     (b'cd', b'\xff\xfc\x18\xff\xfe\x01'))
+
+  def test_escaped_iac_and_subnegotiation(self):
+    telnet_filter = collect.TelnetFilter()
+    self.assertEqual(telnet_filter.feed(b'a\xff\xffb\xff\xfa\x18\x01'),
+                     (b'a\xffb', b''))
+    self.assertEqual(telnet_filter.feed(b'\xff\xf0c'), (b'c', b''))
+
+
+
+@unittest.skipIf(asyncssh is None, 'SSH collection needs asyncssh')
+class SSHCollectorTests(CollectorTestBase):
+  '''
+  Tests for Collector over SSH
+  '''
+  def serve_ssh(self, server):
+    class Session(asyncssh.SSHServerSession):
+      def connection_made(self, channel):
+        self.channel = channel
+        self.shell = None
+
+      def pty_requested(self, term_type, term_size, term_modes):
+        return True
+
+      def shell_requested(self):
+        return True
+
+      def session_started(self):
+        self.shell = StandInShell(server, self.channel.write,
+                                  self.channel.close, login=False)
+
+      def data_received(self, data, datatype):
+        self.shell.feed(data)
+
+    class Server(asyncssh.SSHServer):
+      def begin_auth(self, username):
+        return True
+
+      def password_auth_supported(self):
+        return True
+
+      def validate_password(self, username, password):
+        return password == 'secret'
+
+      def session_requested(self):
+        return Session()
+
+    ssh_server = self.loop.run_until_complete(asyncssh.create_server(
+      Server, '127.0.0.1', 0, encoding=None,
+      server_host_keys=[asyncssh.generate_private_key('ssh-rsa')]))
+    def close():
+      ssh_server.close()
+      self.loop.run_until_complete(ssh_server.wait_closed())
+    self.addCleanup(close)
+    return ssh_server.sockets[0].getsockname()[1]
+
+  def test_collects_configuration(self):
+    server = StandInServer()
+    port = self.serve_ssh(server)
+    collector = collect.Collector(timeout=10, concurrency=2)
+    connections = [Connection('127.0.0.1', port=port, username='admin',
+                              password='secret') for _ in range(3)]
+    results = self.collect(collector, connections)
+    for result in results:
+      self.assertIsNone(result.error)
+      self.assertEqual(result.outputs[-1],
+                       STAND_IN_CONFIG.replace(b'\r\n', b'\n'))
+    self.assertTrue(server.max_answering <= 2)
+
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -160,3 +160,19 @@ class FakeTestFile(object):
   tests = SAMPLE_TEST_FILE_DICT
   test_groups = {'testGroup1': ['test1', 'test2'],
                  'testGroup2': ['test2', 'test3']}
+
+FLEET_TEST_FILE = '''---
+TestItems:
+  Default:
+    sshVersion2:
+      match: "ip ssh version ([0-9])"
+      expected: "2"
+    uplink:
+      type: "config"
+      match: ["interface GigabitEthernet1/0/28", "(shutdown)"]
+      expected: shutdown
+TestGroups:
+  Fleet:
+    - sshVersion2
+    - uplink
+'''
@@ -1,5 +1,7 @@
 '''Unit tests for config'''
 
+import os
+import tempfile
 import unittest
 from mock import patch, mock_open
 
@@ -45,6 +47,216 @@ class ConfigFileTests(unittest.TestCase):
     config_file = config.ConfigFile(file_name)
     self.assertEquals(config_file.contents, C.SAMPLE_CONFIG)
 
+  def test_parse_tree_is_cached(self):
+    myconf = config.ConfigFile().from_string(C.SAMPLE_CONFIG)
+    self.assertIs(myconf.parse_tree, myconf.parse_tree)
+
+  def test_from_string_invalidates_parse_tree(self):
+    myconf = config.ConfigFile().from_string(C.SAMPLE_CONFIG)
+    parse = myconf.parse_tree
+    myconf.from_string(C.SAMPLE_CONFIG + 'hostname Other\n')
+    self.assertIsNot(myconf.parse_tree, parse)
+
+  def test_hash_changes_with_contents(self):
+    myconf = config.ConfigFile().from_string(C.SAMPLE_CONFIG)
+    first_hash = myconf.hash
+    myconf.from_string('hostname Other\n')
+    self.assertNotEqual(myconf.hash, first_hash)
+
+
+
+class MappedConfigFileTests(unittest.TestCase):
+  '''
+  Tests for memory-mapped config files
+  '''
+  def setUp(self):
+    handle, self.file_name = tempfile.mkstemp()
+    with os.fdopen(handle, 'w') as file_stream:
+      file_stream.write(C.SAMPLE_CONFIG)
+
+  def tearDown(self):
+    os.remove(self.file_name)
+    del self.file_name
+
+  def test_load_mapped_sets_mapped(self):
+    myconf = config.ConfigFile(self.file_name, mapped=True)
+    self.assertTrue(myconf.mapped)
+
+  def test_load_mapped_defers_contents(self):
+    myconf = config.ConfigFile(self.file_name, mapped=True)
+    self.assertIsNone(myconf._contents)
+    self.assertEqual(myconf.contents, C.SAMPLE_CONFIG)
+
+  def test_lines_match_split(self):
+    myconf = config.ConfigFile(self.file_name, mapped=True)
+    self.assertEqual(list(myconf.lines), C.SAMPLE_CONFIG.split('\n'))
+    self.assertEqual(myconf.lines[7], 'hostname SampleSwitch')
+    self.assertEqual(myconf.lines[-1], '')
+    self.assertEqual(len(myconf.lines), len(C.SAMPLE_CONFIG.split('\n')))
+
+  def test_hash_matches_string_config(self):
+    myconf = config.ConfigFile(self.file_name, mapped=True)
+    other = config.ConfigFile().from_string(C.SAMPLE_CONFIG)
+    self.assertEqual(myconf.hash, other.hash)
+
+  def test_parse_tree_from_mapped_lines(self):
+    myconf = config.ConfigFile(self.file_name, mapped=True)
+    self.assertEqual(len(myconf.parse_tree.find_objects('^interface')), 29)
+
+  def test_from_string_drops_mapping(self):
+    myconf = config.ConfigFile(self.file_name, mapped=True)
+    myconf.from_string('hostname Other')
+    self.assertFalse(myconf.mapped)
+    self.assertEqual(list(myconf.lines), ['hostname Other'])
+
+  def test_empty_file_is_read(self):
+    with open(self.file_name, 'w'):
+      pass
+    myconf = config.ConfigFile(self.file_name, mapped=True)
+    self.assertFalse(myconf.mapped)
+    self.assertEqual(myconf.contents, '')
+
+
+
+class BytesConfigFileTests(unittest.TestCase):
+  '''
+  Tests for config files in bytes mode
+  '''
+  def setUp(self):
+    handle, self.file_name = tempfile.mkstemp()
+    with os.fdopen(handle, 'w') as file_stream:
+      file_stream.write(C.SAMPLE_CONFIG)
+    self.sample = C.SAMPLE_CONFIG.encode('utf-8')
+
+  def tearDown(self):
+    os.remove(self.file_name)
+    del self.file_name
+
+  def test_load_keeps_bytes(self):
+    for mapped in (False, True):
+      myconf = config.ConfigFile(self.file_name, mapped=mapped, binary=True)
+      self.assertTrue(config.is_binary(myconf))
+      self.assertEqual(myconf.contents, self.sample)
+      self.assertEqual(list(config.iter_lines(myconf)),
+                       self.sample.split(b'\n'))
+
+  def test_from_bytes_accepts_memoryview(self):
+    myconf = config.ConfigFile().from_bytes(memoryview(self.sample))
+    self.assertTrue(myconf.binary)
+    self.assertEqual(myconf.contents, self.sample)
+    text = config.ConfigFile().from_string(C.SAMPLE_CONFIG)
+    self.assertEqual(myconf.hash, text.hash)
+
+  def test_parse_tree_from_bytes(self):
+    myconf = config.ConfigFile().from_bytes(self.sample)
+    self.assertEqual(len(myconf.parse_tree.find_objects('^interface')), 29)
+
+  def test_to_bytes_encodes_lists(self):
+    self.assertEqual(config.to_bytes([u'a', u'b']), [b'a', b'b'])
+    self.assertEqual(config.to_text(b'a'), 'a')
+    self.assertIsNone(config.to_bytes(None))
+
+
+
+class LineIndexTests(unittest.TestCase):
+  '''
+  Tests for line index
+  '''
+  def test_getitem_slice(self):
+    index = config.LineIndex('a\nbb\nccc')
+    self.assertEqual(index[1:], ['bb', 'ccc'])
+
+  def test_offsets_built_on_first_lookup(self):
+    index = config.LineIndex('a\nbb\nccc')
+    lines = [line for line in iter(index)]
+    self.assertEqual(lines, ['a', 'bb', 'ccc'])
+    self.assertIsNone(index._offsets)
+    self.assertEqual(index[2], 'ccc')
+    self.assertEqual(list(index.offsets), [0, 2, 5])
+
+  def test_containing(self):
+    index = config.LineIndex('one two\nthree\ntwo two')
+    self.assertEqual(list(index.containing('two')), ['one two', 'two two'])
+
+
+
+class SectionTests(unittest.TestCase):
+  '''
+  Tests for section splitting and configuration diffs
+  '''
+  def test_split_sections_groups_children(self):
+    lines = ['hostname sw1', 'interface Vlan1', ' ip address 10.0.0.1',
+             '  secondary', '!']
+    self.assertEqual(config.split_sections(lines), [
+      ('hostname sw1',),
+      ('interface Vlan1', ' ip address 10.0.0.1', '  secondary', '!')])
+
+  def test_split_sections_keeps_children_after_comment(self):
+    lines = ['interface Vlan1', '!', '', ' shutdown', 'end']
+    self.assertEqual(config.split_sections(lines), [
+      ('interface Vlan1', '!', '', ' shutdown'), ('end',)])
+
+  def test_split_sections_keeps_banner(self):
+    lines = ['banner motd ^C', 'Authorized', 'access only', '^C', 'end']
+    self.assertEqual(config.split_sections(lines), [
+      ('banner motd ^C', 'Authorized', 'access only', '^C'), ('end',)])
+
+  def test_split_sections_banner_ended_by_comment(self):
+    lines = ['banner motd ^C', 'text', '!', ' orphan', 'end']
+    self.assertEqual(config.split_sections(lines), [
+      ('banner motd ^C', 'text', '!', ' orphan'), ('end',)])
+
+  def test_split_sections_banner_closed_by_banner(self):
+    lines = ['banner motd ^C', 'banner exec ^C', 'text', '^C', 'end']
+    self.assertEqual(config.split_sections(lines), [
+      ('banner motd ^C', 'banner exec ^C', 'text', '^C'), ('end',)])
+
+  def test_split_sections_single_line_banner(self):
+    lines = ['banner motd #Hello#', 'end']
+    self.assertEqual(config.split_sections(lines),
+                     [('banner motd #Hello#',), ('end',)])
+
+  def test_ciscoconfparse_supported(self):
+    for installed, supported in [((1, 2, 39), True), ((1, 2, 40), True),
+                                 ((1, 9, 52), False), ((1, 2), False),
+                                 (None, False)]:
+      with patch.object(config, '_CISCOCONFPARSE_VERSION', [installed]):
+        self.assertEqual(config.ciscoconfparse_supported(), supported,
+                         installed)
+
+  def test_diff_identical(self):
+    diff = config.ConfigDiff(C.SAMPLE_CONFIG, C.SAMPLE_CONFIG)
+    self.assertTrue(diff.identical)
+    self.assertEqual(diff.changed_sections, [])
+
+  def test_diff_finds_changed_section(self):
+    new = C.SAMPLE_CONFIG.replace(' description noaccess\n', '')
+    diff = config.ConfigDiff(C.SAMPLE_CONFIG, new)
+    self.assertFalse(diff.identical)
+    self.assertEqual(dict(diff.removed_lines), {' description noaccess': 1})
+    self.assertEqual(sorted(diff.changed_sections), [
+      ('interface GigabitEthernet1/0/28', ' description noaccess',
+       ' shutdown', '!'),
+      ('interface GigabitEthernet1/0/28', ' shutdown', '!')])
+
+  def test_diff_splits_crlf_like_engines(self):
+    old = C.SAMPLE_CONFIG.replace('\n', '\r\n')
+    new = old.replace(' description noaccess\r\n', '')
+    diff = config.ConfigDiff(old, new)
+    self.assertFalse(diff.exact_lines)
+    self.assertEqual(dict(diff.removed_lines), {' description noaccess': 1})
+    self.assertIn(('interface GigabitEthernet1/0/28', ' shutdown', '!'),
+                  diff.changed_sections)
+    self.assertTrue(config.ConfigDiff(C.SAMPLE_CONFIG, C.SAMPLE_CONFIG)
+                    .exact_lines)
+
+  def test_diff_detects_moved_child(self):
+    old = 'interface A\n shutdown\ninterface B\n'
+    new = 'interface A\ninterface B\n shutdown\n'
+    diff = config.ConfigDiff(old, new)
+    self.assertEqual(len(diff.changed_sections), 4)
+    self.assertEqual(diff.first_changed_line, 1)
+
 
 
 class CiscoConfigTests(unittest.TestCase):
@@ -66,6 +278,11 @@ class CiscoConfigTests(unittest.TestCase):
     cisco_config.from_string(C.SAMPLE_CONFIG)
     self.assertIsInstance(cisco_config.parse, CiscoConfParse)
 
+  def test_parse_shares_parse_tree(self):
+    cisco_config = config.CiscoConfig()
+    cisco_config.from_string(C.SAMPLE_CONFIG)
+    self.assertIs(cisco_config.parse, cisco_config.parse_tree)
+
 
 
 if __name__ == '__main__':
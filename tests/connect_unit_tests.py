@@ -1,11 +1,20 @@
 '''Unit tests for connect'''
 
+import io
+import os
+import shutil
+import socket
+import tempfile
+import time
 import unittest
-from mock import patch, mock_open
+from mock import patch, MagicMock
 
 import paramiko
 
 from netaudit import connect
+from netaudit import pool
+from netaudit import exceptions as E
+from netaudit.config import to_bytes
 
 
 class ConnectionTests(unittest.TestCase):
@@ -73,7 +82,7 @@ class SSHClientTests(unittest.TestCase):
       }
     self.patchers = patchers
     self.mocks = mocks
-    for patcher in self.patchers.itervalues():
+    for patcher in self.patchers.values():
       self.addCleanup(patcher.stop)
 
   def tearDown(self):
@@ -89,6 +98,137 @@ class SSHClientTests(unittest.TestCase):
     client.send_command(command)
     client.channel.send.assert_called_once_with(command)
 
+  def channel(self, client, chunks):
+    '''Returns mock channel receiving chunks, then timing out'''
+    chan = MagicMock()
+    chan.recv.side_effect = list(chunks) + [socket.timeout()]
+    chan.recv_stderr_ready.return_value = False
+    client._ssh_channel = chan
+    return chan
+
+  def test_read_stops_at_prompt(self):
+    client = connect.SSH_Client(self.connection, cmd_timeout=30)
+    chan = self.channel(client, ['show ver\r\nIOS ', '15.2\r\nsw1#',
+                                 'never read'])
+    self.assertEqual(client.send_command('show ver'),
+                     ('show ver\r\nIOS 15.2\r\nsw1#', ''))
+    self.assertEqual(chan.recv.call_count, 2)
+    self.assertIsNotNone(client.learned_prompt)
+
+  def test_read_waits_for_learned_prompt(self):
+    client = connect.SSH_Client(self.connection, cmd_timeout=30)
+    self.channel(client, ['Banner\r\nsw1#'])
+    client.connect()
+    chan = self.channel(client, ['x\r\nother>', '\r\nsw1(config)#'])
+    self.assertEqual(client.send_command('x')[0],
+                     'x\r\nother>\r\nsw1(config)#')
+    self.assertEqual(chan.recv.call_count, 2)
+
+  def test_read_bounded_by_timeout(self):
+    client = connect.SSH_Client(self.connection, cmd_timeout=30)
+    chan = self.channel(client, ['no prompt yet'])
+    self.assertEqual(client.send_command('x', timeout=0.5),
+                     ('no prompt yet', ''))
+    self.assertEqual(chan.settimeout.call_args[0][0], 0.5)
+    self.assertFalse(client.last_complete)
+
+  def test_timeout_bounds_silence_not_output(self):
+    client = connect.SSH_Client(self.connection, cmd_timeout=0.15)
+    chunks = ['line %d\r\n' % index for index in range(6)] + ['sw1#']
+    def recv(size):
+      time.sleep(0.05)
+      return chunks.pop(0)
+    chan = self.channel(client, [])
+    chan.recv.side_effect = recv
+    self.assertEqual(client.send_command('x')[0],
+                     ''.join('line %d\r\n' % index for index in range(6)) +
+                     'sw1#')
+    self.assertTrue(client.last_complete)
+    timeouts = set(call[0][0] for call in chan.settimeout.call_args_list)
+    self.assertEqual(timeouts, set([0.15]))
+
+  def test_idle_end_is_complete(self):
+    client = connect.SSH_Client(self.connection, cmd_timeout=30,
+                                idle_timeout=0.5)
+    chan = self.channel(client, ['no prompt'])
+    client.send_command('x')
+    self.assertEqual(chan.settimeout.call_args[0][0], 0.5)
+    self.assertTrue(client.last_complete)
+
+  def test_command_timeout_before_idle_is_incomplete(self):
+    client = connect.SSH_Client(self.connection, cmd_timeout=0.2,
+                                idle_timeout=0.5)
+    chan = self.channel(client, ['no prompt'])
+    client.send_command('x')
+    self.assertEqual(chan.settimeout.call_args[0][0], 0.2)
+    self.assertFalse(client.last_complete)
+
+  def test_configured_prompt(self):
+    client = connect.SSH_Client(self.connection, cmd_timeout=30,
+                                prompt=r'END\Z')
+    chan = self.channel(client, ['sw1#', 'END', 'never read'])
+    self.assertEqual(client.send_command('x')[0], 'sw1#END')
+    self.assertEqual(chan.recv.call_count, 2)
+    self.assertIsNone(client.learned_prompt)
+
+  def test_client_connects_to_port(self):
+    self.connection.port = 2222
+    client = connect.SSH_Client(self.connection)
+    client.client
+    client.client
+    ssh = self.mocks['SSHClient'].return_value
+    ssh.connect.assert_called_once_with('myhost', port=2222,
+                                        username='jsmith', password='secret')
+    self.assertFalse(ssh.get_transport.return_value.send_ignore.called)
+
+  def test_channel_opened_on_connected_client(self):
+    client = connect.SSH_Client(self.connection, cmd_timeout=0)
+    client.connect()
+    client.send_command('x')
+    self.assertEqual(self.mocks['SSHClient'].call_count, 1)
+    transport = self.mocks['SSHClient'].return_value.get_transport()
+    self.assertEqual(transport.open_session.call_count, 1)
+
+  def test_failed_shell_replaces_client(self):
+    transport = self.mocks['SSHClient'].return_value.get_transport()
+    transport.open_session.side_effect = [paramiko.SSHException, MagicMock()]
+    client = connect.SSH_Client(self.connection, cmd_timeout=0)
+    client.channel
+    self.assertEqual(self.mocks['SSHClient'].call_count, 2)
+    self.mocks['SSHClient'].return_value.close.assert_called_once_with()
+
+  def test_pool_acquire_connects_once(self):
+    transport = self.mocks['SSHClient'].return_value.get_transport()
+    chan = transport.open_session.return_value
+    chan.closed = False
+    chan.exit_status_ready.return_value = False
+    session_pool = pool.SessionPool(connect.SSH_Client, cmd_timeout=0)
+    with session_pool.session(self.connection):
+      pass
+    with session_pool.session(self.connection):
+      pass
+    self.assertEqual(self.mocks['SSHClient'].call_count, 1)
+    self.assertFalse(self.mocks['SSHClient'].return_value.close.called)
+
+  def test_is_alive(self):
+    client = connect.SSH_Client(self.connection)
+    self.assertFalse(client.is_alive())
+    client.client
+    chan = self.channel(client, [])
+    chan.closed = False
+    chan.exit_status_ready.return_value = False
+    self.assertTrue(client.is_alive())
+    chan.closed = True
+    self.assertFalse(client.is_alive())
+    chan.closed = False
+    transport = self.mocks['SSHClient'].return_value.get_transport()
+    transport.send_ignore.side_effect = EOFError
+    self.assertFalse(client.is_alive())
+    client.close()
+    chan.close.assert_called_once_with()
+    self.mocks['SSHClient'].return_value.close.assert_called_once_with()
+    self.assertFalse(client.is_alive())
+
 
 
 class TelnetClientTests(unittest.TestCase):
@@ -106,7 +246,7 @@ class TelnetClientTests(unittest.TestCase):
       }
     self.patchers = patchers
     self.mocks = mocks
-    for patcher in self.patchers.itervalues():
+    for patcher in self.patchers.values():
       self.addCleanup(patcher.stop)
 
   def tearDown(self):
@@ -116,11 +256,182 @@ class TelnetClientTests(unittest.TestCase):
   def test_init_requires_connection(self):
     self.assertRaises(TypeError, connect.Telnet_Client)
 
+  def telnet(self, chunks):
+    '''Returns mock Telnet reading chunks, then nothing'''
+    telnet = self.mocks['Telnet'].return_value
+    telnet.read_very_eager.side_effect = list(chunks) + [''] * 10
+    return telnet
+
   def test_send_command_calls_client_write(self):
     command = 'show me the money\n'
+    self.telnet(['sw1#'])
     client = connect.Telnet_Client(self.connection, cmd_timeout=0)
     client.send_command(command)
-    client.client.write.assert_called_once_with(command)
+    client.client.write.assert_called_once_with(to_bytes(command))
+
+  def test_read_stops_at_prompt(self):
+    telnet = self.telnet(['x\r\nout', 'put\r\nsw1#', 'never read'])
+    client = connect.Telnet_Client(self.connection, cmd_timeout=5)
+    self.assertEqual(client.send_command('x'), ('x\r\noutput\r\nsw1#', ''))
+    self.assertEqual(telnet.read_very_eager.call_count, 2)
+    telnet.read_very_eager.side_effect = ['y\r\nother#', '\r\nsw1(config)#']
+    self.assertEqual(client.send_command('y')[0],
+                     'y\r\nother#\r\nsw1(config)#')
+
+  @patch('select.select', return_value=([], [], []))
+  def test_read_bounded_by_timeout(self, mock_select):
+    self.telnet(['no prompt'])
+    client = connect.Telnet_Client(self.connection, cmd_timeout=5)
+    self.assertEqual(client.send_command('x', timeout=1)[0], 'no prompt')
+    self.assertEqual(mock_select.call_args[0][3], 1)
+    self.assertFalse(client.last_complete)
+
+  @patch('select.select', return_value=([], [], []))
+  def test_read_ends_when_idle(self, mock_select):
+    self.telnet(['no prompt'])
+    client = connect.Telnet_Client(self.connection, cmd_timeout=5,
+                                   idle_timeout=0.2)
+    client.send_command('x')
+    self.assertEqual(mock_select.call_args[0][3], 0.2)
+    self.assertTrue(client.last_complete)
+
+  @patch('select.select', return_value=([], [], []))
+  def test_command_timeout_before_idle_is_incomplete(self, mock_select):
+    self.telnet(['no prompt'])
+    client = connect.Telnet_Client(self.connection, cmd_timeout=0.2,
+                                   idle_timeout=5)
+    client.send_command('x')
+    self.assertEqual(mock_select.call_args[0][3], 0.2)
+    self.assertFalse(client.last_complete)
+
+  def test_read_ends_at_eof(self):
+    telnet = self.telnet([])
+    telnet.read_very_eager.side_effect = ['partial', EOFError]
+    client = connect.Telnet_Client(self.connection, cmd_timeout=5)
+    self.assertEqual(client.send_command('x')[0], 'partial')
+
+  def test_connect_stops_at_login_prompts(self):
+    self.telnet(['Banner\r\nUsername: '])
+    client = connect.Telnet_Client(self.connection)
+    self.assertEqual(client.connect(), ('Banner\r\nUsername: ', ''))
+    self.assertIsNone(client.learned_prompt)
+
+
+
+class OutputBufferTests(unittest.TestCase):
+  '''
+  Tests for OutputBuffer and reading configurations
+  '''
+  def test_large_output_in_chunks(self):
+    output = connect.OutputBuffer()
+    chunks = ['line %d\n' % index for index in range(100000)] + ['sw1#']
+    for chunk in chunks:
+      output.feed(chunk)
+    self.assertEqual(output.getvalue(), ''.join(chunks))
+    self.assertEqual(output.size, len(output.getvalue()))
+    self.assertEqual(len(output.tail), connect.PROMPT_TAIL)
+    self.assertTrue(output.tail.endswith(b'line 99999\nsw1#'))
+    output.feed('x' * 1000)
+    self.assertEqual(output.tail, b'x' * connect.PROMPT_TAIL)
+
+  def test_bytes_decoded_once_in_text_mode(self):
+    output = connect.OutputBuffer()
+    encoded = u'description caf\xe9\r\nsw1#'.encode('utf-8')
+    # Split inside the two bytes of the accented character
+    output.feed(encoded[:16])
+    output.feed(encoded[16:])
+    self.assertEqual(output.getvalue(), connect.to_text(encoded))
+    binary = connect.OutputBuffer(binary=True)
+    binary.feed(encoded)
+    self.assertEqual(binary.getvalue(), encoded)
+
+  def test_ssh_channel_returning_bytes(self):
+    client = self.client([b'show ver\r\nIOS ', b'15.2\r\nsw1#', b'unread'])
+    self.assertEqual(client.send_command('show ver'),
+                     ('show ver\r\nIOS 15.2\r\nsw1#', ''))
+    self.assertIsNotNone(client.learned_prompt)
+    client._ssh_channel.recv.side_effect = [b'x\r\nsw1(config)#']
+    self.assertEqual(client.send_command('x')[0], 'x\r\nsw1(config)#')
+
+  def test_empty(self):
+    self.assertEqual(connect.OutputBuffer().getvalue(), '')
+    self.assertEqual(connect.OutputBuffer(binary=True).getvalue(), b'')
+
+  def test_spool(self):
+    spool = io.BytesIO()
+    output = connect.OutputBuffer(spool=spool)
+    output.feed('a\n')
+    output.feed('sw1#')
+    self.assertEqual(spool.getvalue(), b'a\nsw1#')
+    self.assertEqual(output.getvalue(), '')
+    self.assertEqual(output.tail, b'a\nsw1#')
+
+  def client(self, chunks, **opts):
+    client = connect.SSH_Client(connect.Connection('sw1'), cmd_timeout=5,
+                                **opts)
+    chan = MagicMock()
+    chan.recv.side_effect = list(chunks) + [socket.timeout()]
+    chan.recv_stderr_ready.return_value = False
+    client._ssh_channel = chan
+    return client
+
+  def test_command_config(self):
+    chunks = ['show run\r\nhostname sw1\r\n', 'end\r\nsw1#']
+    config = self.client(chunks).command_config()
+    self.assertEqual(config.contents, ''.join(chunks))
+    self.assertFalse(config.binary)
+    config = self.client(chunks, binary=True).command_config()
+    self.assertTrue(config.binary)
+
+  def test_command_config_spooled_to_file(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    file_name = os.path.join(directory, 'sw1.cfg')
+    client = self.client(['hostname sw1\r\n' * 1000, 'sw1#'])
+    config = client.command_config(file_name=file_name)
+    self.assertTrue(config.mapped)
+    self.assertEqual(config.file_name, file_name)
+    self.assertEqual(len(config.lines), 1001)
+    self.assertEqual(client.last_response, ('', ''))
+    self.assertIsNotNone(client.learned_prompt)
+
+  def test_incomplete_config_raises(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    file_name = os.path.join(directory, 'sw1.cfg')
+    chunks = ['show run\r\nhostname sw1\r\n', 'interface Vlan1\r\n']
+    self.assertRaises(E.IncompleteOutputError,
+                      self.client(chunks).command_config)
+    self.assertRaises(E.IncompleteOutputError,
+                      self.client(chunks).command_config, file_name=file_name)
+    self.assertEqual(os.listdir(directory), [])
+
+  def test_failed_read_removes_spool_file(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    file_name = os.path.join(directory, 'sw1.cfg')
+    client = self.client([])
+    client._ssh_channel.recv.side_effect = ['hostname sw1\r\n',
+                                            socket.error('reset')]
+    self.assertRaises(socket.error, client.command_config,
+                      file_name=file_name)
+    self.assertEqual(os.listdir(directory), [])
+
+
+
+class LearnPromptTests(unittest.TestCase):
+  '''
+  Tests for learn_prompt
+  '''
+  def test_learns_device_name(self):
+    prompt = connect.learn_prompt('Banner #1\r\nsw-1.lab#')
+    for response in ('sw-1.lab>', 'out\nsw-1.lab(config)#', 'sw-1.lab# '):
+      self.assertTrue(connect.re.search(prompt, response), response)
+    self.assertFalse(connect.re.search(prompt, 'out\nsw-2#'))
+
+  def test_no_prompt(self):
+    self.assertIsNone(connect.learn_prompt('Banner\r\nPassword: '))
+    self.assertIsNone(connect.learn_prompt(''))
 
 
 
@@ -0,0 +1,107 @@
+'''Unit tests for fleet'''
+
+import os
+import shutil
+import tempfile
+import unittest
+from mock import patch, MagicMock
+
+import tests.common as C
+from netaudit import audit
+from netaudit import fleet
+from netaudit import exceptions as E
+from netaudit.config import ConfigFile
+
+
+class FleetTestBase(unittest.TestCase):
+  '''
+  Writes sample configurations to a temporary directory
+  '''
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.file_names = []
+    for i in range(5):
+      hostname = 'hostname SampleSwitch\n'
+      contents = C.SAMPLE_CONFIG.replace(hostname, 'hostname sw%d\n' % i)
+      if i % 2:
+        contents = contents.replace('ip ssh version 2', 'ip ssh version 1')
+      file_name = os.path.join(self.directory, 'sw%d.cfg' % i)
+      with open(file_name, 'w') as file_stream:
+        file_stream.write(contents)
+      self.file_names.append(file_name)
+    self.tests = audit.TestFile()
+    self.tests.from_string(C.FLEET_TEST_FILE)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+    del self.file_names
+    del self.tests
+
+
+
+class FleetAuditorTests(FleetTestBase):
+  '''
+  Tests for FleetAuditor
+  '''
+  def expected(self):
+    results = []
+    for file_name in self.file_names:
+      suite = audit.AuditTests(ConfigFile(file_name), self.tests, 'Fleet')
+      suite.run()
+      results.append(fleet.AuditResult(file_name, suite.last_results))
+    return results
+
+  def test_run_in_process_matches_audit_tests(self):
+    auditor = fleet.FleetAuditor(self.tests, 'Fleet', jobs=1)
+    self.assertEqual(list(auditor.run(self.directory)), self.expected())
+
+  def test_run_process_pool_matches_audit_tests(self):
+    auditor = fleet.FleetAuditor(self.tests, 'Fleet', jobs=2, backlog=1)
+    self.assertEqual(list(auditor.run(self.directory)), self.expected())
+
+  def test_run_mapped_matches_audit_tests(self):
+    auditor = fleet.FleetAuditor(self.tests, 'Fleet', jobs=2, mapped=True)
+    self.assertEqual(list(auditor.run(self.directory)), self.expected())
+
+  def test_run_accepts_glob(self):
+    auditor = fleet.FleetAuditor(self.tests, 'Fleet', jobs=1)
+    pattern = os.path.join(self.directory, 'sw[01].cfg')
+    sources = [res.source for res in auditor.run(pattern)]
+    self.assertEqual(sources, self.file_names[:2])
+
+  def test_missing_config_raises(self):
+    auditor = fleet.FleetAuditor(self.tests, 'Fleet', jobs=1)
+    for missing in ('sw0.cgf', 'sw[89].cfg'):
+      self.assertRaises(E.ConfigNotFoundError, list,
+                        auditor.run(os.path.join(self.directory, missing)))
+
+  def test_run_accepts_config_objects(self):
+    auditor = fleet.FleetAuditor(self.tests, 'Fleet', jobs=1)
+    configs = [ConfigFile(name) for name in self.file_names]
+    self.assertEqual(list(auditor.run(configs)), self.expected())
+
+  def test_run_compiles_plan_once(self):
+    with patch.object(self.tests, 'compile_plan',
+                      wraps=self.tests.compile_plan) as mock_compile:
+      auditor = fleet.FleetAuditor(self.tests, 'Fleet', jobs=1)
+      list(auditor.run(self.directory))
+    mock_compile.assert_called_once_with('Fleet', None)
+
+  @patch('multiprocessing.Pool')
+  def test_run_bounds_pending_configs(self, mock_pool):
+    pending = []
+    def apply_async(func, args):
+      result = MagicMock()
+      result.get.side_effect = lambda: (pending.remove(result) or args[0],
+                                         None)
+      pending.append(result)
+      self.assertLessEqual(len(pending), 4)
+      return result
+    mock_pool.return_value.apply_async.side_effect = apply_async
+    auditor = fleet.FleetAuditor(self.tests, 'Fleet', jobs=2, backlog=2)
+    self.assertEqual(list(auditor.run(self.file_names)), self.file_names)
+
+
+
+if __name__ == '__main__':
+  unittest.main()
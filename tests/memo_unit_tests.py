@@ -0,0 +1,158 @@
+'''Unit tests for memo'''
+
+import random
+import unittest
+from mock import patch
+
+from netaudit import audit
+from netaudit import fleet
+from netaudit import memo
+from netaudit.config import ConfigFile, CISCOCONFPARSE, NATIVE
+from netaudit.config import ciscoconfparse_supported
+from tests.shard_unit_tests import SHARD_TEST_FILE, sharding_config
+from tests.shard_unit_tests import random_config
+from tests.fleet_unit_tests import FleetTestBase
+
+
+def template_configs():
+  '''
+  Returns configurations built from the same template: different hostnames,
+  extra lines moving later sections and one changed interface
+  '''
+  base = sharding_config()
+  return [
+    base,
+    base.replace('hostname ShardSwitch', 'hostname Other\n!\nip routing'),
+    base.replace('interface GigabitEthernet1/0/7\n description port 6\n',
+                 'interface GigabitEthernet1/0/7\n description port 6\n'
+                 ' shutdown\n'),
+    ]
+
+
+# The memo is only used with CiscoConfParse releases the native engine
+# follows, see netaudit.config.evaluates_by_section
+SUPPORTED_ONLY = unittest.skipUnless(
+  ciscoconfparse_supported(),
+  'installed CiscoConfParse does not build hierarchies section by section')
+
+
+
+class SectionMemoTests(unittest.TestCase):
+  '''
+  Tests for SectionMemo
+  '''
+  def setUp(self):
+    self.tests = audit.TestFile()
+    self.tests.from_string(SHARD_TEST_FILE)
+    self.configs = [ConfigFile().from_string(contents)
+                    for contents in template_configs()]
+
+  def plan(self, engine=NATIVE):
+    self.tests.config_engine = engine
+    return self.tests.compile_plan('Shard')
+
+  def test_results_match_without_memo(self):
+    for engine in (NATIVE, CISCOCONFPARSE):
+      plan = self.plan(engine)
+      section_memo = memo.SectionMemo()
+      for config in self.configs:
+        self.assertEqual(list(plan.results(config, memo=section_memo)),
+                         list(plan.results(config)), engine)
+
+  def test_identical_sections_evaluated_once(self):
+    plan = self.plan()
+    section_memo = memo.SectionMemo()
+    list(plan.results(self.configs[0], memo=section_memo))
+    self.assertEqual(section_memo.hits, 0)
+    misses = section_memo.misses
+    list(plan.results(self.configs[2], memo=section_memo))
+    hierarchical = len([test for test in plan.tests if test.is_hierarchical])
+    # Only the changed interface section is evaluated again
+    self.assertEqual(section_memo.misses, misses + hierarchical)
+    self.assertEqual(section_memo.hits, misses - hierarchical)
+    self.assertIn('hit rate', section_memo.report())
+
+  def test_tests_with_same_patterns_share_outcomes(self):
+    tests = [audit.TestCase('a', pattern=['^interface', '(shutdown)'],
+                            expected='shutdown', test_type='config'),
+             audit.TestCase('b', pattern=['^interface', '(shutdown)'],
+                            expected='shutdown', test_type='config',
+                            quantifier='none')]
+    self.assertEqual(memo.outcome_key(tests[0], NATIVE),
+                     memo.outcome_key(tests[1], NATIVE))
+    section_memo = memo.SectionMemo()
+    found = section_memo.outcomes(self.configs[0], tests, NATIVE)
+    self.assertEqual(found[tests[0]], found[tests[1]])
+    self.assertEqual(found[tests[0]],
+                     list(tests[0].parent_outcomes(
+                       self.configs[0].tree(NATIVE))))
+
+  def test_sections_bounded(self):
+    plan = self.plan()
+    section_memo = memo.SectionMemo(max_sections=5)
+    for config in self.configs:
+      self.assertEqual(list(plan.results(config, memo=section_memo)),
+                       list(plan.results(config)))
+    self.assertEqual(len(section_memo._sections), 5)
+
+  def test_config_sections_offsets(self):
+    sections = memo.config_sections(
+      ConfigFile().from_string('a\n a1\n\nb\n b1\n'))
+    self.assertEqual([(section.offset, section.size) for section in sections],
+                     [(0, 2), (2, 2)])
+
+  def test_random_configs_match_serial_run(self):
+    rng = random.Random(7)
+    configs = [ConfigFile().from_string(random_config(rng))
+               for _ in range(30)]
+    for engine in (NATIVE, CISCOCONFPARSE):
+      plan = self.plan(engine)
+      section_memo = memo.SectionMemo()
+      for config in configs:
+        self.assertEqual(list(plan.results(config, memo=section_memo)),
+                         list(plan.results(config)),
+                         (engine, config.contents))
+
+  def test_memo_unused_without_section_rules(self):
+    plan = self.plan(CISCOCONFPARSE)
+    section_memo = memo.SectionMemo()
+    with patch('netaudit.audit.evaluates_by_section', return_value=False):
+      results = list(plan.results(self.configs[0], memo=section_memo))
+    self.assertEqual(section_memo.counts, (0, 0))
+    self.assertEqual(results, list(plan.results(self.configs[0])))
+
+  @SUPPORTED_ONLY
+  def test_audit_tests_uses_memo(self):
+    section_memo = memo.SectionMemo()
+    for config in self.configs:
+      suite = audit.AuditTests(config, self.tests, 'Shard',
+                               memo=section_memo)
+      suite.run()
+      serial = audit.AuditTests(config, self.tests, 'Shard')
+      serial.run()
+      self.assertEqual(suite.last_results, serial.last_results)
+    self.assertTrue(section_memo.hits > section_memo.misses)
+
+
+
+class FleetMemoTests(FleetTestBase):
+  '''
+  Tests for FleetAuditor with a section memo
+  '''
+  @SUPPORTED_ONLY
+  def test_worker_counts_recorded(self):
+    section_memo = memo.SectionMemo()
+    auditor = fleet.FleetAuditor(self.tests, 'Fleet', jobs=2,
+                                 memo=section_memo)
+    expected = list(fleet.FleetAuditor(self.tests, 'Fleet',
+                                       jobs=1).run(self.directory))
+    self.assertEqual(list(auditor.run(self.directory)), expected)
+    sections = len(memo.config_sections(ConfigFile(self.file_names[0])))
+    self.assertEqual(sum(section_memo.counts),
+                     sections * len(self.file_names))
+    self.assertTrue(section_memo.hits > 0)
+
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,196 @@
+'''Unit tests for pool'''
+
+import time
+import threading
+import unittest
+from mock import patch
+
+from netaudit import pool
+from netaudit import exceptions as E
+from netaudit.connect import Connection
+
+
+class StandInClient(object):
+  '''
+  Client counting connects and closes, whose health check can fail
+  '''
+  created = []
+
+  def __init__(self, connection, **opts):
+    self.connection = connection
+    self.opts = opts
+    self.connects = 0
+    self.closed = False
+    self.alive = True
+    self.created.append(self)
+
+  def connect(self):
+    self.connects += 1
+
+  def is_alive(self):
+    return self.alive and not self.closed
+
+  def close(self):
+    self.closed = True
+
+
+
+class SessionPoolTests(unittest.TestCase):
+  '''
+  Tests for SessionPool
+  '''
+  def setUp(self):
+    StandInClient.created = []
+    self.connection = Connection('sw1', username='admin', password='secret')
+
+  def pool(self, **opts):
+    return pool.SessionPool(StandInClient, **opts)
+
+  def test_session_reused(self):
+    prepared = []
+    session_pool = self.pool(prepare=prepared.append, cmd_timeout=1)
+    with session_pool.session(self.connection) as first:
+      pass
+    with session_pool.session(Connection('sw1', username='admin')) as second:
+      pass
+    self.assertIs(first, second)
+    self.assertEqual(first.connects, 1)
+    self.assertEqual(first.opts, {'cmd_timeout': 1})
+    self.assertEqual(prepared, [first])
+    self.assertEqual((session_pool.hits, session_pool.misses), (1, 1))
+    self.assertIn('50.0% reuse rate', session_pool.report())
+
+  def test_sessions_keyed_by_host_port_and_user(self):
+    session_pool = self.pool()
+    connections = [self.connection, Connection('sw1', username='other'),
+                   Connection('sw1', username='admin', port=2222),
+                   Connection('sw2', username='admin')]
+    clients = []
+    for connection in connections:
+      with session_pool.session(connection) as client:
+        clients.append(client)
+    self.assertEqual(len(set(map(id, clients))), 4)
+
+  def test_unhealthy_session_replaced(self):
+    session_pool = self.pool()
+    with session_pool.session(self.connection) as first:
+      pass
+    first.alive = False
+    with session_pool.session(self.connection) as second:
+      pass
+    self.assertIsNot(first, second)
+    self.assertTrue(first.closed)
+    self.assertEqual(session_pool._open[pool.pool_key(self.connection)], 1)
+
+  def test_idle_sessions_closed(self):
+    session_pool = self.pool(idle_timeout=10)
+    with session_pool.session(self.connection) as first:
+      pass
+    with patch('time.time', return_value=time.time() + 11):
+      session_pool.prune()
+    self.assertTrue(first.closed)
+    with session_pool.session(self.connection) as second:
+      pass
+    self.assertIsNot(first, second)
+
+  def test_error_discards_session(self):
+    session_pool = self.pool()
+    with self.assertRaises(KeyError):
+      with session_pool.session(self.connection) as first:
+        raise KeyError('x')
+    self.assertTrue(first.closed)
+    with session_pool.session(self.connection) as second:
+      self.assertIsNot(first, second)
+
+  def test_failed_connect_frees_room(self):
+    session_pool = self.pool(max_per_host=1, acquire_timeout=0)
+    with patch.object(StandInClient, 'connect', side_effect=EOFError):
+      self.assertRaises(EOFError, session_pool.acquire, self.connection)
+    client = session_pool.acquire(self.connection)
+    self.assertEqual(client.connects, 1)
+
+  def test_max_per_host(self):
+    session_pool = self.pool(max_per_host=2, acquire_timeout=0)
+    clients = [session_pool.acquire(self.connection) for _ in range(2)]
+    self.assertRaises(E.PoolExhaustedError, session_pool.acquire,
+                      self.connection)
+    session_pool.acquire(Connection('sw2'))
+    session_pool.release(clients[0])
+    self.assertIs(session_pool.acquire(self.connection), clients[0])
+
+  def test_acquire_waits_for_release(self):
+    session_pool = self.pool(max_per_host=1, acquire_timeout=5)
+    client = session_pool.acquire(self.connection)
+    timer = threading.Timer(0.05, session_pool.release, (client,))
+    timer.start()
+    self.addCleanup(timer.join)
+    self.assertIs(session_pool.acquire(self.connection), client)
+    self.assertEqual(len(StandInClient.created), 1)
+
+  def test_release_wakes_waiter_of_other_host(self):
+    session_pool = self.pool(max_per_host=1, acquire_timeout=5)
+    other = Connection('sw2')
+    first = session_pool.acquire(other)
+    second = session_pool.acquire(self.connection)
+    acquired = {}
+
+    def wait_for(connection):
+      start = time.time()
+      acquired[connection.hostname] = session_pool.acquire(connection)
+      acquired[connection.hostname + ' waited'] = time.time() - start
+
+    # The waiter for sw2 starts first, so a single notify would wake it
+    # and not the waiter for sw1
+    threads = [threading.Thread(target=wait_for, args=(connection,))
+               for connection in (other, self.connection)]
+    for thread in threads:
+      thread.start()
+      time.sleep(0.05)
+    session_pool.release(second)
+    threads[1].join(2)
+    self.assertIs(acquired.get('sw1'), second)
+    self.assertLess(acquired['sw1 waited'], 2)
+    session_pool.release(first)
+    threads[0].join(2)
+    self.assertIs(acquired.get('sw2'), first)
+
+  def test_slow_close_does_not_block_acquire(self):
+    session_pool = self.pool(idle_timeout=10, acquire_timeout=0)
+    with session_pool.session(self.connection) as idle:
+      pass
+    closing = threading.Event()
+    finish = threading.Event()
+
+    def slow_close():
+      closing.set()
+      finish.wait(5)
+    idle.close = slow_close
+    with patch('time.time', return_value=time.time() + 11):
+      thread = threading.Thread(target=session_pool.prune)
+      thread.start()
+      self.addCleanup(thread.join)
+      self.addCleanup(finish.set)
+      closing.wait(5)
+    # The lock is free while the expired session disconnects
+    start = time.time()
+    client = session_pool.acquire(Connection('sw2'))
+    self.assertLess(time.time() - start, 2)
+    self.assertEqual(client.connects, 1)
+
+  def test_close(self):
+    session_pool = self.pool()
+    idle = session_pool.acquire(self.connection)
+    busy = session_pool.acquire(self.connection)
+    session_pool.release(idle)
+    session_pool.close()
+    self.assertTrue(idle.closed)
+    self.assertFalse(busy.closed)
+    session_pool.release(busy)
+    self.assertTrue(busy.closed)
+    self.assertRaises(E.PoolExhaustedError, session_pool.acquire,
+                      self.connection)
+
+
+
+if __name__ == '__main__':
+  unittest.main()
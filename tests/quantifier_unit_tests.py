@@ -0,0 +1,36 @@
+'''Unit tests for quantifier'''
+
+import unittest
+
+from netaudit.quantifier import Quantifier, parse_quantifier
+
+
+
+class QuantifierTests(unittest.TestCase):
+  '''
+  Tests for Quantifier and parse_quantifier
+  '''
+  def test_parse_quantifier(self):
+    self.assertEqual(parse_quantifier('all'),
+                     Quantifier('all', None, None))
+    self.assertEqual(parse_quantifier(' count>=2 '),
+                     Quantifier('count', '>=', 2))
+    self.assertIsNone(parse_quantifier(None))
+
+  def test_parse_quantifier_invalid_raises(self):
+    self.assertRaises(ValueError, parse_quantifier, 'most')
+    self.assertRaises(ValueError, parse_quantifier, 'count = 2')
+
+  def test_decided(self):
+    at_least_two = parse_quantifier('count >= 2')
+    self.assertIsNone(at_least_two.decided(1, 5))
+    self.assertTrue(at_least_two.decided(2, 0))
+    at_most_one = parse_quantifier('count <= 1')
+    self.assertIsNone(at_most_one.decided(1, 0))
+    self.assertFalse(at_most_one.decided(2, 0))
+    self.assertTrue(at_most_one.result(1, 0))
+
+
+
+if __name__ == '__main__':
+  unittest.main()
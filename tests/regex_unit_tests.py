@@ -0,0 +1,102 @@
+'''Unit tests for regex'''
+
+import re
+import sys
+import time
+import types
+import unittest
+from mock import patch
+
+from netaudit import regex
+from netaudit import exceptions as E
+
+
+def fake_re2():
+  '''Returns module standing in for re2 that rejects backreferences'''
+  module = types.ModuleType('re2')
+  class Regexp(object):
+    def __init__(self, pattern):
+      if re.search(r'\\[1-9]', pattern):
+        raise ValueError('backreferences are not supported')
+      self.pattern = pattern
+      self.search = re.compile(pattern).search
+  module.compile = Regexp
+  return module
+
+
+
+class BackendTests(unittest.TestCase):
+  '''
+  Tests for compile_regex
+  '''
+  def test_stdlib_backend(self):
+    compiled = regex.compile_regex('^hostname (\\S+)')
+    self.assertIs(compiled, re.compile('^hostname (\\S+)'))
+    self.assertFalse(regex.is_linear(compiled))
+
+  def test_unknown_backend(self):
+    self.assertRaises(ValueError, regex.compile_regex, 'a', 'pcre')
+
+  def test_linear_backend_not_installed(self):
+    with patch.dict(sys.modules, {'re2': None}):
+      self.assertRaises(ValueError, regex.compile_regex, 'a', regex.LINEAR)
+
+  def test_linear_backend_falls_back_for_unsupported_patterns(self):
+    with patch.dict(sys.modules, {'re2': fake_re2()}):
+      compiled = regex.compile_regex('(a+)+$', regex.LINEAR)
+      self.assertTrue(regex.is_linear(compiled))
+      fallback = regex.compile_regex('(a)\\1', regex.LINEAR)
+      self.assertFalse(regex.is_linear(fallback))
+
+
+
+class RiskyPatternTests(unittest.TestCase):
+  '''
+  Tests for risky_pattern
+  '''
+  def test_nested_repeats(self):
+    for pattern in ('(a+)+$', '(?:\\S+\\s*)*x', '(a*b?)*c', '(x+x+)+y',
+                    '^access-list (?:(\\d+) ?)+ deny'):
+      self.assertTrue(regex.risky_pattern(pattern), pattern)
+
+  def test_alternation_in_repeat(self):
+    self.assertTrue(regex.risky_pattern('(ab|cd)*e'))
+    self.assertTrue(regex.risky_pattern('(?=(?:foo|bar)+)'))
+
+  def test_safe_patterns(self):
+    for pattern in ('^hostname (\\S+)', '^ip domain-name (.*)$',
+                    '(\\d+\\.){3}\\d+', '(a|b)+', '(?:ab){2,5}', 'a+b+',
+                    '(unbalanced'):
+      self.assertFalse(regex.risky_pattern(pattern), pattern)
+
+
+
+class TimeBudgetTests(unittest.TestCase):
+  '''
+  Tests for time_budget
+  '''
+  def test_runaway_match_interrupted(self):
+    start = time.time()
+    with self.assertRaises(E.RegexBudgetExceededError):
+      with regex.time_budget(0.1):
+        re.search('(a+)+$', 'a' * 40 + 'b')
+    self.assertTrue(time.time() - start < 5)
+
+  def test_fast_block_keeps_result(self):
+    with regex.time_budget(5):
+      match = re.search('(a+)+$', 'aaa')
+    self.assertEqual(match.group(1), 'aaa')
+
+  @patch('signal.setitimer')
+  def test_no_budget_without_timer(self, mock_setitimer):
+    with regex.time_budget(None):
+      pass
+    with patch('netaudit.regex._can_interrupt', return_value=False):
+      with regex.time_budget(1):
+        pass
+    self.assertFalse(mock_setitimer.called)
+
+
+
+if __name__ == '__main__':
+  unittest.main()
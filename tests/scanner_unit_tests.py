@@ -0,0 +1,118 @@
+'''Unit tests for scanner'''
+
+import os
+import tempfile
+import unittest
+from mock import patch, MagicMock
+
+import tests.common as C
+from netaudit import audit
+from netaudit.config import ConfigFile
+from netaudit.scanner import TextScanner, lines_containing, required_literal
+
+
+
+class TextScannerTests(unittest.TestCase):
+  '''
+  Tests for single pass text scanner
+  '''
+  PATTERNS = [
+    ('version (12\\.2)', '12.2'),
+    ('ip ssh version ([0-9])', '2'),
+    ('ip ssh version ([0-9])', '1'),
+    ('vlan internal allocation policy (descending|ascending)', 'ascending'),
+    ('hostname (\\S+)', 'SampleSwitch'),
+    ('(?P<kw>enable) (secret|password) \\d', 'enable'),
+    ('(a)(b)\\2', 'a'),
+    ('not present (anywhere)', 'anywhere'),
+    ]
+
+  def setUp(self):
+    self.config = ConfigFile().from_string(C.SAMPLE_CONFIG)
+    self.tests = [audit.TestCase('test%d' % i, pattern=pattern,
+                                 expected=expected)
+                  for i, (pattern, expected) in enumerate(self.PATTERNS)]
+
+  def tearDown(self):
+    del self.config
+    del self.tests
+
+  def test_scan_matches_evaluate(self):
+    scanner = TextScanner(self.tests)
+    results = scanner.scan(self.config.contents)
+    for test in self.tests:
+      self.assertEqual(results[test], test.evaluate(self.config)[0])
+
+  def test_scan_without_literal_prefilter_matches_evaluate(self):
+    scanner = TextScanner(self.tests, literal_prefilter=False)
+    results = scanner.scan(self.config.contents)
+    for test in self.tests:
+      self.assertEqual(results[test], test.evaluate(self.config)[0])
+
+  def test_scan_with_alternation_matches_evaluate(self):
+    scanner = TextScanner(self.tests[:-2], literal_prefilter=False)
+    self.assertIsNotNone(scanner._prefilter)
+    results = scanner.scan(self.config.contents)
+    for test in self.tests[:-2]:
+      self.assertEqual(results[test], test.evaluate(self.config)[0])
+
+  def test_backreference_disables_alternation(self):
+    scanner = TextScanner(self.tests, literal_prefilter=False)
+    self.assertIsNone(scanner._prefilter)
+
+  def test_literal_prefilter_skips_line_scan(self):
+    scanner = TextScanner(self.tests[:2])
+    with patch.object(TextScanner, '_scan_lines') as mock_scan_lines:
+      scanner.scan(self.config.contents)
+    self.assertFalse(mock_scan_lines.called)
+
+  def test_lines_containing(self):
+    contents = 'one two\nthree\ntwo two\nfour two'
+    self.assertEqual(list(lines_containing(contents, 'two')),
+                     ['one two', 'two two', 'four two'])
+
+  def test_required_literal(self):
+    cases = [
+      ('ip ssh version ([0-9])', 'ip ssh version '),
+      ('version (12\\.2)', 'version 12.2'),
+      ('(?:ab)?cd', None),
+      ('a|bcd', None),
+      ('(?i)hostname (\\S+)', None),
+      ('x(abc)+yz', 'abc'),
+      ('vlan (descending|ascending)', 'vlan '),
+      ]
+    for pattern, expected in cases:
+      literal = required_literal(audit.compile_pattern(pattern))
+      self.assertEqual(literal, expected, pattern)
+
+  def test_mapped_config_results_match(self):
+    handle, file_name = tempfile.mkstemp()
+    try:
+      with os.fdopen(handle, 'w') as file_stream:
+        file_stream.write(C.SAMPLE_CONFIG)
+      mapped = ConfigFile(file_name, mapped=True)
+      for literal_prefilter in (True, False):
+        scanner = TextScanner(self.tests,
+                                    literal_prefilter=literal_prefilter)
+        self.assertEqual(scanner.scan(mapped.lines),
+                         scanner.scan(self.config.contents))
+      for test in self.tests:
+        self.assertEqual(test.evaluate(mapped), test.evaluate(self.config))
+      self.assertIsNone(mapped._contents)
+    finally:
+      os.remove(file_name)
+
+  def test_plan_results_split_contents_once(self):
+    test_file = audit.TestFile()
+    test_file.from_string(C.SAMPLE_TEST_FILE)
+    plan = test_file.compile_plan('Basic')
+    scanner = MagicMock(wraps=plan.text_scanner)
+    plan = plan._replace(tests=plan.tests * 3, text_scanner=scanner)
+    results = list(plan.results(self.config))
+    self.assertEqual(len(results), 3)
+    self.assertEqual(scanner.scan.call_count, 1)
+
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,287 @@
+'''Unit tests for shard'''
+
+import random
+import unittest
+from mock import patch
+
+from netaudit import audit
+from netaudit import cache
+from netaudit import memo
+from netaudit import shard
+from netaudit.config import ConfigFile, CISCOCONFPARSE, NATIVE
+
+
+def sharding_config():
+  '''Returns configuration with many sections, blank lines and a banner'''
+  lines = ['!', 'hostname ShardSwitch', '', 'logging host 10.0.0.1']
+  for index in range(40):
+    lines.extend(['interface GigabitEthernet1/0/%d' % (index + 1),
+                  ' description port %d' % index,
+                  ' switchport mode %s' % ('trunk' if index % 5 else
+                                           'access')])
+    if index % 3 == 0:
+      lines.append(' shutdown')
+    if index % 4 == 0:
+      lines.extend(['', ' ! comment', ' spanning-tree portfast'])
+    if index == 20:
+      lines.extend(['banner motd ^C', 'Authorized', '  access only', '^C'])
+    lines.append('!')
+  lines.extend(['logging host 10.0.0.2', 'logging host 10.0.0.1',
+                'line vty 0 4', ' transport input ssh', 'end', ''])
+  return '\n'.join(lines)
+
+
+# Lines random_config picks from: sections, children at several depths,
+# comments, blank lines and banners
+RANDOM_LINES = ['interface GigabitEthernet1/0/%d', ' description port %d',
+                ' shutdown', ' switchport mode trunk', '  deeper', ' ! note',
+                '!', '!    ', '', '   ', 'hostname ShardSwitch',
+                'logging host 10.0.0.1', 'banner motd ^C', 'access only',
+                '^C', 'router ospf 1', ' spanning-tree portfast']
+
+
+def random_config(rng, count=60):
+  '''
+  Returns configuration of count lines picked by rng from RANDOM_LINES
+
+  :rng: random.Random object
+  :count: number of lines
+  '''
+  lines = []
+  for index in range(count):
+    line = rng.choice(RANDOM_LINES)
+    lines.append(line % index if '%d' in line else line)
+  return '\n'.join(lines)
+
+
+SHARD_TEST_FILE = '''---
+TestItems:
+  Default:
+    hostname:
+      match: "^hostname (\\\\S+)"
+      expected: ShardSwitch
+    missingHost:
+      match: "^logging host (\\\\S+)"
+      expected: 10.9.9.9
+    twoLoggingHosts:
+      match: "^logging host (\\\\S+)"
+      expected: 10.0.0.1
+      quantifier: count >= 2
+    allLoggingHosts:
+      match: "^logging host (\\\\S+)"
+      expected: 10.0.0.1
+      quantifier: all
+    noTelnet:
+      match: "transport input (telnet)"
+      expected: telnet
+      quantifier: none
+    shutdown:
+      type: config
+      match: ["^interface", "(shutdown)"]
+      expected: shutdown
+    trunks:
+      type: config
+      match: ["^interface", "switchport mode (trunk)"]
+      expected: trunk
+      quantifier: count >= 30
+    anyAccess:
+      type: config
+      match: ["^interface", "switchport mode (access)"]
+      expected: access
+      quantifier: any
+    allTrunk:
+      type: config
+      match: ["^interface", "switchport mode (trunk)"]
+      expected: trunk
+      quantifier: all
+    noShutdown:
+      type: config
+      match: ["^interface", "(shutdown)"]
+      expected: shutdown
+      quantifier: none
+    portfast:
+      type: config
+      match: ["^interface", "spanning-tree (portfast)", "(portfast)"]
+      expected: portfast
+    banner:
+      type: config
+      match: ["^banner", "(access) only"]
+      expected: access
+TestGroups:
+  Shard:
+    - hostname
+    - missingHost
+    - twoLoggingHosts
+    - allLoggingHosts
+    - noTelnet
+    - shutdown
+    - trunks
+    - anyAccess
+    - allTrunk
+    - noShutdown
+    - portfast
+    - banner
+'''
+
+
+
+class ShardRangeTests(unittest.TestCase):
+  '''
+  Tests for line_ranges and section_ranges
+  '''
+  def test_line_ranges_cover_lines(self):
+    self.assertEqual(shard.line_ranges(10, 3), [(0, 4), (4, 7), (7, 10)])
+    self.assertEqual(shard.line_ranges(2, 4), [(0, 1), (1, 2)])
+    self.assertEqual(shard.line_ranges(0, 4), [(0, 0)])
+
+  def test_section_ranges_keep_sections_whole(self):
+    lines = ['a', ' a1', '', 'b', ' b1', ' b2', 'c', 'd', ' d1']
+    self.assertEqual(shard.section_ranges(lines, 3),
+                     [(0, 3, 0), (3, 6, 2), (6, 9, 5)])
+    self.assertEqual(shard.section_ranges(lines, 1), [(0, 9, 0)])
+    self.assertEqual(shard.section_ranges([], 2), [(0, 0, 0)])
+
+  def test_section_ranges_at_most_shards(self):
+    lines = ConfigFile().from_string(sharding_config()).contents.split('\n')
+    for shards in range(1, 12):
+      ranges = shard.section_ranges(lines, shards)
+      self.assertTrue(len(ranges) <= shards)
+      self.assertEqual(ranges[0][0], 0)
+      self.assertEqual(ranges[-1][1], len(lines))
+
+
+
+class ShardedResultsTests(unittest.TestCase):
+  '''
+  Tests for sharded_results
+  '''
+  def setUp(self):
+    self.tests = audit.TestFile()
+    self.tests.from_string(SHARD_TEST_FILE)
+    self.config = ConfigFile().from_string(sharding_config())
+
+  def plan(self, engine=NATIVE):
+    self.tests.config_engine = engine
+    return self.tests.compile_plan('Shard')
+
+  def test_matches_serial_run(self):
+    for engine in (NATIVE, CISCOCONFPARSE):
+      plan = self.plan(engine)
+      expected = list(plan.results(self.config))
+      self.assertTrue(any(res.message for res in expected))
+      for shards in (2, 3, 7):
+        results = list(shard.sharded_results(plan, self.config, shards,
+                                             min_lines=1))
+        self.assertEqual(results, expected, (engine, shards))
+
+  def test_random_configs_match_serial_run(self):
+    rng = random.Random(7)
+    configs = [ConfigFile().from_string(random_config(rng))
+               for _ in range(10)]
+    for engine in (NATIVE, CISCOCONFPARSE):
+      plan = self.plan(engine)
+      for config in configs:
+        self.assertEqual(list(shard.sharded_results(plan, config, 3,
+                                                    min_lines=1)),
+                         list(plan.results(config)),
+                         (engine, config.contents))
+
+  def test_engine_without_section_rules_not_split_by_section(self):
+    plan = self.plan(CISCOCONFPARSE)
+    expected = list(plan.results(self.config))
+    with patch('netaudit.shard.evaluates_by_section', return_value=False), \
+         patch('netaudit.shard.section_ranges') as mock_ranges:
+      results = list(shard.sharded_results(plan, self.config, 3,
+                                           min_lines=1))
+    self.assertFalse(mock_ranges.called)
+    self.assertEqual(results, expected)
+
+  def test_shards_merged_in_process(self):
+    plan = self.plan()
+    lines = self.config.contents.split('\n')
+    needed = range(len(plan.tests))
+    ranges = shard.section_ranges(lines, 4)
+    self.assertEqual(len(ranges), 4)
+    partials = [shard.tree_shard(plan, lines[start:stop], offset, needed)
+                for start, stop, offset in ranges]
+    test = plan.tests[5]
+    outcomes = sum((partial[5] for partial in partials), [])
+    self.assertEqual(test.fold_outcomes(outcomes),
+                     test.evaluate(self.config, self.config.tree(NATIVE)))
+    text = shard.text_shard(plan, lines[:10], needed)
+    self.assertEqual(text[0], True)
+    self.assertEqual(text[2], (1, 0))
+    self.assertNotIn(5, text)
+
+  def test_bytes_mode_matches_serial_run(self):
+    plan = self.plan()
+    expected = list(plan.results(self.config))
+    binary = ConfigFile().from_bytes(sharding_config().encode('utf-8'))
+    results = list(shard.sharded_results(plan, binary, 3, min_lines=1))
+    self.assertEqual(results, expected)
+
+  @patch('multiprocessing.Pool')
+  def test_small_config_is_not_split(self, mock_pool):
+    plan = self.plan()
+    results = list(shard.sharded_results(plan, self.config, 4))
+    self.assertFalse(mock_pool.called)
+    self.assertEqual(results, list(plan.results(self.config)))
+
+  def test_cached_results_not_evaluated(self):
+    plan = self.plan()
+    result_cache = cache.ResultCache(':memory:')
+    expected = list(shard.sharded_results(plan, self.config, 2, result_cache,
+                                          min_lines=1))
+    self.assertEqual(result_cache.counts, (0, len(plan.tests), 0))
+    with patch('multiprocessing.Pool') as mock_pool:
+      results = list(shard.sharded_results(plan, self.config, 2,
+                                           result_cache, min_lines=1))
+    self.assertFalse(mock_pool.called)
+    self.assertEqual(results, expected)
+    self.assertEqual(result_cache.hits, len(plan.tests))
+    result_cache.close()
+
+  def test_memo_with_shards(self):
+    plan = self.plan()
+    expected = list(plan.results(self.config))
+    section_memo = memo.SectionMemo()
+    for _ in range(2):
+      results = list(shard.sharded_results(plan, self.config, 3, min_lines=1,
+                                           memo=section_memo))
+      self.assertEqual(results, expected)
+    self.assertTrue(section_memo.misses > 0)
+    self.assertEqual(section_memo.hits, section_memo.misses)
+
+  def test_budgeted_tests_reuse_tree(self):
+    plan = self.plan()
+    expected = list(plan.results(self.config))
+    budgeted = [test for test in plan.tests if test.is_hierarchical]
+    for test in budgeted:
+      test.budget = 5
+    with patch('netaudit.audit.parse_contents') as mock_parse:
+      results = list(shard.sharded_results(plan, self.config, 3,
+                                           min_lines=1))
+    self.assertFalse(mock_parse.called)
+    self.assertEqual(results, expected)
+
+  def test_audit_tests_shards(self):
+    suite = audit.AuditTests(self.config, self.tests, 'Shard', shards=3)
+    with patch('netaudit.shard.sharded_results',
+               return_value=iter([])) as mock_results:
+      suite.run()
+      self.assertEqual(mock_results.call_args[0][1:], (self.config, 3, None))
+      self.assertIsNone(mock_results.call_args[1]['memo'])
+      audit.AuditTests(self.config, self.tests, 'Shard', shards=1).run()
+      self.assertEqual(mock_results.call_count, 1)
+
+  def test_audit_tests_small_config(self):
+    serial = audit.AuditTests(self.config, self.tests, 'Shard')
+    serial.run()
+    suite = audit.AuditTests(self.config, self.tests, 'Shard', shards=4)
+    suite.run()
+    self.assertEqual(suite.last_results, serial.last_results)
+
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,169 @@
+'''Unit tests for store'''
+
+import os
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+from mock import patch
+
+from netaudit import store
+from netaudit import exceptions as E
+from netaudit.audit import TestResult
+from netaudit.fleet import AuditResult
+
+
+def device_results(index):
+  '''Returns results of generated device index'''
+  return [
+    TestResult('ssh', index % 3 != 0, None),
+    TestResult('uplink', index % 2 == 0,
+               None if index % 2 == 0 else 'Match failed, line 5.\n'),
+    TestResult('ntp', True, None),
+    ]
+
+
+
+class ResultStoreTests(unittest.TestCase):
+  '''
+  Tests for ResultStore
+  '''
+  def setUp(self):
+    self.store = store.ResultStore()
+    for index in range(20):
+      self.store.add('sw%d' % index, device_results(index))
+
+  def test_results_round_trip(self):
+    self.assertEqual(len(self.store), 20)
+    for index in (0, 1, 7, 19):
+      self.assertEqual(self.store.device_results('sw%d' % index),
+                       device_results(index))
+    self.assertIsNone(self.store.result('sw1', 'missing'))
+    self.assertIsNone(self.store.result('missing', 'ssh'))
+
+  def test_messages_interned(self):
+    self.assertEqual(self.store.messages, ['Match failed, line 5.\n'])
+
+  def test_counts_and_pass_rates(self):
+    self.assertEqual(self.store.counts('ssh'), (20, 13))
+    self.assertEqual(self.store.pass_rate('uplink'), 0.5)
+    self.assertEqual(list(self.store.pass_rates().items()),
+                     [('ssh', 0.65), ('uplink', 0.5), ('ntp', 1.0)])
+    self.assertRaises(KeyError, self.store.counts, 'missing')
+
+  def test_failing_devices(self):
+    self.assertEqual(self.store.failing_devices('ssh'),
+                     ['sw%d' % index for index in range(0, 20, 3)])
+    self.assertEqual(self.store.failing_devices('ntp'), [])
+
+  def test_replacing_device_results(self):
+    self.store.add('sw3', [TestResult('ssh', True, None)])
+    self.assertEqual(self.store.device_results('sw3'),
+                     [TestResult('ssh', True, None)])
+    self.assertNotIn('sw3', self.store.failing_devices('uplink'))
+    self.assertEqual(self.store.counts('uplink'), (19, 10))
+
+  def test_tests_evaluated_on_some_devices(self):
+    self.store.add('new', [TestResult('extra', False, 'Missing.\n')])
+    self.assertEqual(self.store.counts('extra'), (1, 0))
+    self.assertEqual(self.store.counts('ssh'), (20, 13))
+    self.assertEqual(self.store.failing_devices('extra'), ['new'])
+
+  def test_group_summaries(self):
+    summaries = self.store.group_summaries({
+      'Basic': ['ntp'], 'Secure': ['ssh', 'uplink', 'ssh', 'unknown']})
+    self.assertEqual(summaries[0], store.GroupSummary('Basic', 20, 20, 0,
+                                                      1.0, 0))
+    # Devices divisible by 2 but not by 3 pass both tests
+    self.assertEqual(summaries[1], store.GroupSummary('Secure', 20, 6, 14,
+                                                      23 / 40.0, 0))
+
+  def test_errored_results_are_not_failures(self):
+    budget = 'Regex budget of 10s exceeded, test not evaluated.\n'
+    self.store.add('sw1', [TestResult('ssh', True, None),
+                           TestResult('uplink', None, budget)])
+    self.store.add('new', [TestResult('uplink', None, budget)])
+    self.assertEqual(self.store.result('sw1', 'uplink'),
+                     TestResult('uplink', None, budget))
+    self.assertEqual(self.store.counts('uplink'), (19, 10))
+    self.assertEqual(self.store.pass_rate('uplink'), 10 / 19.0)
+    self.assertNotIn('sw1', self.store.failing_devices('uplink'))
+    self.assertEqual(self.store.errored_devices('uplink'), ['sw1', 'new'])
+    self.assertEqual(self.store.errored_devices('ssh'), [])
+    summary = self.store.group_summary('Secure', ['ssh', 'uplink'])
+    self.assertEqual(summary, store.GroupSummary('Secure', 21, 6, 13,
+                                                 23 / 39.0, 2))
+    self.store.add('sw1', [TestResult('uplink', False, None)])
+    self.assertEqual(self.store.errored_devices('uplink'), ['new'])
+    self.assertIn('sw1', self.store.failing_devices('uplink'))
+
+  def test_add_audit(self):
+    self.store.add_audit(AuditResult('sw0', [TestResult('ssh', True, None)]))
+    self.assertEqual(self.store.result('sw0', 'ssh').result, True)
+
+
+
+class ResultStoreFileTests(unittest.TestCase):
+  '''
+  Tests for saving and loading ResultStore
+  '''
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.file_name = os.path.join(self.directory, 'results.store')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_save_and_load(self):
+    saved = store.ResultStore()
+    for index in range(50):
+      saved.add('sw%d' % index, device_results(index))
+    saved.add('sw49', device_results(49)[:2] + [TestResult('ntp', None,
+                                                           'Budget.\n')])
+    saved.save(self.file_name)
+    loaded = store.ResultStore.load(self.file_name)
+    self.assertEqual(loaded.devices, saved.devices)
+    for index in range(49):
+      self.assertEqual(loaded.device_results('sw%d' % index),
+                       device_results(index))
+    self.assertEqual(loaded.device_results('sw49'),
+                     saved.device_results('sw49'))
+    self.assertEqual(loaded.errored_devices('ntp'), ['sw49'])
+    self.assertEqual(loaded.pass_rates(), saved.pass_rates())
+    loaded.add('sw50', device_results(50))
+    self.assertEqual(loaded.counts('ntp'), (50, 50))
+    self.assertEqual(os.listdir(self.directory), ['results.store'])
+
+  def test_load_rejects_other_versions(self):
+    with gzip.GzipFile(self.file_name, 'wb') as file_stream:
+      file_stream.write(b'{"version": 0}')
+    self.assertRaises(E.InvalidResultStoreError, store.ResultStore.load,
+                      self.file_name)
+
+  def test_load_version_without_errored_results(self):
+    saved = store.ResultStore()
+    saved.add('sw0', device_results(0))
+    saved.save(self.file_name)
+    with gzip.GzipFile(self.file_name, 'rb') as file_stream:
+      entry = json.loads(file_stream.read().decode('utf-8'))
+    entry['version'] = 1
+    del entry['errored']
+    with gzip.GzipFile(self.file_name, 'wb') as file_stream:
+      file_stream.write(json.dumps(entry).encode('utf-8'))
+    loaded = store.ResultStore.load(self.file_name)
+    self.assertEqual(loaded.device_results('sw0'), device_results(0))
+    self.assertEqual(loaded.errored_devices('ssh'), [])
+
+  def test_failed_save_keeps_file(self):
+    saved = store.ResultStore()
+    saved.add('sw0', device_results(0))
+    saved.save(self.file_name)
+    with patch('os.rename', side_effect=OSError):
+      self.assertRaises(OSError, saved.save, self.file_name)
+    self.assertEqual(os.listdir(self.directory), ['results.store'])
+
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,178 @@
+'''Unit and conformance tests for tree'''
+
+import os
+import unittest
+
+from ciscoconfparse import CiscoConfParse
+
+import tests.common as C
+from netaudit import audit
+from netaudit import tree
+from netaudit.config import ConfigFile, LINE_SPLIT_RE, NATIVE, CISCOCONFPARSE
+from netaudit.config import ciscoconfparse_supported
+
+SAMPLE_DIR = os.path.join(os.path.dirname(__file__), '..', 'sample')
+
+# The native engine follows the CiscoConfParse releases in
+# netaudit.config.CISCOCONFPARSE_VERSIONS only
+SUPPORTED_ONLY = unittest.skipUnless(
+  ciscoconfparse_supported(),
+  'installed CiscoConfParse is not a release the native engine follows')
+
+# Configuration exercising comments, blank lines, uneven indentation and
+# banners, where the hierarchy rules are least obvious
+TRICKY_CONFIG = '''!
+hostname Tricky
+
+interface GigabitEthernet0/1
+ description uplink
+  ! nested comment
+   deeply indented
+ !
+ shutdown
+
+!
+ orphan under comment
+interface GigabitEthernet0/2
+   ip address 10.0.0.1 255.255.255.0
+  ! comment after deeper line
+ no shutdown
+banner motd ^C
+Authorized access only
+ indented banner text
+^C
+banner exec #Single line#
+router ospf 1
+ network 10.0.0.0 0.0.0.255 area 0
+  ! area comment
+ passive-interface default
+ no passive-interface GigabitEthernet0/1
+!
+line vty 0 4
+ login local
+   transport input ssh
+end
+'''
+
+
+def read_sample(name):
+  '''Returns contents of a file in sample/'''
+  with open(os.path.join(SAMPLE_DIR, name)) as file_stream:
+    return file_stream.read()
+
+
+
+class ConfigTreeTests(unittest.TestCase):
+  '''
+  Tests for ConfigTree
+  '''
+  def test_children(self):
+    config_tree = tree.ConfigTree(['interface A', ' shutdown', 'end'])
+    parent = config_tree.find_objects('^interface')[0]
+    self.assertEqual([child.text for child in parent.children], [' shutdown'])
+    self.assertIs(parent.children[0].parent, parent)
+
+  def test_blank_lines_not_numbered(self):
+    config_tree = tree.ConfigTree(['a', '', 'b'])
+    self.assertEqual([node.linenum for node in config_tree.nodes], [0, 1])
+
+  def test_re_match_iter_typed_default(self):
+    config_tree = tree.ConfigTree(['interface A', ' shutdown'])
+    parent = config_tree.nodes[0]
+    self.assertEqual(parent.re_match_iter_typed('(speed)', default=None),
+                     'None')
+
+  def test_re_search_children(self):
+    config_tree = tree.ConfigTree(['interface A', ' shutdown', ' speed 100'])
+    children = config_tree.nodes[0].re_search_children('speed')
+    self.assertEqual([child.linenum for child in children], [2])
+
+  def test_leaf_has_no_child_list(self):
+    config_tree = tree.ConfigTree(['hostname A'])
+    self.assertIsNone(config_tree.nodes[0]._children)
+    self.assertEqual(config_tree.nodes[0].children, [])
+
+
+
+class ConformanceTests(unittest.TestCase):
+  '''
+  Checks that the native engine builds the same hierarchy and test results
+  as CiscoConfParse
+  '''
+  CONFIGS = {
+    'sample': C.SAMPLE_CONFIG,
+    'tricky': TRICKY_CONFIG,
+    'crlf': TRICKY_CONFIG.replace('\n', '\r\n'),
+    'config.txt': read_sample('config.txt'),
+    'catalyst3750_1.txt': read_sample('catalyst3750_1.txt'),
+    }
+
+  PATTERNS = [
+    (['interface GigabitEthernet1/0/28', '(shutdown)'], 'shutdown'),
+    (['interface GigabitEthernet1/0/27', '(shutdown)'], 'shutdown'),
+    (['interface GigabitEthernet1/0/1$', 'Child Configuration',
+      'Grandchild (Configuration)'], 'Configuration'),
+    (['interface GigabitEthernet1/0/[1-9]$', 'switchport mode (access)'],
+     'access'),
+    (['^interface', '(shutdown)'], 'shutdown'),
+    (['^interface', 'description (\\S+)'], 'uplink'),
+    (['interface GigabitEthernet0/1', 'description', '(.*)'], 'x'),
+    (['^interface', '(!.*)'], '! nested comment'),
+    (['^banner motd', '(Authorized)'], 'Authorized'),
+    (['^banner motd', '(.*)'], 'None'),
+    (['^router ospf', 'network', '(!.*)'], '! area comment'),
+    (['^router ospf', '(passive-interface) default'], 'passive-interface'),
+    (['^line vty', 'login (local)'], 'local'),
+    (['^line vty', 'login', '(transport)'], 'transport'),
+    (['orphan', '(.*)'], 'x'),
+    (['^ *!', '(.*)'], 'x'),
+    (['description', '(.*)'], 'x'),
+    ]
+
+  def assert_same_tree(self, name, contents):
+    lines = LINE_SPLIT_RE.split(contents)
+    expected = CiscoConfParse(lines).ConfigObjs
+    actual = tree.ConfigTree(lines).nodes
+    self.assertEqual(len(actual), len(expected), name)
+    for node, obj in zip(actual, expected):
+      self.assertEqual((node.linenum, node.text), (obj.linenum, obj.text))
+      self.assertEqual([child.linenum for child in node.children],
+                       [child.linenum for child in obj.children],
+                       '%s: children of %r' % (name, obj.text))
+
+  @SUPPORTED_ONLY
+  def test_same_tree(self):
+    for name, contents in self.CONFIGS.items():
+      self.assert_same_tree(name, contents)
+
+  @SUPPORTED_ONLY
+  def test_same_results(self):
+    for name, contents in self.CONFIGS.items():
+      config = ConfigFile().from_string(contents)
+      for pattern, expected in self.PATTERNS:
+        case = audit.TestCase('test', pattern=pattern, expected=expected)
+        self.assertEqual(case.evaluate(config, config.tree(NATIVE)),
+                         case.evaluate(config, config.tree(CISCOCONFPARSE)),
+                         '%s: %r' % (name, pattern))
+
+  def test_plan_uses_native_engine(self):
+    test_file = audit.TestFile()
+    test_file.from_string(C.FLEET_TEST_FILE)
+    config = ConfigFile().from_string(C.SAMPLE_CONFIG)
+    expected = list(test_file.compile_plan('Fleet').results(config))
+    test_file.config_engine = NATIVE
+    plan = test_file.compile_plan('Fleet')
+    self.assertEqual(plan.engine, NATIVE)
+    self.assertEqual(list(plan.results(config)), expected)
+    self.assertEqual(list(config._trees), [CISCOCONFPARSE, NATIVE])
+
+  def test_invalid_engine_raises(self):
+    test_file = audit.TestFile()
+    test_file.from_string(C.FLEET_TEST_FILE)
+    test_file.config_engine = 'unknown'
+    self.assertRaises(ValueError, test_file.compile_plan, 'Fleet')
+
+
+
+if __name__ == '__main__':
+  unittest.main()
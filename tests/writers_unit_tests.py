@@ -0,0 +1,103 @@
+'''Unit tests for writers'''
+
+import csv
+import json
+import unittest
+from io import StringIO, BytesIO
+from xml.etree import ElementTree
+
+from netaudit import writers
+from netaudit.audit import TestResult
+from netaudit.fleet import AuditResult
+
+RESULTS = [
+  AuditResult('sw1.cfg', [TestResult('ssh', True, None),
+                          TestResult('uplink', False,
+                                     'Match failed, line 3 <&>.\n')]),
+  AuditResult('sw2.cfg', [TestResult('ssh', True, None)]),
+  ]
+
+
+def text_stream():
+  '''Returns in-memory stream for str on both Python 2 and 3'''
+  return BytesIO() if str is bytes else StringIO()
+
+
+
+class WriterTests(unittest.TestCase):
+  '''
+  Tests for result writers
+  '''
+  def write(self, writer_class):
+    stream = text_stream()
+    with writer_class(stream) as writer:
+      for audit_result in RESULTS:
+        writer.write_audit(audit_result)
+    return stream.getvalue()
+
+  def test_text(self):
+    self.assertEqual(self.write(writers.TextWriter),
+                     'sw1.cfg: ssh: OK\nsw1.cfg: uplink: FAIL\n'
+                     'sw2.cfg: ssh: OK\n')
+
+  def test_json_lines(self):
+    lines = self.write(writers.JsonLinesWriter).splitlines()
+    self.assertEqual(len(lines), 3)
+    self.assertEqual(json.loads(lines[1]), {
+      'source': 'sw1.cfg', 'test': 'uplink', 'result': False,
+      'message': 'Match failed, line 3 <&>.\n'})
+
+  def test_csv(self):
+    rows = list(csv.reader(text_stream().__class__(
+      self.write(writers.CsvWriter))))
+    self.assertEqual(rows[0], ['source', 'test', 'result', 'message'])
+    self.assertEqual(rows[2], ['sw1.cfg', 'uplink', 'FAIL',
+                               'Match failed, line 3 <&>.\n'])
+    self.assertEqual(len(rows), 4)
+
+  def test_junit(self):
+    root = ElementTree.fromstring(self.write(writers.JUnitWriter))
+    suites = root.findall('testsuite')
+    self.assertEqual([(suite.get('name'), suite.get('tests'),
+                       suite.get('failures')) for suite in suites],
+                     [('sw1.cfg', '2', '1'), ('sw2.cfg', '1', '0')])
+    failure = suites[0].findall('testcase')[1].find('failure')
+    self.assertEqual(failure.text, 'Match failed, line 3 <&>.\n')
+
+  def test_errored_results(self):
+    errored = AuditResult('sw3.cfg', [TestResult('acl', None, 'Budget.\n')])
+    stream = text_stream()
+    writers.TextWriter(stream).write_audit(errored)
+    self.assertEqual(stream.getvalue(), 'sw3.cfg: acl: ERROR\n')
+    stream = text_stream()
+    writers.JsonLinesWriter(stream).write_audit(errored)
+    self.assertIsNone(json.loads(stream.getvalue())['result'])
+    stream = text_stream()
+    with writers.JUnitWriter(stream) as writer:
+      writer.write_audit(errored)
+    suite = ElementTree.fromstring(stream.getvalue()).find('testsuite')
+    self.assertEqual((suite.get('failures'), suite.get('errors')), ('0', '1'))
+    self.assertEqual(suite.find('testcase').find('error').text, 'Budget.\n')
+
+  def test_junit_writes_suite_when_configuration_is_done(self):
+    stream = text_stream()
+    writer = writers.JUnitWriter(stream)
+    writer.write_results('sw1.cfg', iter(RESULTS[0].results))
+    self.assertIn('</testsuite>', stream.getvalue())
+    self.assertNotIn('</testsuites>', stream.getvalue())
+
+  def test_write_results_consumes_lazily(self):
+    stream = text_stream()
+    writer = writers.TextWriter(stream)
+    seen = []
+    def results():
+      for result in RESULTS[0].results:
+        seen.append(stream.getvalue().count('\n'))
+        yield result
+    writer.write_results('sw1.cfg', results())
+    self.assertEqual(seen, [0, 1])
+
+
+
+if __name__ == '__main__':
+  unittest.main()